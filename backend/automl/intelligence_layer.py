@@ -9,7 +9,8 @@ import json
 from .llm_orchestrator import llm_orchestrator, FinancialAnalysisOutput, ModelExplanationOutput
 from .automl_pipeline import automl_pipeline
 from .document_indexing import model_indexer, financial_kb
-from credit_analysis.risk_models import credit_risk_model
+from credit_analysis.risk_models import credit_risk_model, CreditScoreCalculator
+from credit_analysis.prediction_batcher import prediction_batcher
 from credit_analysis.financial_ratios import financial_ratios_engine
 
 class NeoCredIntelligenceLayer:
@@ -24,7 +25,7 @@ class NeoCredIntelligenceLayer:
         """Comprehensive credit analysis using AI"""
         
         # Step 1: Traditional ML prediction
-        ml_prediction = self._get_ml_prediction(financial_data)
+        ml_prediction = await self._get_ml_prediction(financial_data)
         
         # Step 2: LLM explanation and insights
         llm_explanation = await self._get_llm_explanation(financial_data, ml_prediction)
@@ -48,7 +49,7 @@ class NeoCredIntelligenceLayer:
         
         return comprehensive_analysis
     
-    def _get_ml_prediction(self, financial_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _get_ml_prediction(self, financial_data: Dict[str, Any]) -> Dict[str, Any]:
         """Get ML model prediction"""
         try:
             # Convert to DataFrame
@@ -56,12 +57,11 @@ class NeoCredIntelligenceLayer:
             
             # Get prediction from credit risk model
             if credit_risk_model.is_trained:
-                default_prob = credit_risk_model.predict_default_probability(df)[0]
+                default_prob = await prediction_batcher.predict(financial_data)
                 risk_factors = credit_risk_model.get_risk_factors(df)
                 
-                # Calculate credit score
-                credit_score = 850 - (default_prob * 550)
-                credit_score = max(300, min(850, int(credit_score)))
+                # Calculate credit score (calibrated table of the loaded model)
+                credit_score = CreditScoreCalculator.probability_to_score(default_prob, credit_risk_model.score_table)
                 
                 return {
                     "credit_score": credit_score,
@@ -0,0 +1,191 @@
+"""Content-addressed Cache for Document Analysis Results"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
+from .document_nlp import ANALYZER_VERSION
+
+logger = logging.getLogger(__name__)
+
+def document_cache_key(content_sha256: str, document_type: str) -> str:
+    """Key for an upload: content hash, requested type and analyzer version"""
+    return hashlib.sha256(f"{content_sha256}:{document_type}:{ANALYZER_VERSION}".encode()).hexdigest()
+
+class DiskResultCache:
+    """JSON files on local disk with TTL and size-bounded LRU eviction
+
+    Hits touch the file's mtime, so eviction removes the least recently
+    used entries first. Shared by all workers on the host.
+
+    Results contain the extracted document text (PII) in plaintext, so the
+    directory is kept 0700 and entries 0600, readable by the service user only.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._estimated_bytes: Optional[int] = None
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # makedirs honours the umask and leaves an existing directory as it is
+        os.chmod(directory, 0o700)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return entry["result"]
+
+    def set(self, key: str, result: Dict[str, Any]):
+        payload = json.dumps({"created_at": time.time(), "result": result}, default=str)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as file:
+            file.write(payload)
+        os.replace(tmp_path, path)
+
+        if self._estimated_bytes is None:
+            self._estimated_bytes = self._scan()[0]
+        else:
+            self._estimated_bytes += len(payload)
+        if self._estimated_bytes > self.max_bytes:
+            self.evict()
+
+    def _scan(self) -> Tuple[int, list]:
+        """Total size and (mtime, size, path) of every entry"""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sum(size for _, size, _ in entries), entries
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones down to 90% of the limit"""
+        total, entries = self._scan()
+        cutoff = time.time() - self.ttl_seconds
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes * 0.9 and mtime >= cutoff:
+                break
+            self._remove(path)
+            total -= size
+        self._estimated_bytes = total
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+class DocumentResultCache:
+    """Two-tier result cache: local disk first, then Redis shared across hosts
+
+    Redis entries expire by TTL; size there is bounded by the server's
+    maxmemory policy (allkeys-lru). Cache failures never fail an analysis.
+    Redis entries are stored unencrypted: use a private, authenticated
+    instance (TLS across hosts).
+    """
+
+    def __init__(self, disk: DiskResultCache, redis_client=None, ttl_seconds: int = 7 * 86400,
+                 prefix: str = "doc_analysis:"):
+        self.disk = disk
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.metrics = {"hits_disk": 0, "hits_redis": 0, "misses": 0}
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.disk.get, key)
+        if result is not None:
+            self.metrics["hits_disk"] += 1
+            return result
+
+        if self.redis is not None:
+            try:
+                value = await self.redis.get(f"{self.prefix}{key}")
+            except Exception as e:
+                logger.warning(f"Document cache Redis get failed: {e}")
+                value = None
+            if value:
+                result = json.loads(value)
+                try:
+                    await loop.run_in_executor(None, self.disk.set, key, result)
+                except OSError as e:
+                    logger.warning(f"Document cache disk write failed: {e}")
+                self.metrics["hits_redis"] += 1
+                return result
+
+        self.metrics["misses"] += 1
+        return None
+
+    async def set(self, key: str, result: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.disk.set, key, result)
+        except OSError as e:
+            logger.warning(f"Document cache disk write failed: {e}")
+
+        if self.redis is not None:
+            try:
+                await self.redis.setex(f"{self.prefix}{key}", self.ttl_seconds, json.dumps(result, default=str))
+            except Exception as e:
+                logger.warning(f"Document cache Redis set failed: {e}")
+
+    async def get_or_compute(self, content_sha256: str, document_type: str,
+                             compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """Cached result for this content, or compute and store it; returns (result, cached)"""
+        key = document_cache_key(content_sha256, document_type)
+        result = await self.get(key)
+        if result is not None:
+            return result, True
+
+        # Extraction errors raise out of compute(), so they are never cached
+        result = await compute()
+        await self.set(key, result)
+        return result, False
+
+def _create_document_cache() -> DocumentResultCache:
+    """Build the global cache; Redis tier is used when DOCUMENT_CACHE_BACKEND=redis"""
+    ttl_seconds = int(os.getenv("DOCUMENT_CACHE_TTL_SECONDS", str(7 * 86400)))
+    disk = DiskResultCache(
+        os.getenv("DOCUMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "neocred-document-cache")),
+        max_bytes=int(os.getenv("DOCUMENT_CACHE_MAX_MB", "512")) * 1024 * 1024,
+        ttl_seconds=ttl_seconds
+    )
+
+    redis_client = None
+    if os.getenv("DOCUMENT_CACHE_BACKEND", "disk").lower() == "redis":
+        try:
+            import redis.asyncio as redis
+            redis_client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True)
+        except ImportError:
+            logger.warning("redis not installed, document cache kept on local disk only")
+
+    return DocumentResultCache(disk, redis_client, ttl_seconds)
+
+# Global document result cache
+document_result_cache = _create_document_cache()
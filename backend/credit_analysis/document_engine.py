@@ -0,0 +1,127 @@
+"""Page-parallel Document Extraction in a Process Pool"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import PyPDF2
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from .document_nlp import DocumentOCR, FinancialDocumentAnalyzer, document_analyzer
+
+logger = logging.getLogger(__name__)
+
+class DocumentExtractionError(Exception):
+    """Text could not be extracted from a document (unreadable file, crashed pool)"""
+
+_worker_ocr: Optional[DocumentOCR] = None
+_worker_pdf: Tuple[Optional[Tuple[str, float]], Any] = (None, None)
+
+def _get_worker_ocr() -> DocumentOCR:
+    """One OCR helper per pool process"""
+    global _worker_ocr
+    if _worker_ocr is None:
+        _worker_ocr = DocumentOCR()
+    return _worker_ocr
+
+def _get_worker_pdf(file_path: str):
+    """Parse each PDF once per pool process, not once per page group"""
+    global _worker_pdf
+    key = (file_path, os.path.getmtime(file_path))
+    if _worker_pdf[0] != key:
+        _worker_pdf = (key, PyPDF2.PdfReader(file_path))
+    return _worker_pdf[1]
+
+def _extract_pdf_pages(file_path: str, page_numbers: List[int]) -> List[str]:
+    return _get_worker_ocr().extract_pdf_pages(file_path, page_numbers, _get_worker_pdf(file_path))
+
+def _extract_image_frames(file_path: str, frame_numbers: List[int]) -> List[str]:
+    return _get_worker_ocr().extract_image_frames(file_path, frame_numbers)
+
+class DocumentEngine:
+    """Split documents into pages and extract them in parallel, off the event loop
+
+    PDF pages (text layer, or OCR of the embedded scan when there is none)
+    and frames of multi-page images are extracted in a process pool, one
+    task per page group, and joined back in page order. Text analysis
+    (regexes and NER) then runs in a thread, so the event loop only ever
+    awaits.
+    """
+
+    def __init__(self, analyzer: FinancialDocumentAnalyzer, max_workers: Optional[int] = None,
+                 pdf_pages_per_task: int = 2):
+        self.analyzer = analyzer
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.pdf_pages_per_task = max(1, pdf_pages_per_task)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned workers do not inherit the server's threads, event loop or locks
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def plan_tasks(self, file_path: str) -> List[Tuple[Callable, List[int]]]:
+        """Page groups to extract, in document order"""
+        pages = self.analyzer.ocr.count_pages(file_path)
+        if file_path.lower().endswith('.pdf'):
+            size = self.pdf_pages_per_task
+            return [(_extract_pdf_pages, list(range(start, min(start + size, pages))))
+                    for start in range(0, pages, size)]
+        # Single images too: extract_text_from_image would hide OCR failures in the text
+        return [(_extract_image_frames, [frame]) for frame in range(pages)]
+
+    async def extract_text(self, file_path: str,
+                           on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """Extract all pages in parallel and join them in order
+
+        ``on_progress(pages_done, pages_total)`` is called as page groups
+        finish. Raises ``DocumentExtractionError`` when extraction fails.
+        """
+        loop = asyncio.get_running_loop()
+        error_prefix = "PDF Error" if file_path.lower().endswith('.pdf') else "OCR Error"
+        try:
+            tasks = await loop.run_in_executor(None, self.plan_tasks, file_path)
+            pool = self._get_pool()
+            pages_total = sum(len(pages) for _, pages in tasks)
+            pages_done = 0
+
+            async def run(extract: Callable, pages: List[int]) -> List[str]:
+                nonlocal pages_done
+                texts = await loop.run_in_executor(pool, extract, file_path, pages)
+                pages_done += len(pages)
+                if on_progress is not None:
+                    on_progress(pages_done, pages_total)
+                return texts
+
+            chunks = await asyncio.gather(*(run(extract, pages) for extract, pages in tasks))
+        except BrokenProcessPool as e:
+            logger.error(f"Document pool crashed, recreating: {e}")
+            self._pool = None
+            raise DocumentExtractionError(f"{error_prefix}: {str(e)}") from e
+        except Exception as e:
+            raise DocumentExtractionError(f"{error_prefix}: {str(e)}") from e
+
+        return "\n".join(text for chunk in chunks for text in chunk).strip()
+
+    async def process_document(self, file_path: str, document_type: str = 'auto',
+                               on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Async equivalent of ``FinancialDocumentAnalyzer.process_document``"""
+        text = await self.extract_text(file_path, on_progress)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.analyzer.analyze_text, text, document_type)
+
+    def close(self):
+        """Shut down the process pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+# Global document engine
+document_engine = DocumentEngine(
+    document_analyzer,
+    max_workers=int(os.getenv("DOCUMENT_POOL_WORKERS", "0")) or None,
+    pdf_pages_per_task=int(os.getenv("DOCUMENT_PDF_PAGES_PER_TASK", "2"))
+)
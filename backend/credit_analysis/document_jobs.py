@@ -0,0 +1,268 @@
+"""Background Document-analysis Jobs with Progress Tracking"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, AsyncGenerator, List, Optional, Tuple
+from .document_cache import DocumentResultCache, document_result_cache
+from .document_engine import DocumentEngine, document_engine
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+TERMINAL_STATUSES = ("completed", "failed")
+
+class UploadTooLarge(Exception):
+    """Upload exceeded the configured size limit"""
+
+class DocumentJobManager:
+    """Queue document analyses and run them in background tasks
+
+    Job state lives in one JSON file per job under ``job_dir`` (written
+    atomically), so any worker process on the host can report progress
+    or return the result for a job another worker is running.
+
+    Unfinished jobs record the owning worker's PID and a heartbeat,
+    refreshed every ``heartbeat_interval`` seconds. A job whose owner has
+    exited, or whose heartbeat is older than ``stale_after``, is reported
+    as failed; ``close()`` fails the jobs the worker still holds.
+    """
+
+    def __init__(self, engine: DocumentEngine, cache: DocumentResultCache, job_dir: str, concurrency: int = 2,
+                 ttl_seconds: int = 3600, max_upload_bytes: int = 50 * 1024 * 1024,
+                 heartbeat_interval: float = 10.0, stale_after: float = 60.0):
+        self.engine = engine
+        self.cache = cache
+        self.job_dir = job_dir
+        self.concurrency = concurrency
+        self.ttl_seconds = ttl_seconds
+        self.max_upload_bytes = max_upload_bytes
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self._active: Dict[str, Dict[str, Any]] = {}  # job_id -> state of unfinished jobs owned here
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Job state holds extracted document text, so keep it private to this user
+        os.makedirs(self.job_dir, mode=0o700, exist_ok=True)
+        os.chmod(self.job_dir, 0o700)
+
+    def _state_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def _write_state(self, state: Dict[str, Any]):
+        state["updated_at"] = datetime.now().isoformat()
+        self._save(state)
+
+    def _save(self, state: Dict[str, Any]):
+        state["heartbeat_at"] = time.time()
+        path = self._state_path(state["job_id"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as file:
+            json.dump(state, file, default=str)
+        os.replace(tmp_path, path)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current job state (with the result once completed), or None"""
+        # Job IDs are hex UUIDs; anything else never maps to a file
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._state_path(job_id)) as file:
+                state = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if state["status"] not in TERMINAL_STATUSES and job_id not in self._active and self._is_orphaned(state):
+            self._fail(state, "Worker running the job stopped")
+        return state
+
+    def _is_orphaned(self, state: Dict[str, Any]) -> bool:
+        """Owner process gone, or no heartbeat for ``stale_after`` seconds"""
+        if time.time() - state.get("heartbeat_at", 0) > self.stale_after:
+            return True
+        try:
+            os.kill(state["worker_pid"], 0)
+        except ProcessLookupError:
+            return True
+        except (KeyError, PermissionError):
+            pass
+        return False
+
+    def _fail(self, state: Dict[str, Any], error: str):
+        state["status"] = "failed"
+        state["error"] = error
+        self._active.pop(state["job_id"], None)
+        self._write_state(state)
+
+    async def save_upload(self, upload, suffix: str = "") -> Tuple[str, str]:
+        """Stream an UploadFile to disk in chunks, never holding it in memory
+
+        Returns the file path and the SHA-256 of its content.
+        """
+        loop = asyncio.get_running_loop()
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.job_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as file:
+                while True:
+                    chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise UploadTooLarge(f"Upload exceeds {self.max_upload_bytes // (1024 * 1024)} MB")
+                    digest.update(chunk)
+                    await loop.run_in_executor(None, file.write, chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path, digest.hexdigest()
+
+    def _ensure_workers(self):
+        """Start the worker tasks on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._workers = []
+            self._heartbeat_task = None
+        # Replace only the workers that died; jobs already queued are picked up by the new ones
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(loop.create_task(self._run()))
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = loop.create_task(self._heartbeat())
+
+    async def submit(self, file_path: str, filename: str, document_type: str, owner: str,
+                     content_sha256: str) -> Dict[str, Any]:
+        """Register a job for an uploaded file and queue it"""
+        self._ensure_workers()
+        self.cleanup_expired()
+
+        state = {
+            "job_id": uuid.uuid4().hex,
+            "owner": owner,
+            "filename": filename,
+            "document_type": document_type,
+            "content_sha256": content_sha256,
+            "status": "queued",
+            "progress": 0,
+            "pages_done": 0,
+            "pages_total": None,
+            "cached": False,
+            "worker_pid": os.getpid(),
+            "created_at": datetime.now().isoformat()
+        }
+        self._active[state["job_id"]] = state
+        self._write_state(state)
+        await self._queue.put((state, file_path))
+        return state
+
+    async def _run(self):
+        """Worker loop: one job at a time per worker task"""
+        while True:
+            state, file_path = await self._queue.get()
+            try:
+                await self._process(state, file_path)
+            finally:
+                if os.path.exists(file_path):
+                    os.unlink(file_path)
+
+    async def _process(self, state: Dict[str, Any], file_path: str):
+        def on_progress(pages_done: int, pages_total: int):
+            state["pages_done"] = pages_done
+            state["pages_total"] = pages_total
+            # Extraction is the bulk of the work; the last 10% covers text analysis
+            state["progress"] = int(90 * pages_done / pages_total) if pages_total else 90
+            self._write_state(state)
+
+        try:
+            state["status"] = "processing"
+            self._write_state(state)
+            state["result"], state["cached"] = await self.cache.get_or_compute(
+                state["content_sha256"], state["document_type"],
+                lambda: self.engine.process_document(file_path, state["document_type"], on_progress)
+            )
+            state["status"] = "completed"
+            state["progress"] = 100
+            self._active.pop(state["job_id"], None)
+            self._write_state(state)
+        except Exception as e:
+            logger.error(f"Document job {state['job_id']} failed: {e}")
+            try:
+                self._fail(state, str(e))
+            except OSError as write_error:
+                logger.error(f"Could not record failure of document job {state['job_id']}: {write_error}")
+
+    async def _heartbeat(self):
+        """Refresh the heartbeat of every unfinished job this worker holds"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            for state in list(self._active.values()):
+                try:
+                    self._save(state)
+                except OSError as e:
+                    logger.warning(f"Document job heartbeat failed: {e}")
+
+    async def stream_progress(self, job_id: str, poll_interval: float = 0.25) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield a progress event whenever the job state changes, until it finishes"""
+        last_seen = None
+        while True:
+            state = self.get(job_id)
+            if state is None:
+                return
+
+            event = {
+                "calculation_id": job_id,
+                "progress": state["progress"],
+                "status": state["status"],
+                "pages_done": state["pages_done"],
+                "pages_total": state["pages_total"],
+                "timestamp": state["updated_at"]
+            }
+            if event != last_seen:
+                last_seen = event
+                yield event
+            if state["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(poll_interval)
+
+    def cleanup_expired(self):
+        """Remove job files older than the TTL (results and orphaned uploads)"""
+        cutoff = time.time() - self.ttl_seconds
+        with os.scandir(self.job_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    async def close(self):
+        """Cancel the worker tasks and fail the jobs they had not finished"""
+        tasks = self._workers + ([self._heartbeat_task] if self._heartbeat_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat_task = None
+        for state in list(self._active.values()):
+            self._fail(state, "Server shut down before the job finished")
+
+# Global document job manager
+document_job_manager = DocumentJobManager(
+    document_engine,
+    document_result_cache,
+    job_dir=os.getenv("DOCUMENT_JOB_DIR", os.path.join(tempfile.gettempdir(), "neocred-document-jobs")),
+    concurrency=int(os.getenv("DOCUMENT_JOB_CONCURRENCY", "2")),
+    ttl_seconds=int(os.getenv("DOCUMENT_JOB_TTL_SECONDS", "3600")),
+    max_upload_bytes=int(os.getenv("DOCUMENT_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+)
@@ -4,12 +4,17 @@ from PIL import Image
 import PyPDF2
 import cv2
 import numpy as np
-from transformers import pipeline, AutoTokenizer, AutoModel
-import torch
 import re
 from typing import Dict, Any, List, Optional
 import io
 import base64
+import threading
+from .model_host import PIPELINE_SPECS, RemotePipeline, resolve_pipeline
+from .entity_scanner import scan_entities, unique_organizations
+from .nlp_inference import BatchedPipeline, create_batched_pipeline
+
+# Bump whenever extraction or analysis output changes; part of the result cache key
+ANALYZER_VERSION = "1.2.1"
 
 class DocumentOCR:
     """OCR processing for document analysis"""
@@ -51,16 +56,45 @@ class DocumentOCR:
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text from PDF"""
         try:
-            text = ""
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            
-            return text.strip()
+            pages = self.extract_pdf_pages(pdf_path, range(self.count_pages(pdf_path)))
+            return "\n".join(pages).strip()
         except Exception as e:
             return f"PDF Error: {str(e)}"
     
+    def ocr_pil_image(self, image: Image.Image) -> str:
+        """Preprocess and OCR a PIL image"""
+        image_cv = cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+        processed = self.preprocess_image(image_cv)
+        return pytesseract.image_to_string(processed, lang='eng').strip()
+    
+    def count_pages(self, file_path: str) -> int:
+        """Pages in a PDF, or frames in a (multi-page) image such as a TIFF scan"""
+        if file_path.lower().endswith('.pdf'):
+            return len(PyPDF2.PdfReader(file_path).pages)
+        with Image.open(file_path) as image:
+            return getattr(image, "n_frames", 1)
+    
+    def extract_pdf_pages(self, pdf_path: str, page_numbers, pdf_reader: Optional[PyPDF2.PdfReader] = None) -> List[str]:
+        """Text of the given PDF pages; pages without a text layer are OCR'd from their embedded scans"""
+        pdf_reader = pdf_reader or PyPDF2.PdfReader(pdf_path)
+        texts = []
+        for page_number in page_numbers:
+            page = pdf_reader.pages[page_number]
+            text = page.extract_text() or ""
+            if not text.strip():
+                text = "\n".join(self.ocr_pil_image(Image.open(io.BytesIO(image.data))) for image in page.images)
+            texts.append(text)
+        return texts
+    
+    def extract_image_frames(self, image_path: str, frame_numbers) -> List[str]:
+        """OCR text of the given frames of a multi-page image"""
+        texts = []
+        with Image.open(image_path) as image:
+            for frame_number in frame_numbers:
+                image.seek(frame_number)
+                texts.append(self.ocr_pil_image(image))
+        return texts
+    
     def extract_from_base64(self, base64_data: str) -> str:
         """Extract text from base64 encoded image"""
         try:
@@ -84,57 +118,61 @@ class FinancialDocumentAnalyzer:
     
     def __init__(self):
         self.ocr = DocumentOCR()
-        # Initialize transformer models (lightweight versions)
-        try:
-            self.classifier = pipeline("text-classification", 
-                                     model="distilbert-base-uncased-finetuned-sst-2-english")
-            self.ner = pipeline("ner", model="dbmdz/bert-large-cased-finetuned-conll03-english")
-        except:
-            self.classifier = None
-            self.ner = None
+        # Transformer models are resolved on first use, from the shared
+        # model host when configured, otherwise loaded in this process
+        self._pipelines: Dict[str, Any] = {}
+        self._batched: Dict[str, Optional[BatchedPipeline]] = {}
+        self._pipelines_lock = threading.Lock()
+    
+    def _get_pipeline(self, name: str) -> Optional[Any]:
+        """Load a pipeline once per process, on first use"""
+        if name not in self._pipelines:
+            with self._pipelines_lock:
+                if name not in self._pipelines:
+                    self._pipelines[name] = resolve_pipeline(name)
+        return self._pipelines[name]
+    
+    def _get_batched(self, name: str) -> Optional[BatchedPipeline]:
+        """Pipeline behind a micro-batcher that chunks long texts by token windows"""
+        if name not in self._batched:
+            pipeline = self._get_pipeline(name)
+            with self._pipelines_lock:
+                if name not in self._batched:
+                    self._batched[name] = None if pipeline is None else create_batched_pipeline(
+                        pipeline, PIPELINE_SPECS[name][1], merge_entities=(name == "ner")
+                    )
+        return self._batched[name]
+    
+    @property
+    def classifier(self) -> Optional[BatchedPipeline]:
+        return self._get_batched("classifier")
+    
+    @property
+    def ner(self) -> Optional[BatchedPipeline]:
+        return self._get_batched("ner")
+    
+    def inference_metrics(self) -> Dict[str, Any]:
+        """Batching and throughput (chunks/sec) per loaded pipeline"""
+        return {name: batched.get_metrics() for name, batched in self._batched.items() if batched is not None}
     
-    def extract_financial_entities(self, text: str) -> Dict[str, List[str]]:
+    def model_status(self) -> Dict[str, str]:
+        """Per-pipeline state: not_loaded, local, shared or unavailable"""
+        status = {}
+        for name in PIPELINE_SPECS:
+            if name not in self._pipelines:
+                status[name] = "not_loaded"
+            elif self._pipelines[name] is None:
+                status[name] = "unavailable"
+            else:
+                status[name] = "shared" if isinstance(self._pipelines[name], RemotePipeline) else "local"
+        return status
+    
+    def extract_financial_entities(self, text: str) -> Dict[str, List[Any]]:
         """Extract financial entities from text"""
-        entities = {
-            'amounts': [],
-            'dates': [],
-            'account_numbers': [],
-            'names': [],
-            'organizations': []
-        }
-        
-        # Extract amounts (currency patterns)
-        amount_patterns = [
-            r'₹\s*[\d,]+\.?\d*',
-            r'Rs\.?\s*[\d,]+\.?\d*',
-            r'INR\s*[\d,]+\.?\d*',
-            r'\$\s*[\d,]+\.?\d*'
-        ]
-        
-        for pattern in amount_patterns:
-            amounts = re.findall(pattern, text, re.IGNORECASE)
-            entities['amounts'].extend(amounts)
-        
-        # Extract dates
-        date_patterns = [
-            r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',
-            r'\d{1,2}\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{2,4}',
-            r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},?\s+\d{2,4}'
-        ]
-        
-        for pattern in date_patterns:
-            dates = re.findall(pattern, text, re.IGNORECASE)
-            entities['dates'].extend(dates)
-        
-        # Extract account numbers
-        account_patterns = [
-            r'\b\d{9,18}\b',  # Bank account numbers
-            r'\b\d{4}\s*\d{4}\s*\d{4}\s*\d{4}\b'  # Card numbers (masked)
-        ]
-        
-        for pattern in account_patterns:
-            accounts = re.findall(pattern, text)
-            entities['account_numbers'].extend(accounts)
+        # Amounts (raw and normalized), dates, account/card numbers, PAN,
+        # IFSC and organization names in a single regex pass
+        entities = scan_entities(text)
+        entities['names'] = []
         
         # Use NER if available
         if self.ner:
@@ -148,6 +186,8 @@ class FinancialDocumentAnalyzer:
             except:
                 pass
         
+        # Names found by both the regex pass and NER are reported once
+        entities['organizations'] = unique_organizations(entities['organizations'])
         return entities
     
     def analyze_bank_statement(self, text: str) -> Dict[str, Any]:
@@ -175,14 +215,7 @@ class FinancialDocumentAnalyzer:
                 })
         
         # Calculate summary
-        amounts = []
-        for amount_str in analysis['entities']['amounts']:
-            # Clean and convert amount
-            clean_amount = re.sub(r'[₹Rs\.,\s]', '', amount_str)
-            try:
-                amounts.append(float(clean_amount))
-            except:
-                continue
+        amounts = analysis['entities']['amount_values']
         
         if amounts:
             analysis['summary'] = {
@@ -254,6 +287,10 @@ class FinancialDocumentAnalyzer:
         else:
             text = self.ocr.extract_text_from_image(file_path)
         
+        return self.analyze_text(text, document_type)
+    
+    def analyze_text(self, text: str, document_type: str = 'auto') -> Dict[str, Any]:
+        """Analyze extracted document text"""
         # Analyze based on type
         if document_type == 'auto':
             # Auto-detect document type
@@ -278,5 +315,5 @@ class FinancialDocumentAnalyzer:
             'entities': self.extract_financial_entities(text)
         }
 
-# Global document analyzer
+# Global document analyzer (models load lazily on first use)
 document_analyzer = FinancialDocumentAnalyzer()
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""Single-pass Financial Entity Scanner"""
+import re
+from typing import Dict, Any, List
+
+# Case-insensitive via character classes; inline (?i:) groups are slower here
+MONTHS = r"(?:" + "|".join(
+    "".join(f"[{c.upper()}{c}]" for c in month)
+    for month in ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+) + r")[A-Za-z]*\.?"
+ORGANIZATION_SUFFIXES = (
+    r"Bank|Ltd\.?|Limited|Pvt\.?\s+Ltd\.?|Private\s+Limited|LLP|Inc\.?|Corp(?:oration)?\.?"
+    r"|Finance|Financial\s+Services|Insurance|Technologies|Industries"
+)
+
+# One alternation with a named group per entity type, compiled once. Every
+# entity starts a token, so the leading assertions reject positions inside
+# words (and characters no entity can start with) before any branch is tried.
+ENTITY_PATTERN = re.compile(
+    r"""
+    (?<![A-Za-z0-9])(?=[₹$\dRrIiA-Zjfmasond])
+    (?:
+        (?P<amount>(?:₹|\$|[Rr][Ss]\.?|[Ii][Nn][Rr])\s*(?P<amount_value>\d(?:[\d,]*\d)?(?:\.\d+)?))
+        |(?P<date>
+            \d{1,2}[/-]\d{1,2}[/-]\d{2,4}(?!\d)
+            |\d{1,2}\s+""" + MONTHS + r"""\s+\d{2,4}(?!\d)
+            |""" + MONTHS + r"""\s+\d{1,2},?\s+\d{2,4}(?!\d)
+        )
+        |(?P<card>\d{4}\s*\d{4}\s*\d{4}\s*\d{4}(?!\d))
+        |(?P<account>\d{9,18}(?!\d))
+        |(?P<pan>[A-Z]{5}\d{4}[A-Z](?![A-Za-z0-9]))
+        |(?P<ifsc>[A-Z]{4}0[A-Z0-9]{6}(?![A-Za-z0-9]))
+        |(?P<organization>[A-Z][\w&'.-]*(?:\s+(?:of\s+)?[A-Z][\w&'.-]*){0,4}?\s+(?:""" + ORGANIZATION_SUFFIXES + r""")(?:\s+of\s+[A-Z]\w*)?(?!\w))
+    )
+    """,
+    re.VERBOSE
+)
+
+def normalize_amount(value: str) -> float:
+    """Numeric value of an amount such as ``1,25,000.50`` (Indian or western grouping)"""
+    return float(value.replace(",", ""))
+
+def normalize_organization(name: str) -> str:
+    """Comparison key for an organization name: case, spacing and dots ignored"""
+    return " ".join(name.replace(".", " ").split()).lower()
+
+def unique_organizations(names: List[str]) -> List[str]:
+    """First spelling of each distinct organization, in order (regex and NER hits overlap)"""
+    seen = set()
+    unique = []
+    for name in names:
+        key = normalize_organization(name)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(name)
+    return unique
+
+def scan_entities(text: str) -> Dict[str, List[Any]]:
+    """Amounts, dates, account/card numbers, PAN, IFSC and organizations in one pass"""
+    entities = {
+        'amounts': [],
+        'amount_values': [],
+        'dates': [],
+        'account_numbers': [],
+        'pan_numbers': [],
+        'ifsc_codes': [],
+        'organizations': []
+    }
+    amounts = entities['amounts']
+    amount_values = entities['amount_values']
+    dates = entities['dates']
+    accounts = entities['account_numbers']
+    pans = entities['pan_numbers']
+    ifscs = entities['ifsc_codes']
+    organizations = entities['organizations']
+
+    for match in ENTITY_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == 'amount' or kind == 'amount_value':
+            amounts.append(match.group('amount'))
+            amount_values.append(normalize_amount(match.group('amount_value')))
+        elif kind == 'date':
+            dates.append(match.group('date'))
+        elif kind == 'card' or kind == 'account':
+            accounts.append(match.group(kind))
+        elif kind == 'pan':
+            pans.append(match.group('pan'))
+        elif kind == 'ifsc':
+            ifscs.append(match.group('ifsc'))
+        else:
+            organizations.append(match.group('organization'))
+
+    return entities
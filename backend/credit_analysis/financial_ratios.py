@@ -1,135 +1,223 @@
 """Financial Ratios Engine for Credit Metrics"""
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, List
+from bisect import bisect_right
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, NamedTuple, Tuple, Union
 from datetime import datetime, timedelta
 
+# Raw inputs read by the ratio formulas (columnar and scalar paths)
+RATIO_INPUT_FIELDS = (
+    'current_assets', 'current_liabilities', 'inventory', 'cash',
+    'total_debt', 'total_assets', 'monthly_income', 'monthly_expenses',
+    'credit_used', 'credit_limit', 'loan_amount', 'collateral_value',
+    'fixed_expenses', 'debt_payments', 'monthly_debt_payments',
+    'credit_accounts', 'credit_types', 'employment_months',
+    'income_variance', 'emergency_fund'
+)
+
+ColumnarData = Union[pd.DataFrame, Mapping[str, Any]]
+
+# Interpretation categories shared by all ratios; batch APIs return these codes
+RATIO_CATEGORIES = ("unknown", "poor", "fair", "good", "excellent")
+RATIO_CATEGORY_CODES = MappingProxyType({name: code for code, name in enumerate(RATIO_CATEGORIES)})
+OUT_OF_RANGE = "Value out of range"
+
+class RatioBands(NamedTuple):
+    """Interpretation bands of one ratio
+    
+    ``edges`` are ascending lower bounds (inclusive); bin ``i`` of
+    ``np.digitize(value, edges)`` / ``bisect_right(edges, value)`` has
+    category code ``codes[i]``. Bin 0, below the first edge, is out of range.
+    """
+    edges: Tuple[float, ...]
+    codes: Tuple[int, ...]
+    descriptions: Tuple[str, ...]
+
+def _bands(*bands: Tuple[float, str, str]) -> RatioBands:
+    """Bands from (lower bound, category, description), in ascending order of bound"""
+    return RatioBands(
+        edges=tuple(bound for bound, _, _ in bands),
+        codes=(0,) + tuple(RATIO_CATEGORY_CODES[category] for _, category, _ in bands),
+        descriptions=(OUT_OF_RANGE,) + tuple(description for _, _, description in bands)
+    )
+
+RATIO_INTERPRETATIONS = MappingProxyType({
+    'debt_to_income': _bands(
+        (0, 'excellent', "Excellent debt management"),
+        (0.2, 'good', "Good debt levels"),
+        (0.36, 'fair', "Manageable debt"),
+        (0.5, 'poor', "High debt burden")
+    ),
+    'credit_utilization': _bands(
+        (0, 'excellent', "Excellent credit usage"),
+        (0.1, 'good', "Good credit management"),
+        (0.3, 'fair', "Moderate credit usage"),
+        (0.5, 'poor', "High credit utilization")
+    ),
+    'savings_rate': _bands(
+        (0, 'poor', "Low savings rate"),
+        (0.05, 'fair', "Moderate savings"),
+        (0.1, 'good', "Good savings rate"),
+        (0.2, 'excellent', "Excellent savings habit")
+    )
+})
+
+# NumPy copies of the bands for np.digitize, built once
+_BAND_ARRAYS = MappingProxyType({
+    name: (np.asarray(bands.edges, dtype=np.float64), np.asarray(bands.codes, dtype=np.int8))
+    for name, bands in RATIO_INTERPRETATIONS.items()
+})
+
 class FinancialRatiosEngine:
     """Calculate comprehensive financial ratios for credit analysis"""
     
     def __init__(self):
         self.ratios = {}
     
-    def calculate_liquidity_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
-        """Calculate liquidity ratios"""
+    @staticmethod
+    def _to_columns(data: ColumnarData) -> Dict[str, np.ndarray]:
+        """Convert a DataFrame or dict of arrays into float64 columns"""
+        if isinstance(data, pd.DataFrame):
+            return {
+                field: data[field].to_numpy(dtype=np.float64)
+                for field in RATIO_INPUT_FIELDS if field in data.columns
+            }
+        
+        columns = {
+            field: np.asarray(data[field], dtype=np.float64).reshape(-1)
+            for field in RATIO_INPUT_FIELDS if field in data
+        }
+        lengths = {len(column) for column in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All ratio input columns must have the same length")
+        return columns
+    
+    @staticmethod
+    def _scalar_columns(data: Dict[str, float]) -> Dict[str, np.ndarray]:
+        """Wrap a single record as one-row columns"""
+        return {
+            field: np.array([data[field]], dtype=np.float64)
+            for field in RATIO_INPUT_FIELDS if field in data
+        }
+    
+    @staticmethod
+    def _first_row(ratios: Dict[str, np.ndarray]) -> Dict[str, float]:
+        """Unwrap one-row ratio columns back to plain floats"""
+        return {name: float(values[0]) for name, values in ratios.items()}
+    
+    @np.errstate(divide='ignore', invalid='ignore')
+    def calculate_liquidity_ratios_batch(self, cols: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Calculate liquidity ratios over columns"""
         ratios = {}
         
         # Current Ratio
-        if 'current_assets' in data and 'current_liabilities' in data:
-            ratios['current_ratio'] = data['current_assets'] / (data['current_liabilities'] + 1)
+        if 'current_assets' in cols and 'current_liabilities' in cols:
+            ratios['current_ratio'] = cols['current_assets'] / (cols['current_liabilities'] + 1)
         
         # Quick Ratio
-        if all(k in data for k in ['current_assets', 'inventory', 'current_liabilities']):
-            ratios['quick_ratio'] = (data['current_assets'] - data['inventory']) / (data['current_liabilities'] + 1)
+        if all(k in cols for k in ['current_assets', 'inventory', 'current_liabilities']):
+            ratios['quick_ratio'] = (cols['current_assets'] - cols['inventory']) / (cols['current_liabilities'] + 1)
         
         # Cash Ratio
-        if 'cash' in data and 'current_liabilities' in data:
-            ratios['cash_ratio'] = data['cash'] / (data['current_liabilities'] + 1)
+        if 'cash' in cols and 'current_liabilities' in cols:
+            ratios['cash_ratio'] = cols['cash'] / (cols['current_liabilities'] + 1)
         
         return ratios
     
-    def calculate_debt_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
-        """Calculate debt and leverage ratios"""
+    @np.errstate(divide='ignore', invalid='ignore')
+    def calculate_debt_ratios_batch(self, cols: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Calculate debt and leverage ratios over columns"""
         ratios = {}
         
         # Debt-to-Income Ratio
-        if 'total_debt' in data and 'monthly_income' in data:
-            ratios['debt_to_income'] = data['total_debt'] / (data['monthly_income'] * 12 + 1)
+        if 'total_debt' in cols and 'monthly_income' in cols:
+            ratios['debt_to_income'] = cols['total_debt'] / (cols['monthly_income'] * 12 + 1)
         
         # Debt-to-Asset Ratio
-        if 'total_debt' in data and 'total_assets' in data:
-            ratios['debt_to_asset'] = data['total_debt'] / (data['total_assets'] + 1)
+        if 'total_debt' in cols and 'total_assets' in cols:
+            ratios['debt_to_asset'] = cols['total_debt'] / (cols['total_assets'] + 1)
         
         # Credit Utilization Ratio
-        if 'credit_used' in data and 'credit_limit' in data:
-            ratios['credit_utilization'] = data['credit_used'] / (data['credit_limit'] + 1)
+        if 'credit_used' in cols and 'credit_limit' in cols:
+            ratios['credit_utilization'] = cols['credit_used'] / (cols['credit_limit'] + 1)
         
         # Loan-to-Value Ratio (for secured loans)
-        if 'loan_amount' in data and 'collateral_value' in data:
-            ratios['loan_to_value'] = data['loan_amount'] / (data['collateral_value'] + 1)
+        if 'loan_amount' in cols and 'collateral_value' in cols:
+            ratios['loan_to_value'] = cols['loan_amount'] / (cols['collateral_value'] + 1)
         
         return ratios
     
-    def calculate_income_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
-        """Calculate income and expense ratios"""
+    @np.errstate(divide='ignore', invalid='ignore')
+    def calculate_income_ratios_batch(self, cols: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Calculate income and expense ratios over columns"""
         ratios = {}
         
         # Income-to-Expense Ratio
-        if 'monthly_income' in data and 'monthly_expenses' in data:
-            ratios['income_expense_ratio'] = data['monthly_income'] / (data['monthly_expenses'] + 1)
+        if 'monthly_income' in cols and 'monthly_expenses' in cols:
+            ratios['income_expense_ratio'] = cols['monthly_income'] / (cols['monthly_expenses'] + 1)
         
-        # Savings Rate
-        if 'monthly_income' in data and 'monthly_expenses' in data:
-            savings = data['monthly_income'] - data['monthly_expenses']
-            ratios['savings_rate'] = savings / data['monthly_income'] if data['monthly_income'] > 0 else 0
+        # Savings Rate (0 when there is no income)
+        if 'monthly_income' in cols and 'monthly_expenses' in cols:
+            income = cols['monthly_income']
+            savings = income - cols['monthly_expenses']
+            positive = income > 0
+            ratios['savings_rate'] = np.where(positive, savings / np.where(positive, income, 1.0), 0.0)
         
         # Fixed Expense Ratio
-        if 'fixed_expenses' in data and 'monthly_income' in data:
-            ratios['fixed_expense_ratio'] = data['fixed_expenses'] / (data['monthly_income'] + 1)
+        if 'fixed_expenses' in cols and 'monthly_income' in cols:
+            ratios['fixed_expense_ratio'] = cols['fixed_expenses'] / (cols['monthly_income'] + 1)
         
         # Discretionary Income Ratio
-        if all(k in data for k in ['monthly_income', 'fixed_expenses', 'debt_payments']):
-            discretionary = data['monthly_income'] - data['fixed_expenses'] - data['debt_payments']
-            ratios['discretionary_income_ratio'] = discretionary / data['monthly_income']
+        if all(k in cols for k in ['monthly_income', 'fixed_expenses', 'debt_payments']):
+            discretionary = cols['monthly_income'] - cols['fixed_expenses'] - cols['debt_payments']
+            ratios['discretionary_income_ratio'] = discretionary / cols['monthly_income']
         
         return ratios
     
-    def calculate_credit_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
-        """Calculate credit-specific ratios"""
+    @np.errstate(divide='ignore', invalid='ignore')
+    def calculate_credit_ratios_batch(self, cols: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Calculate credit-specific ratios over columns"""
         ratios = {}
         
         # Payment-to-Income Ratio
-        if 'monthly_debt_payments' in data and 'monthly_income' in data:
-            ratios['payment_to_income'] = data['monthly_debt_payments'] / (data['monthly_income'] + 1)
+        if 'monthly_debt_payments' in cols and 'monthly_income' in cols:
+            ratios['payment_to_income'] = cols['monthly_debt_payments'] / (cols['monthly_income'] + 1)
         
         # Available Credit Ratio
-        if 'credit_limit' in data and 'credit_used' in data:
-            available_credit = data['credit_limit'] - data['credit_used']
-            ratios['available_credit_ratio'] = available_credit / (data['credit_limit'] + 1)
+        if 'credit_limit' in cols and 'credit_used' in cols:
+            available_credit = cols['credit_limit'] - cols['credit_used']
+            ratios['available_credit_ratio'] = available_credit / (cols['credit_limit'] + 1)
         
         # Credit Mix Score (diversity of credit types)
-        if 'credit_accounts' in data:
-            credit_types = data.get('credit_types', 1)
-            ratios['credit_mix_score'] = min(credit_types / 5, 1.0)  # Normalized to 0-1
+        if 'credit_accounts' in cols:
+            credit_types = cols.get('credit_types', np.ones_like(cols['credit_accounts']))
+            ratios['credit_mix_score'] = np.minimum(credit_types / 5, 1.0)  # Normalized to 0-1
         
         return ratios
     
-    def calculate_stability_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
-        """Calculate financial stability ratios"""
+    @np.errstate(divide='ignore', invalid='ignore')
+    def calculate_stability_ratios_batch(self, cols: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Calculate financial stability ratios over columns"""
         ratios = {}
         
         # Employment Stability Score
-        if 'employment_months' in data:
-            ratios['employment_stability'] = min(data['employment_months'] / 24, 1.0)  # 2 years = stable
+        if 'employment_months' in cols:
+            ratios['employment_stability'] = np.minimum(cols['employment_months'] / 24, 1.0)  # 2 years = stable
         
         # Income Volatility (if historical data available)
-        if 'income_variance' in data and 'monthly_income' in data:
-            ratios['income_volatility'] = data['income_variance'] / (data['monthly_income'] ** 2 + 1)
+        if 'income_variance' in cols and 'monthly_income' in cols:
+            ratios['income_volatility'] = cols['income_variance'] / (cols['monthly_income'] ** 2 + 1)
         
         # Emergency Fund Ratio
-        if 'emergency_fund' in data and 'monthly_expenses' in data:
-            ratios['emergency_fund_ratio'] = data['emergency_fund'] / (data['monthly_expenses'] * 6 + 1)
+        if 'emergency_fund' in cols and 'monthly_expenses' in cols:
+            ratios['emergency_fund_ratio'] = cols['emergency_fund'] / (cols['monthly_expenses'] * 6 + 1)
         
         return ratios
     
-    def calculate_all_ratios(self, financial_data: Dict[str, float]) -> Dict[str, Any]:
-        """Calculate all financial ratios"""
-        all_ratios = {}
-        
-        # Calculate different ratio categories
-        all_ratios['liquidity'] = self.calculate_liquidity_ratios(financial_data)
-        all_ratios['debt'] = self.calculate_debt_ratios(financial_data)
-        all_ratios['income'] = self.calculate_income_ratios(financial_data)
-        all_ratios['credit'] = self.calculate_credit_ratios(financial_data)
-        all_ratios['stability'] = self.calculate_stability_ratios(financial_data)
-        
-        # Calculate composite scores
-        all_ratios['composite'] = self.calculate_composite_scores(all_ratios)
-        
-        return all_ratios
-    
-    def calculate_composite_scores(self, ratios: Dict[str, Dict[str, float]]) -> Dict[str, float]:
-        """Calculate composite financial health scores"""
+    @np.errstate(divide='ignore', invalid='ignore')
+    def calculate_composite_scores_batch(self, ratios: Dict[str, Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """Calculate composite financial health scores over columns"""
         composite = {}
         
         # Financial Health Score (0-100)
@@ -138,30 +226,27 @@ class FinancialRatiosEngine:
         # Debt health (lower is better)
         debt_ratios = ratios.get('debt', {})
         if 'debt_to_income' in debt_ratios:
-            debt_score = max(0, 100 - (debt_ratios['debt_to_income'] * 100))
-            health_factors.append(debt_score)
+            health_factors.append(np.maximum(0, 100 - (debt_ratios['debt_to_income'] * 100)))
         
         # Income health (higher is better)
         income_ratios = ratios.get('income', {})
         if 'savings_rate' in income_ratios:
-            savings_score = min(100, income_ratios['savings_rate'] * 100)
-            health_factors.append(savings_score)
+            health_factors.append(np.minimum(100, income_ratios['savings_rate'] * 100))
         
         # Credit health
         credit_ratios = ratios.get('credit', {})
         if 'credit_utilization' in credit_ratios:
-            credit_score = max(0, 100 - (credit_ratios['credit_utilization'] * 100))
-            health_factors.append(credit_score)
+            health_factors.append(np.maximum(0, 100 - (credit_ratios['credit_utilization'] * 100)))
         
         if health_factors:
-            composite['financial_health_score'] = np.mean(health_factors)
+            composite['financial_health_score'] = np.mean(health_factors, axis=0)
         
         # Creditworthiness Score (0-1000)
         creditworthiness_factors = []
         
         # Payment capacity
         if 'payment_to_income' in credit_ratios:
-            payment_capacity = max(0, 1 - credit_ratios['payment_to_income'])
+            payment_capacity = np.maximum(0, 1 - credit_ratios['payment_to_income'])
             creditworthiness_factors.append(payment_capacity * 300)
         
         # Financial stability
@@ -171,51 +256,116 @@ class FinancialRatiosEngine:
         
         # Debt management
         if 'debt_to_income' in debt_ratios:
-            debt_management = max(0, 1 - debt_ratios['debt_to_income'])
+            debt_management = np.maximum(0, 1 - debt_ratios['debt_to_income'])
             creditworthiness_factors.append(debt_management * 300)
         
         # Liquidity
         liquidity_ratios = ratios.get('liquidity', {})
         if 'current_ratio' in liquidity_ratios:
-            liquidity_score = min(1, liquidity_ratios['current_ratio'] / 2)  # 2.0 is ideal
+            liquidity_score = np.minimum(1, liquidity_ratios['current_ratio'] / 2)  # 2.0 is ideal
             creditworthiness_factors.append(liquidity_score * 200)
         
         if creditworthiness_factors:
-            composite['creditworthiness_score'] = sum(creditworthiness_factors)
+            composite['creditworthiness_score'] = np.sum(creditworthiness_factors, axis=0)
         
         return composite
     
+    def calculate_all_ratios_batch(self, data: ColumnarData) -> Dict[str, Dict[str, np.ndarray]]:
+        """Calculate all financial ratios for many applicants at once
+        
+        Accepts a DataFrame or a dict of equal-length arrays and returns the
+        same nested structure as calculate_all_ratios with one array per ratio.
+        """
+        cols = self._to_columns(data)
+        all_ratios = {}
+        
+        # Calculate different ratio categories
+        all_ratios['liquidity'] = self.calculate_liquidity_ratios_batch(cols)
+        all_ratios['debt'] = self.calculate_debt_ratios_batch(cols)
+        all_ratios['income'] = self.calculate_income_ratios_batch(cols)
+        all_ratios['credit'] = self.calculate_credit_ratios_batch(cols)
+        all_ratios['stability'] = self.calculate_stability_ratios_batch(cols)
+        
+        # Calculate composite scores
+        all_ratios['composite'] = self.calculate_composite_scores_batch(all_ratios)
+        
+        return all_ratios
+    
+    def calculate_liquidity_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
+        """Calculate liquidity ratios"""
+        return self._first_row(self.calculate_liquidity_ratios_batch(self._scalar_columns(data)))
+    
+    def calculate_debt_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
+        """Calculate debt and leverage ratios"""
+        return self._first_row(self.calculate_debt_ratios_batch(self._scalar_columns(data)))
+    
+    def calculate_income_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
+        """Calculate income and expense ratios"""
+        return self._first_row(self.calculate_income_ratios_batch(self._scalar_columns(data)))
+    
+    def calculate_credit_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
+        """Calculate credit-specific ratios"""
+        return self._first_row(self.calculate_credit_ratios_batch(self._scalar_columns(data)))
+    
+    def calculate_stability_ratios(self, data: Dict[str, float]) -> Dict[str, float]:
+        """Calculate financial stability ratios"""
+        return self._first_row(self.calculate_stability_ratios_batch(self._scalar_columns(data)))
+    
+    def calculate_all_ratios(self, financial_data: Dict[str, float]) -> Dict[str, Any]:
+        """Calculate all financial ratios"""
+        batch = self.calculate_all_ratios_batch(self._scalar_columns(financial_data))
+        return {category: self._first_row(ratios) for category, ratios in batch.items()}
+    
+    def calculate_composite_scores(self, ratios: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+        """Calculate composite financial health scores"""
+        columns = {
+            category: {name: np.array([value], dtype=np.float64) for name, value in values.items()}
+            for category, values in ratios.items() if isinstance(values, dict)
+        }
+        return self._first_row(self.calculate_composite_scores_batch(columns))
+    
     def get_ratio_interpretation(self, ratio_name: str, value: float) -> Dict[str, str]:
         """Get interpretation of financial ratio"""
-        interpretations = {
-            'debt_to_income': {
-                'excellent': (0, 0.2, "Excellent debt management"),
-                'good': (0.2, 0.36, "Good debt levels"),
-                'fair': (0.36, 0.5, "Manageable debt"),
-                'poor': (0.5, float('inf'), "High debt burden")
-            },
-            'credit_utilization': {
-                'excellent': (0, 0.1, "Excellent credit usage"),
-                'good': (0.1, 0.3, "Good credit management"),
-                'fair': (0.3, 0.5, "Moderate credit usage"),
-                'poor': (0.5, float('inf'), "High credit utilization")
-            },
-            'savings_rate': {
-                'excellent': (0.2, float('inf'), "Excellent savings habit"),
-                'good': (0.1, 0.2, "Good savings rate"),
-                'fair': (0.05, 0.1, "Moderate savings"),
-                'poor': (0, 0.05, "Low savings rate")
-            }
-        }
-        
-        if ratio_name not in interpretations:
+        bands = RATIO_INTERPRETATIONS.get(ratio_name)
+        if bands is None:
             return {"category": "unknown", "description": "No interpretation available"}
         
-        for category, (min_val, max_val, description) in interpretations[ratio_name].items():
-            if min_val <= value < max_val:
-                return {"category": category, "description": description}
-        
-        return {"category": "unknown", "description": "Value out of range"}
+        # Infinite and NaN ratios (e.g. no income) have no band
+        if not np.isfinite(value):
+            return {"category": "unknown", "description": OUT_OF_RANGE}
+        band = bisect_right(bands.edges, value)
+        return {"category": RATIO_CATEGORIES[bands.codes[band]], "description": bands.descriptions[band]}
+    
+    def get_ratio_interpretation_batch(self, ratio_name: str, values: Any) -> np.ndarray:
+        """Category codes (indices into RATIO_CATEGORIES) for a whole ratio column
+        
+        One ``np.digitize`` over the column; unknown ratios, NaN, infinite
+        and out-of-range values map to 0 ("unknown").
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if ratio_name not in _BAND_ARRAYS:
+            return np.zeros(values.shape, dtype=np.int8)
+        
+        edges, codes = _BAND_ARRAYS[ratio_name]
+        result = codes[np.digitize(values, edges)]
+        result[~np.isfinite(values)] = 0
+        return result
+    
+    def interpret_ratios_batch(self, ratios: Dict[str, Dict[str, np.ndarray]]) -> Dict[str, Dict[str, np.ndarray]]:
+        """Category codes for every interpretable ratio in calculate_all_ratios_batch output"""
+        return {
+            category: {
+                name: self.get_ratio_interpretation_batch(name, values)
+                for name, values in category_ratios.items() if name in RATIO_INTERPRETATIONS
+            }
+            for category, category_ratios in ratios.items()
+        }
+    
+    @staticmethod
+    def category_counts(codes: np.ndarray) -> Dict[str, int]:
+        """Number of rows per interpretation category, for portfolio dashboards"""
+        counts = np.bincount(np.asarray(codes).ravel(), minlength=len(RATIO_CATEGORIES))
+        return {category: int(count) for category, count in zip(RATIO_CATEGORIES, counts)}
 
 # Global ratios engine
 financial_ratios_engine = FinancialRatiosEngine()
\ No newline at end of file
@@ -7,9 +7,15 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 from sklearn.metrics import classification_report
 import joblib
-from typing import Dict, Any, List, Tuple
-from datetime import datetime, timedelta
+from typing import Dict, Any, List, Tuple, Optional, Sequence, Union
+from datetime import datetime, timedelta, timezone
 import hashlib
+import os
+from .transaction_state import UserTransactionState, STRUCTURING_THRESHOLD
+from .geo_index import default_gazetteer, haversine_km
+
+# Buffered transactions needed before the streaming round-amount ratio means anything
+MIN_ROUND_AMOUNT_SAMPLE = 5
 
 class AnomalyDetector:
     """Detect anomalies in financial behavior"""
@@ -19,37 +25,98 @@ class AnomalyDetector:
         self.scaler = StandardScaler()
         self.is_trained = False
         self.feature_names = []
+        self.reference_stats = None
+        self._extractors = []
+    
+    @staticmethod
+    def _parse_timestamps(timestamps: pd.Series) -> pd.Series:
+        """Epoch seconds (numeric) or date strings to datetimes"""
+        if pd.api.types.is_numeric_dtype(timestamps):
+            return pd.to_datetime(timestamps, unit='s')
+        return pd.to_datetime(timestamps)
+    
+    def fit_reference_stats(self, data: pd.DataFrame) -> Dict[str, Any]:
+        """Statistics used to build features for events outside the training batch"""
+        stats = {}
+        if 'amount' in data.columns:
+            stats['amount_mean'] = float(data['amount'].mean())
+            stats['amount_std'] = float(data['amount'].std())
+        if 'user_id' in data.columns:
+            stats['user_frequency'] = data['user_id'].value_counts().to_dict()
+        if 'location' in data.columns:
+            stats['location_frequency'] = data['location'].value_counts().to_dict()
+        return stats
     
     def prepare_features(self, data: pd.DataFrame) -> pd.DataFrame:
-        """Prepare features for anomaly detection"""
+        """Prepare features for anomaly detection
+        
+        Uses the reference statistics fitted at training time when available,
+        otherwise statistics of the given batch.
+        """
         features = data.copy()
+        stats = self.reference_stats or self.fit_reference_stats(data)
         
         # Transaction amount features
         if 'amount' in features.columns:
             features['amount_log'] = np.log1p(features['amount'])
-            features['amount_zscore'] = (features['amount'] - features['amount'].mean()) / features['amount'].std()
+            features['amount_zscore'] = (features['amount'] - stats['amount_mean']) / stats['amount_std']
         
         # Time-based features
         if 'timestamp' in features.columns:
-            features['hour'] = pd.to_datetime(features['timestamp']).dt.hour
-            features['day_of_week'] = pd.to_datetime(features['timestamp']).dt.dayofweek
+            timestamps = self._parse_timestamps(features['timestamp'])
+            features['hour'] = timestamps.dt.hour
+            features['day_of_week'] = timestamps.dt.dayofweek
             features['is_weekend'] = features['day_of_week'].isin([5, 6]).astype(int)
             features['is_night'] = ((features['hour'] < 6) | (features['hour'] > 22)).astype(int)
         
         # Frequency features
         if 'user_id' in features.columns:
-            user_counts = features['user_id'].value_counts()
-            features['user_transaction_frequency'] = features['user_id'].map(user_counts)
+            user_counts = stats.get('user_frequency', {})
+            features['user_transaction_frequency'] = features['user_id'].map(user_counts).fillna(0)
         
         # Location features (if available)
         if 'location' in features.columns:
-            location_counts = features['location'].value_counts()
-            features['location_frequency'] = features['location'].map(location_counts)
+            location_counts = stats.get('location_frequency', {})
+            features['location_frequency'] = features['location'].map(location_counts).fillna(0)
         
         return features
     
+    def _compile_extractors(self):
+        """Per-feature extractors that build a row from one transaction dict"""
+        stats = self.reference_stats or {}
+        
+        def time_parts(record: Dict[str, Any]) -> datetime:
+            value = record.get('timestamp', 0)
+            if isinstance(value, str):
+                return datetime.fromisoformat(value)
+            return datetime.fromtimestamp(value, tz=timezone.utc)
+        
+        def is_night(record: Dict[str, Any]) -> float:
+            hour = time_parts(record).hour
+            return float(hour < 6 or hour > 22)
+        
+        derived = {
+            # Refunds and reversals are negative; log1p is undefined below -1
+            'amount_log': lambda r: float(np.log1p(max(float(r.get('amount', 0)), 0.0))),
+            'amount_zscore': lambda r: (float(r.get('amount', 0)) - stats['amount_mean']) / stats['amount_std'],
+            'hour': lambda r: float(time_parts(r).hour),
+            'day_of_week': lambda r: float(time_parts(r).weekday()),
+            'is_weekend': lambda r: float(time_parts(r).weekday() in (5, 6)),
+            'is_night': is_night,
+            'user_transaction_frequency': lambda r: float(stats.get('user_frequency', {}).get(r.get('user_id'), 0)),
+            'location_frequency': lambda r: float(stats.get('location_frequency', {}).get(r.get('location'), 0))
+        }
+        
+        def raw(name: str):
+            return lambda r: float(r.get(name, 0))
+        
+        self._extractors = [derived.get(name) or raw(name) for name in self.feature_names]
+    
     def train(self, data: pd.DataFrame) -> Dict[str, Any]:
         """Train anomaly detection model"""
+        # Fit reference statistics on the training set
+        self.reference_stats = self.fit_reference_stats(data)
+        
         # Prepare features
         features = self.prepare_features(data)
         
@@ -68,6 +135,7 @@ class AnomalyDetector:
         anomalies = self.isolation_forest.predict(X_scaled)
         
         self.is_trained = True
+        self._compile_extractors()
         
         return {
             "total_samples": len(data),
@@ -102,47 +170,123 @@ class AnomalyDetector:
         }
         
         return results
+    
+    def score_batch(self, transactions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Score transaction dicts against the training reference without pandas
+        
+        Raises ``ValueError`` for a transaction whose fields cannot be
+        turned into finite features (e.g. a non-numeric amount or an
+        unparseable timestamp).
+        """
+        if not self.is_trained:
+            raise ValueError("Model not trained. Call train() first.")
+        
+        X = np.empty((len(transactions), len(self.feature_names)), dtype=np.float64)
+        for i, transaction in enumerate(transactions):
+            try:
+                X[i] = [extract(transaction) for extract in self._extractors]
+            except (TypeError, ValueError, OverflowError, OSError) as e:
+                raise ValueError(f"Invalid transaction {transaction.get('id', i)!r}: {e}") from e
+            if not np.isfinite(X[i]).all():
+                raise ValueError(f"Invalid transaction {transaction.get('id', i)!r}: non-finite feature values")
+        
+        # Scale with the fitted parameters directly (StandardScaler.transform expects named columns)
+        X -= self.scaler.mean_
+        X /= self.scaler.scale_
+        anomaly_scores = self.isolation_forest.decision_function(X)
+        is_anomaly = anomaly_scores < 0  # same cut-off as IsolationForest.predict
+        
+        return {
+            "anomaly_scores": anomaly_scores.tolist(),
+            "is_anomaly": is_anomaly.tolist(),
+            "anomaly_indices": np.flatnonzero(is_anomaly).tolist(),
+            "total_anomalies": int(is_anomaly.sum()),
+            "anomaly_rate": float(is_anomaly.mean()) if len(transactions) else 0.0
+        }
+    
+    def score_one(self, transaction: Dict[str, Any]) -> Dict[str, Any]:
+        """Score a single transaction in O(1) feature construction"""
+        results = self.score_batch([transaction])
+        return {
+            "anomaly_score": results["anomaly_scores"][0],
+            "is_anomaly": results["is_anomaly"][0]
+        }
+    
+    def save_model(self, filepath: str):
+        """Save trained detector with its reference statistics"""
+        if self.is_trained:
+            joblib.dump({
+                "isolation_forest": self.isolation_forest,
+                "scaler": self.scaler,
+                "feature_names": self.feature_names,
+                "reference_stats": self.reference_stats
+            }, filepath)
+    
+    def load_model(self, filepath: str):
+        """Load trained detector"""
+        if os.path.exists(filepath):
+            model_data = joblib.load(filepath)
+            self.isolation_forest = model_data["isolation_forest"]
+            self.scaler = model_data["scaler"]
+            self.feature_names = model_data["feature_names"]
+            self.reference_stats = model_data["reference_stats"]
+            self.is_trained = True
+            self._compile_extractors()
 
 class PatternDetector:
     """Detect suspicious patterns in financial behavior"""
     
-    def __init__(self):
+    def __init__(self, max_travel_speed_kmh: float = None):
         self.suspicious_patterns = []
+        self.max_travel_speed_kmh = max_travel_speed_kmh or float(os.getenv("IMPOSSIBLE_TRAVEL_MAX_KMH", "900"))
     
     def detect_velocity_fraud(self, transactions: List[Dict[str, Any]], 
-                            time_window: int = 300) -> List[Dict[str, Any]]:
-        """Detect high-velocity transactions (many transactions in short time)"""
-        suspicious = []
+                            time_window: int = 300, min_count: int = 5,
+                            time_windows: Optional[Union[Sequence[int], Dict[int, int]]] = None) -> List[Dict[str, Any]]:
+        """Detect high-velocity transactions (many transactions in short time)
+        
+        Sorts timestamps once and finds each window end with np.searchsorted, so
+        every window size costs O(n log n) regardless of how bursty the history is.
+        Pass ``time_windows`` (a list of seconds, or {seconds: min_count}) to check
+        several windows, e.g. 1 min / 5 min / 1 h, in one pass.
+        """
+        if not transactions:
+            return []
+        
+        if time_windows is None:
+            windows = {time_window: min_count}
+        elif isinstance(time_windows, dict):
+            windows = dict(time_windows)
+        else:
+            windows = {window: min_count for window in time_windows}
         
-        # Sort by timestamp
-        sorted_transactions = sorted(transactions, key=lambda x: x.get('timestamp', 0))
+        # Read each transaction once, then work on sorted arrays
+        timestamps = np.array([t.get('timestamp', 0) for t in transactions])
+        amounts = np.array([t.get('amount', 0) for t in transactions])
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        amounts = amounts[order]
+        starts = np.arange(len(timestamps))
         
-        for i, transaction in enumerate(sorted_transactions):
-            # Count transactions in time window
-            current_time = transaction.get('timestamp', 0)
-            count = 1
-            total_amount = transaction.get('amount', 0)
-            
-            # Look at subsequent transactions
-            for j in range(i + 1, len(sorted_transactions)):
-                next_transaction = sorted_transactions[j]
-                next_time = next_transaction.get('timestamp', 0)
-                
-                if next_time - current_time <= time_window:
-                    count += 1
-                    total_amount += next_transaction.get('amount', 0)
-                else:
-                    break
+        suspicious = []
+        for window, threshold in windows.items():
+            # Window for transaction i covers [t_i, t_i + window]
+            ends = np.searchsorted(timestamps, timestamps + window, side='right')
+            counts = ends - starts
+            flagged = np.flatnonzero(counts >= threshold)
+            if not len(flagged):
+                continue
             
-            # Flag if too many transactions in short time
-            if count >= 5:  # 5+ transactions in 5 minutes
+            # Summed per flagged window: a prefix-sum difference drifts by float rounding
+            totals = [sum(amounts[i:end].tolist()) for i, end in zip(flagged.tolist(), ends[flagged].tolist())]
+            for i, count, total_amount in zip(flagged.tolist(), counts[flagged].tolist(), totals):
                 suspicious.append({
                     "type": "velocity_fraud",
-                    "transaction_id": transaction.get('id'),
+                    "transaction_id": transactions[order[i]].get('id'),
                     "count": count,
                     "total_amount": total_amount,
-                    "time_window": time_window,
-                    "risk_score": min(count / 10, 1.0)
+                    "time_window": window,
+                    "risk_score": min(count / (threshold * 2), 1.0)
                 })
         
         return suspicious
@@ -163,7 +307,7 @@ class PatternDetector:
             })
         
         # Structuring (amounts just below reporting threshold)
-        threshold = 50000  # Example threshold
+        threshold = STRUCTURING_THRESHOLD
         near_threshold = [a for a in amounts if threshold * 0.9 <= a < threshold]
         if len(near_threshold) >= 3:
             suspicious.append({
@@ -176,34 +320,79 @@ class PatternDetector:
         
         return suspicious
     
+    def travel_check(self, from_location: str, to_location: str,
+                     time_diff: float) -> Optional[Dict[str, Any]]:
+        """Impossible-travel pattern for one location change, or None
+        
+        Known locations are compared by great-circle speed against
+        ``max_travel_speed_kmh``; unknown ones fall back to flagging any
+        change of city within an hour.
+        """
+        distance_km = speed_kmh = None
+        from_coords = default_gazetteer.locate(from_location)
+        to_coords = default_gazetteer.locate(to_location)
+        
+        if from_coords is not None and to_coords is not None:
+            distance_km = float(haversine_km(from_coords[0], from_coords[1], to_coords[0], to_coords[1]))
+            if time_diff > 0:
+                speed_kmh = distance_km / (time_diff / 3600)
+            else:
+                speed_kmh = float('inf') if distance_km > 0 else 0.0
+            if speed_kmh <= self.max_travel_speed_kmh:
+                return None
+        elif time_diff >= 3600:
+            return None
+        
+        return {
+            "type": "impossible_travel",
+            "from_location": from_location,
+            "to_location": to_location,
+            "time_difference": time_diff,
+            "distance_km": distance_km,
+            "speed_kmh": speed_kmh,
+            "risk_score": 0.9
+        }
+    
     def detect_location_anomalies(self, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Detect location-based anomalies"""
+        """Detect location-based anomalies
+        
+        Consecutive located transactions (in time order) are checked for
+        travel faster than ``max_travel_speed_kmh`` using gazetteer
+        coordinates and vectorized haversine distances.
+        """
         suspicious = []
-        locations = [t.get('location') for t in transactions if t.get('location')]
+        located = sorted(
+            (t for t in transactions if t.get('location')),
+            key=lambda t: t.get('timestamp', 0)
+        )
         
-        if not locations:
+        if len(located) < 2:
             return suspicious
         
-        # Impossible travel (transactions in different cities too quickly)
-        for i in range(len(transactions) - 1):
-            current = transactions[i]
-            next_trans = transactions[i + 1]
-            
-            current_location = current.get('location')
-            next_location = next_trans.get('location')
-            
-            if current_location and next_location and current_location != next_location:
-                time_diff = next_trans.get('timestamp', 0) - current.get('timestamp', 0)
-                
-                # If different cities within 1 hour (simplified check)
-                if time_diff < 3600:  # 1 hour
-                    suspicious.append({
-                        "type": "impossible_travel",
-                        "from_location": current_location,
-                        "to_location": next_location,
-                        "time_difference": time_diff,
-                        "risk_score": 0.9
-                    })
+        locations = [t['location'] for t in located]
+        timestamps = np.array([t.get('timestamp', 0) for t in located], dtype=np.float64)
+        coords = default_gazetteer.lookup(locations)
+        
+        distance = haversine_km(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+        elapsed = np.diff(timestamps)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speed = np.where(elapsed > 0, distance / (elapsed / 3600), np.where(distance > 0, np.inf, 0.0))
+        
+        known = ~np.isnan(distance)
+        changed = np.array([a != b for a, b in zip(locations[:-1], locations[1:])])
+        # Known pairs: physical speed check; unknown pairs: city change within an hour
+        flagged = changed & np.where(known, speed > self.max_travel_speed_kmh, elapsed < 3600)
+        
+        for i in np.flatnonzero(flagged).tolist():
+            suspicious.append({
+                "type": "impossible_travel",
+                "from_location": locations[i],
+                "to_location": locations[i + 1],
+                "time_difference": located[i + 1].get('timestamp', 0) - located[i].get('timestamp', 0),
+                "distance_km": float(distance[i]) if known[i] else None,
+                "speed_kmh": float(speed[i]) if known[i] else None,
+                "risk_score": 0.9
+            })
         
         return suspicious
     
@@ -314,7 +503,12 @@ class FraudDetectionEngine:
     def analyze_transaction(self, transaction: Dict[str, Any], 
                           user_profile: Dict[str, Any] = None,
                           transaction_history: List[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Comprehensive fraud analysis for a transaction"""
+        """Comprehensive fraud analysis for a transaction
+        
+        ``anomaly_detection`` keeps the ``detect_anomalies`` shape (per-event
+        lists, current transaction last) over the history plus the
+        transaction, or the transaction alone without a history.
+        """
         results = {
             "transaction_id": transaction.get("id"),
             "timestamp": transaction.get("timestamp"),
@@ -344,11 +538,11 @@ class FraudDetectionEngine:
             )
             results["suspicious_patterns"].extend(behavioral_patterns)
         
-        # Anomaly detection (if model is trained)
-        if self.anomaly_detector.is_trained and transaction_history:
-            df = pd.DataFrame(transaction_history + [transaction])
-            anomaly_results = self.anomaly_detector.detect_anomalies(df)
-            results["anomaly_detection"] = anomaly_results
+        # Anomaly detection against the training reference (if model is trained)
+        if self.anomaly_detector.is_trained:
+            results["anomaly_detection"] = self.anomaly_detector.score_batch(
+                (transaction_history or []) + [transaction]
+            )
         
         # Calculate overall risk score
         risk_assessment = self.risk_scorer.calculate_risk_score(results["suspicious_patterns"])
@@ -356,5 +550,84 @@ class FraudDetectionEngine:
         
         return results
 
+    def analyze_streaming_transaction(self, transaction: Dict[str, Any],
+                                      state: UserTransactionState,
+                                      user_profile: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Score one transaction against a user's rolling state and record it
+        
+        Uses the incremental aggregates in ``state`` instead of re-sorting and
+        re-scanning a resent transaction history. ``anomaly_detection`` has
+        the ``detect_anomalies`` shape for the one transaction.
+        """
+        results = {
+            "transaction_id": transaction.get("id"),
+            "timestamp": transaction.get("timestamp"),
+            "suspicious_patterns": [],
+            "anomaly_detection": {},
+            "risk_assessment": {}
+        }
+        patterns = results["suspicious_patterns"]
+        
+        # Scored first: an invalid transaction raises before it touches the state
+        if self.anomaly_detector.is_trained:
+            results["anomaly_detection"] = self.anomaly_detector.score_batch([transaction])
+        
+        stats = state.add(transaction)
+        
+        # Velocity over each window ending at this transaction
+        for window, threshold in state.windows.items():
+            window_stats = stats["windows"][window]
+            if window_stats["count"] >= threshold:
+                patterns.append({
+                    "type": "velocity_fraud",
+                    "transaction_id": transaction.get("id"),
+                    "count": window_stats["count"],
+                    "total_amount": window_stats["total_amount"],
+                    "time_window": window,
+                    "risk_score": min(window_stats["count"] / (threshold * 2), 1.0)
+                })
+        
+        # Amount patterns over the ring buffer
+        if stats["buffer_size"] >= MIN_ROUND_AMOUNT_SAMPLE and state.round_amounts / stats["buffer_size"] > 0.8:
+            patterns.append({
+                "type": "round_amount_pattern",
+                "pattern": "excessive_round_amounts",
+                "percentage": state.round_amounts / stats["buffer_size"],
+                "risk_score": 0.7
+            })
+        if state.near_threshold >= 3:
+            patterns.append({
+                "type": "structuring_pattern",
+                "pattern": "amounts_below_threshold",
+                "count": state.near_threshold,
+                "threshold": STRUCTURING_THRESHOLD,
+                "risk_score": 0.8
+            })
+        
+        # Location change since the previous transaction (unknown for late arrivals)
+        location = transaction.get("location")
+        previous_location = stats["previous_location"]
+        if location and previous_location and location != previous_location and not stats["out_of_order"]:
+            time_diff = transaction.get("timestamp", 0) - stats["previous_timestamp"]
+            travel = self.pattern_detector.travel_check(previous_location, location, time_diff)
+            if travel:
+                patterns.append(travel)
+        
+        # Behavioral analysis, falling back to the running average amount
+        if not user_profile and stats["history_count"] >= 10:
+            user_profile = {"average_transaction_amount": stats["average_amount"]}
+        if user_profile:
+            patterns.extend(self.pattern_detector.detect_behavioral_anomalies(user_profile, transaction))
+        
+        results["state_summary"] = {
+            "transactions_seen": state.count,
+            "buffer_size": stats["buffer_size"],
+            "out_of_order": stats["out_of_order"],
+            "window_counts": {str(window): w["count"] for window, w in stats["windows"].items()}
+        }
+        results["risk_assessment"] = self.risk_scorer.calculate_risk_score(patterns)
+        
+        return results
+
 # Global fraud detection engine
 fraud_detector = FraudDetectionEngine()
\ No newline at end of file
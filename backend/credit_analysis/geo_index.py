@@ -0,0 +1,155 @@
+"""Gazetteer Lookup and Vectorized Impossible-Travel Detection"""
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Union
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "gazetteer.csv")
+
+def haversine_km(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km between coordinate arrays (degrees)"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+class Gazetteer:
+    """Location name to coordinate lookup, loaded once and memory-mapped
+
+    The CSV source (name, latitude, longitude) is compiled to a float64
+    ``.npy`` cache on first use; later loads map that file read-only so
+    every worker shares the same pages.
+    """
+
+    def __init__(self, path: str = DEFAULT_GAZETTEER_PATH, cache_dir: Optional[str] = None):
+        self.path = path
+        self.cache_dir = cache_dir or os.getenv("GEO_CACHE_DIR", tempfile.gettempdir())
+        self._index: Optional[pd.Index] = None
+        self._coords: Optional[np.ndarray] = None
+
+    @staticmethod
+    def normalize(names: pd.Series) -> pd.Series:
+        return names.astype("string").str.strip().str.lower()
+
+    def _load(self):
+        """Read names and map the coordinate table"""
+        table = pd.read_csv(self.path)
+        self._index = pd.Index(self.normalize(table["name"]))
+
+        cache_path = os.path.join(
+            self.cache_dir, f"gazetteer_{int(os.path.getmtime(self.path))}_{len(table)}.npy"
+        )
+        coords = table[["latitude", "longitude"]].to_numpy(dtype=np.float64)
+        try:
+            try:
+                self._coords = np.load(cache_path, mmap_mode="r")
+                if self._coords.shape != coords.shape:
+                    raise ValueError(f"shape {self._coords.shape}, expected {coords.shape}")
+            except (FileNotFoundError, ValueError) as e:
+                if not isinstance(e, FileNotFoundError):
+                    logger.warning(f"Gazetteer cache {cache_path} is corrupt, rebuilding: {e}")
+                self._save_cache(cache_path, coords)
+                self._coords = np.load(cache_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Gazetteer cache unavailable, keeping coordinates in memory: {e}")
+            self._coords = coords
+
+    def _save_cache(self, cache_path: str, coords: np.ndarray):
+        """Write the cache atomically, so concurrent workers never map a partial file"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".npy.tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.save(file, coords)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @property
+    def coords(self) -> np.ndarray:
+        if self._coords is None:
+            self._load()
+        return self._coords
+
+    @property
+    def index(self) -> pd.Index:
+        if self._index is None:
+            self._load()
+        return self._index
+
+    def lookup(self, names: Union[pd.Series, List[Optional[str]]]) -> np.ndarray:
+        """(n, 2) latitude/longitude array; NaN for unknown or missing names"""
+        # Normalize each distinct name once, then broadcast back to the rows
+        codes, uniques = pd.factorize(pd.Series(names, dtype="object"))
+        unique_positions = self.index.get_indexer(self.normalize(pd.Series(uniques, dtype="object")))
+        positions = np.where(codes >= 0, unique_positions[codes], -1)
+        result = np.full((len(codes), 2), np.nan)
+        known = positions >= 0
+        result[known] = self.coords[positions[known]]
+        return result
+
+    def locate(self, name: Optional[str]) -> Optional[np.ndarray]:
+        """Coordinates of a single location name, or None if unknown"""
+        coords = self.lookup([name])[0]
+        return None if np.isnan(coords).any() else coords
+
+def detect_impossible_travel(transactions: Union[pd.DataFrame, List[Dict[str, Any]]],
+                             max_speed_kmh: float = 900.0,
+                             gazetteer: Optional[Gazetteer] = None) -> pd.DataFrame:
+    """Flag consecutive transactions per user that imply travel faster than ``max_speed_kmh``
+
+    Transactions are sorted by (user_id, timestamp); coordinates come from
+    ``latitude``/``longitude`` columns when present, otherwise from the
+    gazetteer via ``location``. Transactions with an unknown location are skipped.
+    Returns one row per flagged pair.
+    """
+    df = transactions if isinstance(transactions, pd.DataFrame) else pd.DataFrame(transactions)
+    columns = ["user_id", "from_transaction_id", "to_transaction_id", "from_location",
+               "to_location", "time_difference", "distance_km", "speed_kmh"]
+    if len(df) < 2:
+        return pd.DataFrame(columns=columns)
+
+    gazetteer = gazetteer or default_gazetteer
+    users = df["user_id"].to_numpy() if "user_id" in df.columns else np.zeros(len(df))
+    timestamps = df["timestamp"].to_numpy(dtype=np.float64)
+    locations = df["location"].to_numpy(dtype=object) if "location" in df.columns else np.full(len(df), None)
+    ids = df["id"].to_numpy(dtype=object) if "id" in df.columns else np.arange(len(df))
+
+    if {"latitude", "longitude"} <= set(df.columns):
+        coords = df[["latitude", "longitude"]].to_numpy(dtype=np.float64)
+    else:
+        coords = gazetteer.lookup(locations)
+
+    # Only rows with coordinates take part; sort them by user, then time,
+    # so consecutive rows of the same user form a pair
+    user_codes = pd.factorize(users)[0]
+    located = np.flatnonzero(~np.isnan(coords).any(axis=1))
+    order = located[np.lexsort((timestamps[located], user_codes[located]))]
+    same_user = user_codes[order][1:] == user_codes[order][:-1]
+    prev, curr = order[:-1][same_user], order[1:][same_user]
+
+    distance = haversine_km(coords[prev, 0], coords[prev, 1], coords[curr, 0], coords[curr, 1])
+    elapsed = timestamps[curr] - timestamps[prev]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(elapsed > 0, distance / (elapsed / 3600), np.where(distance > 0, np.inf, 0.0))
+
+    flagged = np.flatnonzero(np.nan_to_num(speed, nan=0.0) > max_speed_kmh)
+    prev, curr = prev[flagged], curr[flagged]
+
+    return pd.DataFrame({
+        "user_id": users[curr],
+        "from_transaction_id": ids[prev],
+        "to_transaction_id": ids[curr],
+        "from_location": locations[prev],
+        "to_location": locations[curr],
+        "time_difference": elapsed[flagged],
+        "distance_km": distance[flagged],
+        "speed_kmh": speed[flagged]
+    }, columns=columns)
+
+# Global gazetteer (loaded lazily on first lookup)
+default_gazetteer = Gazetteer()
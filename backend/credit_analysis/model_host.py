@@ -0,0 +1,304 @@
+"""Shared NLP Model Host for Document Analysis"""
+import contextlib
+import logging
+import multiprocessing
+import os
+import secrets
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from typing import Dict, Any, Callable, Iterable, Optional, Union, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Transformer pipelines used by the document analyzer: {name: (task, model)}
+PIPELINE_SPECS = {
+    "classifier": ("text-classification", "distilbert-base-uncased-finetuned-sst-2-english"),
+    "ner": ("ner", "dbmdz/bert-large-cased-finetuned-conll03-english")
+}
+HOST_SOCKET_NAME = "model-host.sock"
+
+_torch_configured = False
+
+def inference_threads() -> int:
+    """Intra-op threads per process for model inference (NLP_TORCH_THREADS, default half the CPUs)"""
+    return int(os.getenv("NLP_TORCH_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+def configure_torch():
+    """CPU thread settings for inference, applied once per process (NLP_TORCH_THREADS)"""
+    global _torch_configured
+    if _torch_configured:
+        return
+    _torch_configured = True
+    try:
+        import torch
+    except ImportError:
+        return
+
+    # Intra-op threads do the matmuls; one inter-op thread avoids oversubscription
+    # when several workers share the machine
+    torch.set_num_threads(inference_threads())
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set, or parallel work has started
+
+def inference_context():
+    """``torch.inference_mode()`` when torch is installed"""
+    try:
+        import torch
+    except ImportError:
+        return contextlib.nullcontext()
+    return torch.inference_mode()
+
+def load_pipelines(names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Load transformer pipelines in this process; missing entries if unavailable
+
+    With NLP_BACKEND=auto (default) a pipeline exported by
+    ``scripts/export_onnx_models.py`` runs on ONNX Runtime, anything else
+    on PyTorch; ``onnx`` or ``torch`` force one backend.
+    """
+    from .onnx_backend import load_onnx_pipeline, nlp_backend
+
+    pipelines = {}
+    try:
+        from transformers import pipeline
+    except ImportError:
+        logger.warning("transformers not installed, document NLP models disabled")
+        return pipelines
+
+    configure_torch()
+    backend = nlp_backend()
+
+    for name in names or PIPELINE_SPECS:
+        task, model = PIPELINE_SPECS[name]
+        if backend != "torch":
+            onnx_pipeline = load_onnx_pipeline(name)
+            if onnx_pipeline is not None:
+                logger.info(f"Loaded {name} pipeline on ONNX Runtime")
+                pipelines[name] = onnx_pipeline
+                continue
+            if backend == "onnx":
+                logger.warning(f"NLP_BACKEND=onnx but no usable ONNX export for {name}, falling back to PyTorch")
+        try:
+            pipelines[name] = pipeline(task, model=model)
+        except Exception as e:
+            logger.warning(f"Could not load {name} pipeline ({model}): {e}")
+    return pipelines
+
+def _parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """``host:port`` for TCP on loopback, anything else is a Unix socket path"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit() and os.sep not in address:
+        return host, int(port)
+    return address
+
+class PipelineServer:
+    """Serve pipeline calls to local clients, one thread per connection
+
+    Connections are accepted as soon as the listener is up; calls wait
+    until ``load()`` has finished so workers can connect while the
+    models are still loading.
+    """
+
+    def __init__(self, listener: Listener, loader: Callable[[], Dict[str, Any]] = load_pipelines):
+        self.listener = listener
+        self.loader = loader
+        self.pipelines: Dict[str, Any] = {}
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the pipelines and release waiting calls"""
+        try:
+            self.pipelines = self.loader()
+        finally:
+            self._loaded.set()
+
+    def serve_forever(self):
+        """Accept client connections until the listener is closed"""
+        while True:
+            try:
+                connection = self.listener.accept()
+            except AuthenticationError as e:
+                logger.warning(f"Rejected model host client: {e}")
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection):
+        """Answer ``(name, args, kwargs)`` requests with ``(status, payload)``"""
+        with connection:
+            while True:
+                try:
+                    name, args, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    return
+
+                self._loaded.wait()
+                if name == "__available__":
+                    connection.send(("ok", sorted(self.pipelines)))
+                    continue
+
+                try:
+                    # Pipelines are not safe to call concurrently
+                    with self._lock, inference_context():
+                        result = self.pipelines[name](*args, **kwargs)
+                    connection.send(("ok", result))
+                except Exception as e:
+                    connection.send(("error", f"{type(e).__name__}: {e}"))
+
+def _run_host(address: str, authkey: bytes, ready):
+    """Model host process entry point"""
+    parsed = _parse_address(address)
+    if isinstance(parsed, str) and os.path.lexists(parsed):
+        # Only ever replace a stale socket, never a file someone put in its place
+        if not stat.S_ISSOCK(os.lstat(parsed).st_mode):
+            raise RuntimeError(f"Model host address {parsed} exists and is not a socket")
+        os.unlink(parsed)
+
+    with Listener(parsed, authkey=authkey) as listener:
+        server = PipelineServer(listener)
+        accept_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        accept_thread.start()
+        ready.set()
+        server.load()
+        logger.info(f"Model host serving {sorted(server.pipelines)} on {address}")
+        accept_thread.join()
+
+class SharedModelHost:
+    """Run the transformer pipelines once, in a dedicated process, for all workers
+
+    ``start()`` is meant for the gunicorn master: it spawns the host and
+    exports ``MODEL_HOST_ADDRESS``/``MODEL_HOST_AUTHKEY`` so the forked
+    workers route inference to it instead of loading their own copies.
+    Without ``MODEL_HOST_ADDRESS`` the socket goes in a fresh 0700
+    directory, so no other user can predict or pre-create its path.
+    """
+
+    def __init__(self, address: Optional[str] = None, authkey: Optional[str] = None):
+        self.address = address or os.getenv("MODEL_HOST_ADDRESS")
+        self.authkey = authkey or os.getenv("MODEL_HOST_AUTHKEY") or secrets.token_hex(16)
+        self.process = None
+        self._runtime_dir = None
+
+    def start(self, timeout: float = 30.0):
+        """Spawn the host process and wait until it accepts connections"""
+        if self.process is not None and self.process.is_alive():
+            return
+        if not self.address:
+            self._runtime_dir = tempfile.mkdtemp(prefix="neocred-model-host-")
+            self.address = os.path.join(self._runtime_dir, HOST_SOCKET_NAME)
+
+        # Spawn rather than fork: the parent may already hold threads or torch state
+        context = multiprocessing.get_context("spawn")
+        ready = context.Event()
+        self.process = context.Process(
+            target=_run_host, args=(self.address, self.authkey.encode(), ready),
+            name="neocred-model-host", daemon=True
+        )
+        self.process.start()
+        deadline = time.monotonic() + timeout
+        while not ready.wait(0.1):
+            if not self.process.is_alive():
+                raise RuntimeError(f"Model host exited during startup (code {self.process.exitcode})")
+            if time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"Model host did not start within {timeout}s")
+
+        os.environ["MODEL_HOST_ADDRESS"] = self.address
+        os.environ["MODEL_HOST_AUTHKEY"] = self.authkey
+        logger.info(f"Shared model host started (pid {self.process.pid}) on {self.address}")
+
+    def stop(self):
+        """Terminate the host process"""
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(timeout=5)
+            self.process = None
+        os.environ.pop("MODEL_HOST_ADDRESS", None)
+        if self._runtime_dir is not None:
+            shutil.rmtree(self._runtime_dir, ignore_errors=True)
+            self._runtime_dir = None
+            self.address = None
+
+class ModelHostClient:
+    """Connection to the shared model host, one per thread"""
+
+    def __init__(self, address: str, authkey: str, timeout: Optional[float] = None):
+        self.address = _parse_address(address)
+        self.authkey = authkey.encode()
+        self.timeout = timeout if timeout is not None else float(os.getenv("MODEL_HOST_TIMEOUT_SECONDS", "120"))
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections are never shared across threads or forked processes
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.connection = Client(self.address, authkey=self.authkey)
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _reset(self):
+        connection = getattr(self._local, "connection", None)
+        self._local.pid = None
+        if connection is not None:
+            connection.close()
+
+    def call(self, name: str, *args, **kwargs) -> Any:
+        """Run a pipeline in the host and return its result"""
+        try:
+            connection = self._connection()
+            connection.send((name, args, kwargs))
+            if not connection.poll(self.timeout):
+                raise TimeoutError(f"Model host did not answer within {self.timeout}s")
+            status, payload = connection.recv()
+        except (OSError, EOFError, AuthenticationError) as e:
+            self._reset()
+            raise ConnectionError(f"Model host unavailable: {e}") from e
+
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def available_pipelines(self) -> list:
+        """Names of the pipelines the host managed to load"""
+        return self.call("__available__")
+
+class RemotePipeline:
+    """Callable stand-in for a pipeline that runs in the shared model host"""
+
+    def __init__(self, client: ModelHostClient, name: str):
+        self.client = client
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        return self.client.call(self.name, *args, **kwargs)
+
+_host_client: Optional[ModelHostClient] = None
+_host_pipelines: Optional[list] = None
+_client_lock = threading.Lock()
+
+def resolve_pipeline(name: str) -> Optional[Any]:
+    """Pipeline for this process: a proxy to the shared host when one is configured, else loaded locally"""
+    global _host_client, _host_pipelines
+    address = os.getenv("MODEL_HOST_ADDRESS")
+
+    if address:
+        with _client_lock:
+            try:
+                if _host_client is None:
+                    client = ModelHostClient(address, os.getenv("MODEL_HOST_AUTHKEY", ""))
+                    _host_pipelines = client.available_pipelines()
+                    _host_client = client
+                return RemotePipeline(_host_client, name) if name in _host_pipelines else None
+            except ConnectionError as e:
+                logger.warning(f"Shared model host unavailable, loading {name} in-process: {e}")
+
+    return load_pipelines([name]).get(name)
+
+# Global model host (started from the gunicorn master when NLP_SHARED_MODEL_HOST=true)
+shared_model_host = SharedModelHost()
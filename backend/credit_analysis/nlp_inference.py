@@ -0,0 +1,231 @@
+"""Micro-batched Transformer Inference for Document NLP"""
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Dict, Any, List, Optional, Tuple
+from .model_host import inference_context
+
+logger = logging.getLogger(__name__)
+
+class TokenWindowChunker:
+    """Split long texts into overlapping windows of at most ``max_tokens`` tokens
+
+    Uses the model's own tokenizer offsets when transformers is installed;
+    otherwise falls back to whitespace words, with half the window size to
+    leave room for sub-word splits.
+    """
+
+    def __init__(self, model_name: Optional[str], max_tokens: int = 510, stride: int = 64):
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.stride = min(stride, max_tokens // 2)
+        self._tokenizer = None
+        self._tokenizer_loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        if not self._tokenizer_loaded:
+            with self._lock:
+                if not self._tokenizer_loaded:
+                    if self.model_name:
+                        try:
+                            from transformers import AutoTokenizer
+                            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                        except Exception as e:
+                            logger.warning(f"Tokenizer for {self.model_name} unavailable, chunking by words: {e}")
+                    self._tokenizer_loaded = True
+        return self._tokenizer
+
+    def chunk(self, text: str) -> List[Tuple[int, str]]:
+        """(character offset, chunk text) windows covering ``text``"""
+        tokenizer = self.tokenizer
+        if tokenizer is not None:
+            offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+            window = self.max_tokens
+        else:
+            offsets = [match.span() for match in re.finditer(r"\S+", text)]
+            window = self.max_tokens // 2
+
+        if len(offsets) <= window:
+            return [(0, text)]
+
+        chunks = []
+        step = window - min(self.stride, window // 2)
+        for start in range(0, len(offsets), step):
+            tokens = offsets[start:start + window]
+            begin, end = tokens[0][0], tokens[-1][1]
+            chunks.append((begin, text[begin:end]))
+            if start + window >= len(offsets):
+                break
+        return chunks
+
+class BatchedPipeline:
+    """Group text chunks from concurrent callers into batched pipeline calls
+
+    Callers (document analyses running in threads) block on futures while a
+    single worker thread collects chunks for up to ``max_wait_ms`` or
+    ``max_batch_size`` chunks, sorts them by length to limit padding, and runs
+    one pipeline call under ``torch.inference_mode``. Every future is
+    settled, whatever goes wrong in a batch, and callers give up after
+    ``result_timeout`` seconds.
+    """
+
+    def __init__(self, pipeline, chunker: TokenWindowChunker, merge_entities: bool = False,
+                 max_batch_size: int = 16, max_wait_ms: float = 10.0, result_timeout: float = 120.0):
+        self.pipeline = pipeline
+        self.chunker = chunker
+        self.merge_entities = merge_entities
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.result_timeout = result_timeout
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self.metrics = {
+            "chunks_total": 0,
+            "batches_total": 0,
+            "errors_total": 0,
+            "timeouts_total": 0,
+            "inference_seconds": 0.0,
+            "last_batch_size": 0
+        }
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="nlp-batcher", daemon=True)
+                    self._worker.start()
+
+    def __call__(self, text: str) -> List[Any]:
+        """Run the pipeline over ``text`` in token windows
+
+        Entity pipelines return one merged entity list with offsets into the
+        full text; other pipelines return one prediction per chunk. Raises
+        ``TimeoutError`` when the results take longer than ``result_timeout``.
+        """
+        chunks = self.chunker.chunk(text)
+        self._ensure_worker()
+        futures = []
+        for _, chunk in chunks:
+            future = Future()
+            self._queue.put((chunk, future))
+            futures.append(future)
+
+        deadline = time.monotonic() + self.result_timeout
+        try:
+            results = [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+        except TimeoutError:
+            self.metrics["timeouts_total"] += 1
+            # Chunks still queued are skipped by the worker
+            for future in futures:
+                future.cancel()
+            raise
+
+        if not self.merge_entities:
+            return results
+        return self._merge_entities(chunks, results)
+
+    @staticmethod
+    def _merge_entities(chunks: List[Tuple[int, str]], results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Shift entity offsets to the full text and drop duplicates from window overlaps"""
+        merged, seen = [], set()
+        for (offset, _), entities in zip(chunks, results):
+            for entity in entities:
+                entity = dict(entity)
+                if "start" in entity:
+                    entity["start"] += offset
+                    entity["end"] += offset
+                key = (entity.get("start"), entity.get("entity", entity.get("entity_group")))
+                if key[0] is not None and key in seen:
+                    continue
+                seen.add(key)
+                merged.append(entity)
+        return merged
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """Worker loop: one padded pipeline call per batch"""
+        while True:
+            batch = [item for item in self._collect() if not item[1].cancelled()]
+            if not batch:
+                continue
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                logger.error(f"NLP batch of {len(batch)} chunks failed: {e}")
+                self.metrics["errors_total"] += len(batch)
+                for _, future in batch:
+                    try:
+                        future.set_exception(e)
+                    except InvalidStateError:
+                        pass  # already settled or cancelled
+
+    def _run_batch(self, batch: List[Tuple[str, Future]]):
+        # Similar lengths together keep padding (wasted compute) low
+        order = sorted(range(len(batch)), key=lambda i: len(batch[i][0]))
+        texts = [batch[i][0] for i in order]
+
+        started = time.perf_counter()
+        with inference_context():
+            outputs = self.pipeline(texts, batch_size=len(texts))
+        if len(outputs) != len(texts):
+            raise RuntimeError(f"Pipeline returned {len(outputs)} outputs for {len(texts)} inputs")
+
+        for position, index in enumerate(order):
+            try:
+                batch[index][1].set_result(outputs[position])
+            except InvalidStateError:
+                pass  # cancelled by a caller that timed out
+        self._record_batch(len(batch), time.perf_counter() - started)
+
+    def _record_batch(self, size: int, seconds: float):
+        self.metrics["chunks_total"] += size
+        self.metrics["batches_total"] += 1
+        self.metrics["inference_seconds"] += seconds
+        self.metrics["last_batch_size"] = size
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Throughput counters; chunks_per_sec is measured over inference time only"""
+        seconds = self.metrics["inference_seconds"]
+        batches = self.metrics["batches_total"]
+        return {
+            **self.metrics,
+            "chunks_per_sec": self.metrics["chunks_total"] / seconds if seconds else 0.0,
+            "average_batch_size": self.metrics["chunks_total"] / batches if batches else 0.0,
+            "queue_depth": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "result_timeout": self.result_timeout
+        }
+
+def create_batched_pipeline(pipeline, model_name: str, merge_entities: bool) -> BatchedPipeline:
+    """BatchedPipeline configured from NLP_* environment settings"""
+    chunker = TokenWindowChunker(
+        model_name,
+        max_tokens=int(os.getenv("NLP_MAX_TOKENS", "510")),
+        stride=int(os.getenv("NLP_CHUNK_STRIDE", "64"))
+    )
+    return BatchedPipeline(
+        pipeline, chunker, merge_entities=merge_entities,
+        max_batch_size=int(os.getenv("NLP_BATCH_MAX_SIZE", "16")),
+        max_wait_ms=float(os.getenv("NLP_BATCH_MAX_WAIT_MS", "10")),
+        result_timeout=float(os.getenv("NLP_RESULT_TIMEOUT_SECONDS", "120"))
+    )
@@ -0,0 +1,107 @@
+"""ONNX Runtime Backend for the Document NLP Pipelines"""
+import json
+import logging
+import os
+from typing import Dict, Any, Optional
+from .model_host import PIPELINE_SPECS, inference_threads
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "onnx")
+MANIFEST_FILE = "neocred_export.json"
+QUANTIZED_FILE = "model_quantized.onnx"
+BACKENDS = ("auto", "onnx", "torch")
+
+# optimum ORTModel class per pipeline task
+ORT_MODEL_CLASSES = {
+    "text-classification": "ORTModelForSequenceClassification",
+    "ner": "ORTModelForTokenClassification"
+}
+
+def onnx_model_dir(name: str, base_dir: Optional[str] = None) -> str:
+    """Export directory of a pipeline (NLP_ONNX_DIR, default backend/models/onnx)"""
+    return os.path.join(base_dir or os.getenv("NLP_ONNX_DIR", DEFAULT_ONNX_DIR), name)
+
+def nlp_backend() -> str:
+    """Configured inference backend (NLP_BACKEND): auto, onnx or torch"""
+    backend = os.getenv("NLP_BACKEND", "auto").lower()
+    if backend not in BACKENDS:
+        logger.warning(f"Unknown NLP_BACKEND {backend!r}, using auto")
+        return "auto"
+    return backend
+
+def read_manifest(name: str, base_dir: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Export manifest of a pipeline, or None when it was not exported for the current model"""
+    try:
+        with open(os.path.join(onnx_model_dir(name, base_dir), MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    # A stale export of a different model must not silently replace it
+    task, model = PIPELINE_SPECS[name]
+    if manifest.get("task") != task or manifest.get("model") != model:
+        logger.warning(f"ONNX export for {name} is for {manifest.get('model')}, expected {model}; ignoring it")
+        return None
+    return manifest
+
+def export_pipeline(name: str, base_dir: Optional[str] = None, quantize: bool = True,
+                    isa: str = "avx512_vnni") -> Dict[str, Any]:
+    """Export a pipeline's model to ONNX, optionally with dynamic int8 quantization
+
+    Requires ``optimum[onnxruntime]``. ``isa`` selects the quantization
+    kernels: avx2, avx512, avx512_vnni or arm64. Returns the manifest.
+    """
+    import optimum.onnxruntime as ort
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    task, model_id = PIPELINE_SPECS[name]
+    output_dir = onnx_model_dir(name, base_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    model = getattr(ort, ORT_MODEL_CLASSES[task]).from_pretrained(model_id, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_id).save_pretrained(output_dir)
+
+    file_name = "model.onnx"
+    if quantize:
+        # Dynamic quantization: int8 weights, activation scales computed at
+        # runtime, so no calibration data is needed
+        quantizer = ort.ORTQuantizer.from_pretrained(model)
+        config = getattr(AutoQuantizationConfig, isa)(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=output_dir, quantization_config=config)
+        file_name = QUANTIZED_FILE
+
+    manifest = {"task": task, "model": model_id, "file_name": file_name, "quantized": quantize,
+                "isa": isa if quantize else None}
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+    logger.info(f"Exported {name} ({model_id}) to {output_dir}/{file_name}")
+    return manifest
+
+def load_onnx_pipeline(name: str, base_dir: Optional[str] = None) -> Optional[Any]:
+    """Transformers pipeline over the exported ONNX model, or None if not exported or unavailable"""
+    manifest = read_manifest(name, base_dir)
+    if manifest is None:
+        return None
+    try:
+        import onnxruntime
+        import optimum.onnxruntime as ort
+        from transformers import AutoTokenizer, pipeline
+    except ImportError:
+        logger.warning(f"ONNX export for {name} found but optimum[onnxruntime] is not installed")
+        return None
+
+    model_dir = onnx_model_dir(name, base_dir)
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = inference_threads()
+    session_options.inter_op_num_threads = 1
+    try:
+        model = getattr(ort, ORT_MODEL_CLASSES[manifest["task"]]).from_pretrained(
+            model_dir, file_name=manifest["file_name"], session_options=session_options
+        )
+        return pipeline(manifest["task"], model=model, tokenizer=AutoTokenizer.from_pretrained(model_dir))
+    except Exception as e:
+        logger.warning(f"Could not load ONNX {name} pipeline from {model_dir}: {e}")
+        return None
@@ -0,0 +1,173 @@
+"""Dynamic Micro-batching for Concurrent Risk Model Predictions"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from monitoring.prometheus import track_model_batch
+from .risk_models import CreditRiskModel, credit_risk_model
+
+class PredictionBatcher:
+    """Collect concurrent single-row predictions into one vectorized model call
+
+    Requests are queued with a future each. A collector task waits up to
+    ``max_wait_ms`` (or until ``max_batch_size`` rows are queued), scores the
+    batch with one ``predict_many`` call in a worker thread and resolves the
+    futures. While a batch is being scored, new requests keep queueing, so
+    batch size grows with load. Whatever goes wrong with a batch, its
+    futures are failed and the collector carries on; if the task has died
+    anyway, the next ``predict`` restarts it on the same queue.
+    """
+
+    def __init__(self, model: CreditRiskModel, max_wait_ms: float = 2.0, max_batch_size: int = 64):
+        self.model = model
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.metrics = {
+            "batches_total": 0,
+            "predictions_total": 0,
+            "errors_total": 0,
+            "max_batch_size_seen": 0,
+            "last_batch_size": 0,
+            "last_batch_latency_ms": 0.0
+        }
+
+    def _ensure_worker(self):
+        """Start the collector task on the running event loop"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prediction-batcher")
+        
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            # Requests already queued are picked up by the new task
+            self._worker = loop.create_task(self._run())
+
+    async def predict(self, record: Dict[str, Any]) -> float:
+        """Queue one applicant record and wait for its default probability"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((record, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Dict[str, Any], asyncio.Future]]:
+        """Wait for the first request, then gather more until the deadline or size cap"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Drain anything already queued without waiting further
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        return batch
+
+    def _predict_batch(self, records: List[Dict[str, Any]]) -> List[Any]:
+        """Score a batch; on failure isolate the bad rows so other requests still succeed"""
+        try:
+            return self.model.predict_many(records).tolist()
+        except Exception:
+            results = []
+            for record in records:
+                try:
+                    results.append(self.model.predict_one(record))
+                except Exception as e:
+                    results.append(e)
+            return results
+
+    async def _run(self):
+        """Collector loop: one model call per batch, fan results back out"""
+        while True:
+            batch = await self._collect()
+            pending = [(record, future) for record, future in batch if not future.cancelled()]
+            if not pending:
+                continue
+            try:
+                await self._score(pending)
+            except Exception as e:
+                # Never leave a caller waiting on a batch that went wrong
+                for _, future in pending:
+                    if not future.done():
+                        self.metrics["errors_total"] += 1
+                        future.set_exception(e)
+
+    async def _score(self, pending: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        started = time.perf_counter()
+        records = [record for record, _ in pending]
+        try:
+            results = await self._loop.run_in_executor(self._executor, self._predict_batch, records)
+        except Exception as e:
+            results = [e] * len(pending)
+        if len(results) != len(pending):
+            raise RuntimeError(f"Model returned {len(results)} predictions for {len(pending)} records")
+
+        for (_, future), result in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                self.metrics["errors_total"] += 1
+                future.set_exception(result)
+            else:
+                future.set_result(float(result))
+
+        self._record_batch(len(pending), time.perf_counter() - started)
+
+    def _record_batch(self, size: int, latency: float):
+        """Update batch statistics"""
+        self.metrics["batches_total"] += 1
+        self.metrics["predictions_total"] += size
+        self.metrics["last_batch_size"] = size
+        self.metrics["max_batch_size_seen"] = max(self.metrics["max_batch_size_seen"], size)
+        self.metrics["last_batch_latency_ms"] = latency * 1000
+        track_model_batch(size, self.queue_depth)
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests waiting to be batched"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Batcher settings and counters"""
+        batches = self.metrics["batches_total"]
+        return {
+            **self.metrics,
+            "queue_depth": self.queue_depth,
+            "average_batch_size": self.metrics["predictions_total"] / batches if batches else 0.0,
+            "max_wait_ms": self.max_wait_ms,
+            "max_batch_size": self.max_batch_size
+        }
+
+    async def close(self):
+        """Stop the collector task and worker thread"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+# Global batcher in front of the credit risk model
+prediction_batcher = PredictionBatcher(
+    credit_risk_model,
+    max_wait_ms=float(os.getenv("MODEL_BATCH_MAX_WAIT_MS", "2")),
+    max_batch_size=int(os.getenv("MODEL_BATCH_MAX_SIZE", "64"))
+)
@@ -1,15 +1,89 @@
 """Recommendation Engine for Personalized Credit Improvement"""
 import numpy as np
 import pandas as pd
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Callable, Mapping
 from datetime import datetime, timedelta
+import operator
 import json
+import re
+
+# Comparison operators allowed in rule conditions
+CONDITION_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne
+}
+# Names bound to the value of the metric a rule belongs to
+METRIC_VALUE_NAMES = ("ratio", "rate")
+CONDITION_TOKEN = re.compile(r"\s*(?:(<=|>=|==|!=|<|>)|(\d+(?:\.\d*)?|\.\d+)|([A-Za-z_]\w*))")
+
+def _tokenize_condition(condition: str) -> List[Tuple[str, Any]]:
+    """Split a condition such as ``0.36 < ratio <= 0.5`` into typed tokens"""
+    tokens, position = [], 0
+    condition = condition.strip()
+    while position < len(condition):
+        match = CONDITION_TOKEN.match(condition, position)
+        if not match:
+            raise ValueError(f"Invalid rule condition {condition!r} at position {position}")
+        op, number, name = match.groups()
+        if op:
+            tokens.append(("op", op))
+        elif number:
+            tokens.append(("number", float(number)))
+        else:
+            tokens.append(("name", name))
+        position = match.end()
+    return tokens
+
+def compile_condition(condition: str) -> Callable[[Any, Mapping[str, Any]], Any]:
+    """Compile a chained comparison into a predicate ``(value, data) -> bool``
+    
+    ``value`` is the metric value (``ratio``/``rate`` in the condition) and other
+    names are looked up in ``data`` (default 0). Both may be scalars or NumPy
+    arrays; with arrays the predicate returns a boolean mask.
+    """
+    tokens = _tokenize_condition(condition)
+    if len(tokens) < 3 or len(tokens) % 2 == 0:
+        raise ValueError(f"Invalid rule condition {condition!r}")
+    
+    operands = []
+    for kind, token in tokens[::2]:
+        if kind == "number":
+            operands.append(lambda value, data, constant=token: constant)
+        elif kind == "name" and token in METRIC_VALUE_NAMES:
+            operands.append(lambda value, data: value)
+        elif kind == "name":
+            operands.append(lambda value, data, field=token: data.get(field, 0))
+        else:
+            raise ValueError(f"Invalid rule condition {condition!r}: expected operand, got {token!r}")
+    
+    comparisons = []
+    for kind, token in tokens[1::2]:
+        if kind != "op":
+            raise ValueError(f"Invalid rule condition {condition!r}: expected operator, got {token!r}")
+        comparisons.append(CONDITION_OPERATORS[token])
+    
+    def predicate(value, data):
+        # a < b <= c  ->  (a < b) & (b <= c)
+        left = operands[0](value, data)
+        result = True
+        for compare, operand in zip(comparisons, operands[1:]):
+            right = operand(value, data)
+            result = result & compare(left, right)
+            left = right
+        return result
+    
+    return predicate
 
 class CreditRecommendationEngine:
     """Generate personalized credit improvement recommendations"""
     
     def __init__(self):
         self.recommendation_rules = self._load_recommendation_rules()
+        self.compiled_rules = self._compile_rules(self.recommendation_rules)
         self.priority_weights = {
             "critical": 1.0,
             "high": 0.8,
@@ -142,6 +216,13 @@ class CreditRecommendationEngine:
             }
         }
     
+    def _compile_rules(self, rules: Dict[str, Any]) -> Dict[str, List[Tuple[Dict[str, Any], Callable]]]:
+        """Parse every rule condition once into a predicate"""
+        return {
+            metric: [(rule, compile_condition(rule["condition"])) for rule in metric_rules.get("recommendations", [])]
+            for metric, metric_rules in rules.items()
+        }
+    
     def analyze_credit_profile(self, financial_data: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze credit profile and identify improvement areas"""
         analysis = {
@@ -202,44 +283,29 @@ class CreditRecommendationEngine:
         """Get recommendations for a specific metric"""
         recommendations = []
         
-        if metric not in self.recommendation_rules:
-            return recommendations
-        
-        rules = self.recommendation_rules[metric]
-        
-        for rule in rules.get("recommendations", []):
-            condition = rule["condition"]
-            
+        for rule, predicate in self.compiled_rules.get(metric, []):
             # Evaluate condition
-            if self._evaluate_condition(condition, value, financial_data):
-                recommendation = rule.copy()
-                recommendation["metric"] = metric
-                recommendation["current_value"] = value
-                recommendation["personalized_actions"] = self._personalize_actions(
-                    rule["actions"], financial_data
-                )
-                recommendations.append(recommendation)
+            if self._evaluate_condition(predicate, value, financial_data):
+                recommendations.append(self._build_recommendation(rule, metric, value, financial_data))
         
         return recommendations
     
-    def _evaluate_condition(self, condition: str, value: float, data: Dict[str, Any]) -> bool:
-        """Evaluate recommendation condition"""
+    def _build_recommendation(self, rule: Dict[str, Any], metric: str, value: float,
+                              financial_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a matched rule and personalize its actions"""
+        recommendation = rule.copy()
+        recommendation["metric"] = metric
+        recommendation["current_value"] = value
+        recommendation["personalized_actions"] = self._personalize_actions(
+            rule["actions"], financial_data
+        )
+        return recommendation
+    
+    def _evaluate_condition(self, predicate: Callable, value: float, data: Dict[str, Any]) -> bool:
+        """Evaluate a compiled recommendation condition"""
         try:
-            # Replace 'ratio' with actual value
-            condition = condition.replace("ratio", str(value))
-            
-            # Handle special conditions
-            if "missed_payments" in condition:
-                missed_payments = data.get("missed_payments", 0)
-                condition = condition.replace("missed_payments", str(missed_payments))
-            
-            if "credit_types" in condition:
-                credit_types = data.get("credit_types", 0)
-                condition = condition.replace("credit_types", str(credit_types))
-            
-            # Evaluate the condition
-            return eval(condition)
-        except:
+            return bool(predicate(value, data))
+        except (TypeError, ValueError):
             return False
     
     def _personalize_actions(self, actions: List[str], data: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -330,41 +396,28 @@ class CreditRecommendationEngine:
     
     def _calculate_overall_health(self, metrics: Dict[str, float]) -> str:
         """Calculate overall financial health"""
-        scores = []
-        
-        # Debt health (lower is better)
-        debt_ratio = metrics.get("debt_to_income", 0.5)
-        debt_score = max(0, 1 - debt_ratio)
-        scores.append(debt_score)
-        
-        # Credit utilization health (lower is better)
-        util_ratio = metrics.get("credit_utilization", 0.5)
-        util_score = max(0, 1 - util_ratio)
-        scores.append(util_score)
-        
-        # Savings health (higher is better)
-        savings_rate = metrics.get("savings_rate", 0.0)
-        savings_score = min(savings_rate * 5, 1.0)  # 20% savings = perfect score
-        scores.append(savings_score)
-        
-        # Payment history health
-        payment_score = metrics.get("payment_history_score", 0.8)
-        scores.append(payment_score)
-        
-        # Calculate average
-        if scores:
-            avg_score = np.mean(scores)
-            
-            if avg_score >= 0.8:
-                return "Excellent"
-            elif avg_score >= 0.6:
-                return "Good"
-            elif avg_score >= 0.4:
-                return "Fair"
-            else:
-                return "Needs Improvement"
-        
-        return "Unknown"
+        return str(self._calculate_overall_health_batch(
+            {name: np.array([value], dtype=float) for name, value in metrics.items()}, 1
+        )[0])
+    
+    def _calculate_overall_health_batch(self, metrics: Dict[str, np.ndarray], n: int) -> np.ndarray:
+        """Overall financial health labels for many profiles; NaN metrics use the defaults"""
+        def metric(name: str, default: float) -> np.ndarray:
+            values = metrics.get(name)
+            return np.full(n, default) if values is None else np.where(np.isnan(values), default, values)
+        
+        # Debt and utilization health (lower is better), savings health (higher is better)
+        debt_score = np.maximum(0, 1 - metric("debt_to_income", 0.5))
+        util_score = np.maximum(0, 1 - metric("credit_utilization", 0.5))
+        savings_score = np.minimum(metric("savings_rate", 0.0) * 5, 1.0)  # 20% savings = perfect score
+        payment_score = metric("payment_history_score", 0.8)
+        
+        avg_score = (debt_score + util_score + savings_score + payment_score) / 4
+        return np.select(
+            [avg_score >= 0.8, avg_score >= 0.6, avg_score >= 0.4],
+            ["Excellent", "Good", "Fair"],
+            default="Needs Improvement"
+        )
     
     def generate_action_plan(self, recommendations: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Generate prioritized action plan"""
@@ -436,5 +489,76 @@ class CreditRecommendationEngine:
             }
         }
 
+    def _calculate_key_metrics_batch(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Key metrics as float arrays; NaN where a profile lacks the inputs"""
+        def column(name: str) -> np.ndarray:
+            if name not in df.columns:
+                return np.full(len(df), np.nan)
+            return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)
+        
+        income, expenses = column("monthly_income"), column("monthly_expenses")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            savings_rate = np.where(income > 0, (income - expenses) / income, 0.0)
+        
+        metrics = {
+            "debt_to_income": column("total_debt") / (income * 12 + 1),
+            "credit_utilization": column("credit_used") / (column("credit_limit") + 1),
+            "savings_rate": np.where(np.isnan(income) | np.isnan(expenses), np.nan, savings_rate),
+            "payment_history_score": np.maximum(0, 1 - column("missed_payments") / 12),
+            "credit_mix_score": np.minimum(column("credit_types") / 5, 1.0)
+        }
+        return {name: values for name, values in metrics.items() if not np.isnan(values).all()}
+    
+    def get_personalized_recommendations_many(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Personalized recommendations for many profiles at once
+        
+        Metrics are computed column-wise and every compiled rule is evaluated
+        once as a NumPy mask over all profiles; only matched rules are
+        personalized per row. Output matches ``get_personalized_recommendations``.
+        """
+        n = len(df)
+        metrics = self._calculate_key_metrics_batch(df)
+        fields = {name: df[name].fillna(0).to_numpy() for name in df.columns}
+        
+        # One mask per (metric, rule) across all profiles
+        matches = []
+        for metric, values in metrics.items():
+            for rule, predicate in self.compiled_rules.get(metric, []):
+                try:
+                    mask = np.broadcast_to(predicate(values, fields), (n,)) & ~np.isnan(values)
+                except (TypeError, ValueError):
+                    continue
+                matches.append((metric, rule, mask))
+        
+        health = self._calculate_overall_health_batch(metrics, n)
+        records = df.to_dict("records")
+        generated_at = datetime.now().isoformat()
+        results = []
+        
+        for i, record in enumerate(records):
+            row_metrics = {name: float(values[i]) for name, values in metrics.items() if not np.isnan(values[i])}
+            improvement_areas = [
+                self._build_recommendation(rule, metric, row_metrics[metric], record)
+                for metric, rule, mask in matches if mask[i]
+            ]
+            analysis = {
+                "current_metrics": row_metrics,
+                "improvement_areas": improvement_areas,
+                "strengths": self._identify_strengths(row_metrics),
+                "overall_health": str(health[i])
+            }
+            results.append({
+                "analysis": analysis,
+                "action_plan": self.generate_action_plan(improvement_areas),
+                "generated_at": generated_at,
+                "user_profile": {
+                    "risk_level": analysis["overall_health"],
+                    "primary_focus_areas": [rec["metric"] for rec in improvement_areas[:3]],
+                    "strengths_count": len(analysis["strengths"])
+                }
+            })
+        
+        return results
+
 # Global recommendation engine
 recommendation_engine = CreditRecommendationEngine()
\ No newline at end of file
@@ -9,8 +9,187 @@ from sklearn.metrics import roc_auc_score, classification_report
 import xgboost as xgb
 import lightgbm as lgb
 import joblib
-from typing import Dict, Any, Tuple, List
+from typing import Dict, Any, Tuple, List, Optional, Callable
+import numbers
+import threading
 import os
+from .score_calibration import ScoreLookupTable, DEFAULT_SCORE_TABLE, fit_score_table
+
+# Engineered features produced by CreditRiskModel.prepare_features
+DERIVED_FEATURES = {
+    'income_expense_ratio': (('monthly_income', 'monthly_expenses'),
+                             lambda r: r['monthly_income'] / (r['monthly_expenses'] + 1)),
+    'savings_rate': (('monthly_income', 'monthly_expenses'),
+                     lambda r: (r['monthly_income'] - r['monthly_expenses']) / r['monthly_income']),
+    'credit_utilization': (('credit_used', 'credit_limit'),
+                           lambda r: r['credit_used'] / (r['credit_limit'] + 1)),
+    'debt_to_income': (('total_debt', 'monthly_income'),
+                       lambda r: r['total_debt'] / (r['monthly_income'] + 1)),
+}
+AGE_BINS = [0, 25, 35, 50, 100]
+# Numeric applicant fields; models saved without ``input_columns`` compile only these as raw features
+NUMERIC_INPUT_FIELDS = frozenset({
+    'monthly_income', 'monthly_expenses', 'total_debt', 'credit_used', 'credit_limit',
+    'age', 'employment_months', 'credit_types', 'missed_payments'
+})
+
+def _number(value: Any) -> float:
+    """Coerce a numeric request value, rejecting anything pandas would treat as categorical"""
+    if isinstance(value, numbers.Real):
+        return float(value)
+    raise TypeError(f"Non-numeric feature value: {value!r}")
+
+class CompiledFeaturePlan:
+    """Map a single request dict straight to a scaled float64 feature vector
+    
+    Built once from ``feature_names`` and the fitted scaler, it mirrors
+    prepare_features + get_dummies + reindex + StandardScaler.transform
+    without constructing any DataFrames.
+    """
+    
+    def __init__(self, feature_names: List[str], scaler: StandardScaler,
+                 input_columns: Optional[List[str]] = None):
+        self.feature_names = list(feature_names)
+        n_features = len(self.feature_names)
+        
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        self.mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+        if len(self.mean) != n_features or len(self.scale) != n_features:
+            raise ValueError("Scaler parameters do not match feature names")
+        
+        self.steps = [self._compile_feature(name, input_columns) for name in self.feature_names]
+        self._local = threading.local()
+    
+    @staticmethod
+    def _compile_feature(name: str, input_columns: Optional[List[str]]) -> Callable[[Dict[str, Any]], float]:
+        """Build the extractor for one feature column"""
+        if name.startswith('age_group_'):
+            group = int(name[len('age_group_'):])
+            low, high = AGE_BINS[group], AGE_BINS[group + 1]
+            
+            def age_group(record: Dict[str, Any]) -> float:
+                if 'age' not in record:
+                    return 0.0
+                return 1.0 if low < _number(record['age']) <= high else 0.0
+            return age_group
+        
+        if name in DERIVED_FEATURES:
+            inputs, formula = DERIVED_FEATURES[name]
+            
+            def derived(record: Dict[str, Any]) -> float:
+                if all(key in record for key in inputs):
+                    return formula({key: _number(record[key]) for key in inputs})
+                return _number(record[name]) if name in record else 0.0
+            return derived
+        
+        if input_columns is not None and name not in input_columns:
+            # One-hot column of a categorical input; the pandas path handles these
+            raise ValueError(f"Feature '{name}' cannot be compiled")
+        if input_columns is None and name not in NUMERIC_INPUT_FIELDS:
+            # Older saved models lack input_columns, so a one-hot column would
+            # be indistinguishable from a raw input and silently read as 0
+            raise ValueError(f"Feature '{name}' cannot be compiled without input columns")
+        
+        def raw(record: Dict[str, Any]) -> float:
+            return _number(record[name]) if name in record else 0.0
+        return raw
+    
+    def fill_row(self, record: Dict[str, Any], row: np.ndarray) -> bool:
+        """Write the scaled features for one record into ``row``; False if the pandas path is needed"""
+        try:
+            for i, step in enumerate(self.steps):
+                row[i] = step(record)
+        except (TypeError, ValueError, ZeroDivisionError):
+            return False
+        
+        row -= self.mean
+        row /= self.scale
+        return bool(np.isfinite(row).all())
+    
+    def transform_one(self, record: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Scaled (1, n_features) vector for one record, or None if the pandas path is needed"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = np.empty((1, len(self.feature_names)), dtype=np.float64)
+        
+        return buffer if self.fill_row(record, buffer[0]) else None
+
+class RiskExplainer:
+    """Per-applicant feature attributions (SHAP values) for a fitted model
+    
+    Built once per trained or loaded model. XGBoost and LightGBM use their
+    native TreeSHAP, other tree ensembles ``shap.TreeExplainer`` (optional
+    dependency), and logistic regression its exact linear attributions.
+    Values are in the model's margin units (log-odds; probability for
+    random forests) on scaled features.
+    """
+    
+    def __init__(self, model, model_type: str):
+        self.model = model
+        self.model_type = model_type
+        self._booster = None
+        self._tree_explainer = None
+        
+        if model_type == "xgboost" and hasattr(model, "get_booster"):
+            self.method = "xgboost"
+            self._booster = model.get_booster()
+        elif model_type == "lightgbm" and hasattr(model, "booster_"):
+            self.method = "lightgbm"
+            self._booster = model.booster_
+        elif hasattr(model, "coef_"):
+            self.method = "linear"
+        else:
+            try:
+                import shap
+            except ImportError:
+                raise ValueError(f"shap is required to explain {type(model).__name__} models")
+            self._tree_explainer = shap.TreeExplainer(model)
+            self.method = "shap"
+    
+    def contributions(self, X_scaled: np.ndarray, approximate: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """(n, n_features) attributions and (n,) base values for already-scaled rows
+        
+        ``approximate`` uses Saabas path attributions where the backend has
+        them (XGBoost, shap); they are cheaper but not consistent like SHAP.
+        """
+        if self.method == "xgboost":
+            output = self._booster.predict(
+                xgb.DMatrix(X_scaled), pred_contribs=True, approx_contribs=approximate
+            )
+            return output[:, :-1], output[:, -1]
+        
+        if self.method == "lightgbm":
+            output = self._booster.predict(X_scaled, pred_contrib=True)
+            return output[:, :-1], output[:, -1]
+        
+        if self.method == "linear":
+            # Scaled features have zero training mean, so coef * x is the exact SHAP value
+            values = X_scaled * self.model.coef_[0]
+            return values, np.full(len(X_scaled), float(self.model.intercept_[0]))
+        
+        values = self._tree_explainer.shap_values(X_scaled, approximate=approximate, check_additivity=False)
+        base = np.atleast_1d(self._tree_explainer.expected_value)
+        # Classifiers explain every class; attributions toward default (class 1)
+        if isinstance(values, list):
+            values = values[1]
+        elif values.ndim == 3:
+            values = values[:, :, 1]
+        return values, np.full(len(X_scaled), float(base[-1]))
+    
+    @staticmethod
+    def top_k(values: np.ndarray, k: int) -> np.ndarray:
+        """Column indices of the ``k`` largest |attributions| per row, largest first"""
+        magnitude = np.abs(values)
+        k = min(k, values.shape[1])
+        if k < values.shape[1]:
+            # Partial selection, then order only the k winners
+            candidates = np.argpartition(-magnitude, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(values.shape[1]), (len(values), 1))
+        order = np.argsort(-np.take_along_axis(magnitude, candidates, axis=1), axis=1, kind="stable")
+        return np.take_along_axis(candidates, order, axis=1)
 
 class CreditRiskModel:
     """Credit risk prediction model"""
@@ -20,6 +199,12 @@ class CreditRiskModel:
         self.model = None
         self.scaler = StandardScaler()
         self.feature_names = []
+        self.input_columns = None
+        self.feature_plan = None
+        self.explainer = None
+        self.explain_approximate = os.getenv("RISK_EXPLAIN_APPROXIMATE", "false").lower() == "true"
+        self.calibration_method = os.getenv("RISK_SCORE_CALIBRATION", "isotonic").lower()
+        self.score_table = DEFAULT_SCORE_TABLE
         self.is_trained = False
     
     def _get_model(self):
@@ -58,6 +243,8 @@ class CreditRiskModel:
     
     def train(self, X: pd.DataFrame, y: pd.Series) -> Dict[str, Any]:
         """Train credit risk model"""
+        self.input_columns = X.columns.tolist()
+        
         # Prepare features
         X_processed = self.prepare_features(X)
         
@@ -88,14 +275,93 @@ class CreditRiskModel:
             "classification_report": classification_report(y_test, y_pred, output_dict=True)
         }
         
+        # Calibrate scores on the held-out split so they track observed default rates
+        if self.calibration_method != "none":
+            self.score_table = fit_score_table(y_test, y_prob, method=self.calibration_method)
+        metrics["score_table"] = self.score_table.summary()
+        
         self.is_trained = True
+        self._compile_feature_plan()
+        self._build_explainer()
         return metrics
     
+    def _compile_feature_plan(self):
+        """Build the single-row feature plan; fall back to pandas if it cannot be compiled"""
+        try:
+            self.feature_plan = CompiledFeaturePlan(self.feature_names, self.scaler, self.input_columns)
+        except (ValueError, IndexError):
+            self.feature_plan = None
+    
+    def _build_explainer(self):
+        """Build the attribution explainer once per model; global importances are used without it"""
+        try:
+            self.explainer = RiskExplainer(self.model, self.model_type)
+        except ValueError:
+            self.explainer = None
+    
+    def _predict_scaled(self, X_scaled: np.ndarray) -> np.ndarray:
+        """Default probability from already-scaled features, calling the booster directly"""
+        if self.model_type == "xgboost" and hasattr(self.model, "get_booster"):
+            return np.asarray(self.model.get_booster().inplace_predict(X_scaled))
+        if self.model_type == "lightgbm" and hasattr(self.model, "booster_"):
+            return np.asarray(self.model.booster_.predict(X_scaled))
+        return self.model.predict_proba(X_scaled)[:, 1]
+    
+    def predict_one(self, record: Dict[str, Any]) -> float:
+        """Predict default probability for a single applicant dict
+        
+        Uses the compiled feature plan when possible and the pandas path
+        (predict_default_probability) otherwise; both give the same result.
+        """
+        if not self.is_trained:
+            raise ValueError("Model not trained. Call train() first.")
+        
+        if self.feature_plan is not None:
+            X_scaled = self.feature_plan.transform_one(record)
+            if X_scaled is not None:
+                return float(self._predict_scaled(X_scaled)[0])
+        
+        return float(self.predict_default_probability(pd.DataFrame([record]))[0])
+    
+    def predict_many(self, records: List[Dict[str, Any]]) -> np.ndarray:
+        """Predict default probabilities for a list of applicant dicts with one model call
+        
+        Records the compiled plan cannot represent are scored together through
+        the pandas path, so at most two model calls are made per list.
+        """
+        if not self.is_trained:
+            raise ValueError("Model not trained. Call train() first.")
+        
+        probabilities = np.empty(len(records), dtype=np.float64)
+        fallback = list(range(len(records)))
+        
+        if self.feature_plan is not None and records:
+            X_scaled = np.empty((len(records), len(self.feature_names)), dtype=np.float64)
+            compiled, fallback = [], []
+            for i, record in enumerate(records):
+                if self.feature_plan.fill_row(record, X_scaled[len(compiled)]):
+                    compiled.append(i)
+                else:
+                    fallback.append(i)
+            
+            if compiled:
+                probabilities[compiled] = self._predict_scaled(X_scaled[:len(compiled)])
+        
+        if fallback:
+            df = pd.DataFrame([records[i] for i in fallback])
+            probabilities[fallback] = self.predict_default_probability(df)
+        
+        return probabilities
+    
     def predict_default_probability(self, X: pd.DataFrame) -> np.ndarray:
         """Predict default probability"""
         if not self.is_trained:
             raise ValueError("Model not trained. Call train() first.")
         
+        return self.model.predict_proba(self._transform_frame(X))[:, 1]
+    
+    def _transform_frame(self, X: pd.DataFrame) -> np.ndarray:
+        """Scaled feature matrix for a DataFrame of applicants"""
         # Prepare features
         X_processed = self.prepare_features(X)
         X_processed = pd.get_dummies(X_processed, drop_first=True)
@@ -103,12 +369,69 @@ class CreditRiskModel:
         # Align features with training data
         X_processed = X_processed.reindex(columns=self.feature_names, fill_value=0)
         
-        # Scale and predict
-        X_scaled = self.scaler.transform(X_processed)
-        return self.model.predict_proba(X_scaled)[:, 1]
+        # Scale
+        return self.scaler.transform(X_processed)
+    
+    def explain_scaled(self, X_scaled: np.ndarray, top_k: int = 10,
+                       approximate: Optional[bool] = None) -> List[List[Dict[str, Any]]]:
+        """Top-k risk factors per row of already-scaled features, from one explainer call"""
+        if approximate is None:
+            approximate = self.explain_approximate
+        values, _ = self.explainer.contributions(X_scaled, approximate=approximate)
+        top = RiskExplainer.top_k(values, top_k)
+        # Share of the row's total attribution, so impact thresholds don't depend on model units
+        totals = np.abs(values).sum(axis=1)
+        totals[totals == 0] = 1.0
+        
+        explanations = []
+        for row, columns in enumerate(top):
+            factors = []
+            for column in columns:
+                contribution = float(values[row, column])
+                importance = abs(contribution) / totals[row]
+                factors.append({
+                    "factor": self.feature_names[column],
+                    "importance": float(importance),
+                    "contribution": contribution,
+                    "direction": "increases_risk" if contribution > 0 else "decreases_risk",
+                    "impact": "high" if importance > 0.1 else "medium" if importance > 0.05 else "low"
+                })
+            explanations.append(factors)
+        return explanations
+    
+    def explain_many(self, X: pd.DataFrame, top_k: int = 10,
+                     approximate: Optional[bool] = None) -> List[List[Dict[str, Any]]]:
+        """Per-applicant risk factors for every row of ``X``"""
+        if not self.is_trained or self.explainer is None:
+            return [self.get_global_risk_factors()[:top_k] for _ in range(len(X))]
+        return self.explain_scaled(self._transform_frame(X), top_k, approximate)
+    
+    def explain_one(self, record: Dict[str, Any], top_k: int = 10,
+                    approximate: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Risk factors for a single applicant dict, via the compiled feature plan when possible"""
+        if not self.is_trained or self.explainer is None:
+            return self.get_global_risk_factors()[:top_k]
+        
+        if self.feature_plan is not None:
+            X_scaled = self.feature_plan.transform_one(record)
+            if X_scaled is not None:
+                return self.explain_scaled(X_scaled, top_k, approximate)[0]
+        return self.explain_many(pd.DataFrame([record]), top_k, approximate)[0]
     
     def get_risk_factors(self, X: pd.DataFrame) -> List[Dict[str, Any]]:
-        """Get risk factors contributing to default probability"""
+        """Get risk factors contributing to default probability
+        
+        Per-applicant attributions for the first row of ``X`` when the model
+        can be explained, otherwise global feature importances.
+        """
+        if not self.is_trained:
+            return []
+        if self.explainer is not None and len(X):
+            return self.explain_many(X.head(1))[0]
+        return self.get_global_risk_factors()
+    
+    def get_global_risk_factors(self) -> List[Dict[str, Any]]:
+        """Model-wide feature importances (the same for every applicant)"""
         if not self.is_trained:
             return []
         
@@ -136,7 +459,9 @@ class CreditRiskModel:
                 "model": self.model,
                 "scaler": self.scaler,
                 "feature_names": self.feature_names,
-                "model_type": self.model_type
+                "input_columns": self.input_columns,
+                "model_type": self.model_type,
+                "score_table": self.score_table.to_dict()
             }
             joblib.dump(model_data, filepath)
     
@@ -148,47 +473,34 @@ class CreditRiskModel:
             self.scaler = model_data["scaler"]
             self.feature_names = model_data["feature_names"]
             self.model_type = model_data["model_type"]
+            self.input_columns = model_data.get("input_columns")
+            score_table = model_data.get("score_table")
+            self.score_table = ScoreLookupTable.from_dict(score_table) if score_table else DEFAULT_SCORE_TABLE
             self.is_trained = True
+            self._compile_feature_plan()
+            self._build_explainer()
 
 class CreditScoreCalculator:
-    """Calculate credit score from risk probability"""
+    """Calculate credit score from risk probability
+    
+    Lookups go through a ScoreLookupTable: pass a model's calibrated
+    ``score_table`` to score on it, otherwise the linear mapping is used.
+    """
     
     @staticmethod
-    def probability_to_score(default_prob: float) -> int:
+    def probability_to_score(default_prob: float, table: Optional[ScoreLookupTable] = None) -> int:
         """Convert default probability to credit score (300-850)"""
-        # Inverse relationship: lower probability = higher score
-        score = 850 - (default_prob * 550)
-        return max(300, min(850, int(score)))
+        return (table or DEFAULT_SCORE_TABLE).scores(default_prob)
     
     @staticmethod
     def score_to_grade(score: int) -> str:
         """Convert credit score to letter grade"""
-        if score >= 800:
-            return "A+"
-        elif score >= 750:
-            return "A"
-        elif score >= 700:
-            return "B+"
-        elif score >= 650:
-            return "B"
-        elif score >= 600:
-            return "C+"
-        elif score >= 550:
-            return "C"
-        else:
-            return "D"
+        return DEFAULT_SCORE_TABLE.grades(score)
     
     @staticmethod
     def get_risk_category(score: int) -> str:
         """Get risk category from credit score"""
-        if score >= 750:
-            return "Low Risk"
-        elif score >= 650:
-            return "Medium Risk"
-        elif score >= 550:
-            return "High Risk"
-        else:
-            return "Very High Risk"
+        return DEFAULT_SCORE_TABLE.risk_categories(score)
 
 # Global model instance
 credit_risk_model = CreditRiskModel("xgboost")
\ No newline at end of file
@@ -1,20 +1,33 @@
 """Credit Analysis API Routes"""
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
-from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional, Iterator
+import numpy as np
 import pandas as pd
+import json
 from .risk_models import credit_risk_model, CreditScoreCalculator
+from .score_calibration import DEFAULT_SCORE_TABLE
+from .prediction_batcher import prediction_batcher
 from .financial_ratios import financial_ratios_engine
 from .document_nlp import document_analyzer
+from .document_engine import document_engine, DocumentExtractionError
+from .document_jobs import document_job_manager, UploadTooLarge
+from .document_cache import document_result_cache
 from .fraud_detection import fraud_detector
+from .transaction_state import transaction_state_store
 from .recommendation_engine import recommendation_engine
 from auth.dependencies import get_current_active_user
 from auth.rate_limiter import limiter
 import tempfile
+import hashlib
 import os
 
 router = APIRouter(prefix="/credit-analysis", tags=["Credit Analysis"])
 
+SCORE_INTERPRETATION_CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=604800"
+
 # Pydantic models
 class CreditAnalysisRequest(BaseModel):
     monthly_income: float
@@ -27,6 +40,9 @@ class CreditAnalysisRequest(BaseModel):
     credit_types: Optional[int] = 1
     missed_payments: Optional[int] = 0
 
+class BatchCreditAnalysisRequest(BaseModel):
+    applicants: List[CreditAnalysisRequest] = Field(..., min_length=1, max_length=10000)
+
 class TransactionData(BaseModel):
     id: str
     amount: float
@@ -41,32 +57,31 @@ class FraudAnalysisRequest(BaseModel):
 
 @router.post("/risk-assessment")
 @limiter.limit("10/minute")
-async def assess_credit_risk(request, data: CreditAnalysisRequest, 
-                           current_user = Depends(get_current_active_user)):
+async def assess_credit_risk(request: Request, data: CreditAnalysisRequest,
+                             current_user = Depends(get_current_active_user)):
     """Comprehensive credit risk assessment"""
     try:
-        # Convert to DataFrame for model
-        df = pd.DataFrame([data.dict()])
+        payload = data.dict()
         
         # Calculate financial ratios
-        ratios = financial_ratios_engine.calculate_all_ratios(data.dict())
+        ratios = financial_ratios_engine.calculate_all_ratios(payload)
         
         # Predict default probability (if model is trained)
         default_probability = 0.15  # Default fallback
         risk_factors = []
         
         if credit_risk_model.is_trained:
-            default_prob = credit_risk_model.predict_default_probability(df)[0]
-            default_probability = float(default_prob)
-            risk_factors = credit_risk_model.get_risk_factors(df)
+            default_probability = await prediction_batcher.predict(payload)
+            # SHAP attributions are CPU-bound; keep them off the event loop
+            risk_factors = await run_in_threadpool(credit_risk_model.explain_one, payload)
         
         # Calculate credit score
-        credit_score = CreditScoreCalculator.probability_to_score(default_probability)
+        credit_score = CreditScoreCalculator.probability_to_score(default_probability, credit_risk_model.score_table)
         credit_grade = CreditScoreCalculator.score_to_grade(credit_score)
         risk_category = CreditScoreCalculator.get_risk_category(credit_score)
         
         # Get recommendations
-        recommendations = recommendation_engine.get_personalized_recommendations(data.dict())
+        recommendations = recommendation_engine.get_personalized_recommendations(payload)
         
         return {
             "credit_score": credit_score,
@@ -82,6 +97,80 @@ async def assess_credit_risk(request, data: CreditAnalysisRequest,
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Risk assessment failed: {str(e)}")
 
+def _json_safe(value: Any) -> Any:
+    """Replace NaN/Infinity (not valid JSON) with None, recursively"""
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    return value
+
+def _stream_batch_assessment(rows: List[Dict[str, Any]]) -> Iterator[str]:
+    """Score all rows with one ratio pass, one model call and one rule pass, yield NDJSON"""
+    df = pd.DataFrame(rows)
+    
+    # Columnar ratios for the whole batch
+    batch_ratios = financial_ratios_engine.calculate_all_ratios_batch(df)
+    
+    # Single vectorized model call (if model is trained)
+    default_probabilities = [0.15] * len(rows)  # Default fallback
+    risk_factors = [[] for _ in rows]
+    
+    if credit_risk_model.is_trained:
+        default_probabilities = credit_risk_model.predict_default_probability(df).tolist()
+        # Per-applicant attributions from one explainer call over the batch
+        risk_factors = credit_risk_model.explain_many(df)
+    
+    # Score, grade and category lookups for the whole batch
+    score_table = credit_risk_model.score_table
+    credit_scores = score_table.scores(np.asarray(default_probabilities, dtype=np.float64))
+    credit_grades = score_table.grades(credit_scores)
+    risk_categories = score_table.risk_categories(credit_scores)
+    
+    recommendations = recommendation_engine.get_personalized_recommendations_many(df)
+    analysis_timestamp = pd.Timestamp.now().isoformat()
+    
+    for index, row in enumerate(rows):
+        result = {
+            "index": index,
+            "credit_score": int(credit_scores[index]),
+            "credit_grade": credit_grades[index],
+            "risk_category": risk_categories[index],
+            "default_probability": float(default_probabilities[index]),
+            "financial_ratios": {
+                category: {name: float(values[index]) for name, values in ratios.items()}
+                for category, ratios in batch_ratios.items()
+            },
+            "risk_factors": risk_factors[index],
+            "recommendations": recommendations[index],
+            "analysis_timestamp": analysis_timestamp
+        }
+        yield json.dumps(_json_safe(result), default=str, allow_nan=False) + "\n"
+
+@router.post("/risk-assessment/batch")
+@limiter.limit("5/minute")
+async def assess_credit_risk_batch(request: Request, data: BatchCreditAnalysisRequest,
+                                 current_user = Depends(get_current_active_user)):
+    """Batch credit risk assessment streamed back as NDJSON (one line per applicant)"""
+    try:
+        rows = [applicant.dict() for applicant in data.applicants]
+        results = _stream_batch_assessment(rows)
+        
+        # Run the vectorized scoring before the response starts so failures surface as 500s;
+        # it is CPU-bound, so in a thread (StreamingResponse iterates the rest in one too)
+        first_line = await run_in_threadpool(next, results)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch risk assessment failed: {str(e)}")
+    
+    def ndjson_lines() -> Iterator[str]:
+        yield first_line
+        yield from results
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
 @router.post("/financial-ratios")
 @limiter.limit("20/minute")
 async def calculate_financial_ratios(request, financial_data: Dict[str, float]):
@@ -121,13 +210,18 @@ async def analyze_document(request, file: UploadFile = File(...),
             tmp_file_path = tmp_file.name
         
         try:
-            # Process document
-            analysis = document_analyzer.process_document(tmp_file_path, document_type)
+            # Repeat uploads of the same bytes are served from the result cache;
+            # otherwise pages are extracted in parallel, off the event loop
+            analysis, cached = await document_result_cache.get_or_compute(
+                hashlib.sha256(content).hexdigest(), document_type,
+                lambda: document_engine.process_document(tmp_file_path, document_type)
+            )
             
             return {
                 "filename": file.filename,
                 "document_type": analysis.get("document_type", "unknown"),
                 "analysis": analysis,
+                "cached": cached,
                 "processed_at": pd.Timestamp.now().isoformat()
             }
         
@@ -136,26 +230,73 @@ async def analyze_document(request, file: UploadFile = File(...),
             if os.path.exists(tmp_file_path):
                 os.unlink(tmp_file_path)
     
+    except DocumentExtractionError as e:
+        raise HTTPException(status_code=422, detail=f"Document could not be read: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Document analysis failed: {str(e)}")
 
+@router.post("/document-analysis/jobs", status_code=202)
+@limiter.limit("10/minute")
+async def submit_document_analysis_job(request: Request, file: UploadFile = File(...),
+                                       document_type: str = "auto",
+                                       current_user = Depends(get_current_active_user)):
+    """Queue a document analysis; progress streams on /realtime/sse/calculation/{job_id}"""
+    try:
+        suffix = f".{file.filename.split('.')[-1]}" if "." in file.filename else ""
+        file_path, content_sha256 = await document_job_manager.save_upload(file, suffix)
+        job = await document_job_manager.submit(file_path, file.filename, document_type,
+                                                current_user.email, content_sha256)
+    
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Document job submission failed: {str(e)}")
+    
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "progress_url": f"/realtime/sse/calculation/{job['job_id']}",
+        "result_url": f"/credit-analysis/document-analysis/jobs/{job['job_id']}"
+    }
+
+@router.get("/document-analysis/jobs/{job_id}")
+async def get_document_analysis_job(job_id: str, current_user = Depends(get_current_active_user)):
+    """Job status, and the analysis once completed"""
+    job = document_job_manager.get(job_id)
+    if job is None or job["owner"] != current_user.email:
+        raise HTTPException(status_code=404, detail="Document analysis job not found")
+    
+    return {key: value for key, value in job.items() if key != "owner"}
+
 @router.post("/fraud-detection")
 @limiter.limit("15/minute")
 async def detect_fraud(request, data: FraudAnalysisRequest,
                       current_user = Depends(get_current_active_user)):
-    """Analyze transaction for fraud patterns"""
+    """Analyze transaction for fraud patterns
+    
+    Without ``transaction_history`` the transaction is scored against the
+    caller's server-side rolling state; sending the history keeps the
+    original full re-scan behaviour.
+    """
     try:
-        # Convert transaction history to dict format
-        transaction_history = []
-        if data.transaction_history:
+        if data.transaction_history is None:
+            # Read-modify-write of the user's state in one atomic update
+            fraud_analysis = await transaction_state_store.update(
+                current_user.email,
+                lambda state: fraud_detector.analyze_streaming_transaction(
+                    data.transaction.dict(), state, data.user_profile
+                )
+            )
+        else:
+            # Convert transaction history to dict format
             transaction_history = [t.dict() for t in data.transaction_history]
-        
-        # Analyze transaction
-        fraud_analysis = fraud_detector.analyze_transaction(
-            data.transaction.dict(),
-            data.user_profile,
-            transaction_history
-        )
+            
+            # Analyze transaction
+            fraud_analysis = fraud_detector.analyze_transaction(
+                data.transaction.dict(),
+                data.user_profile,
+                transaction_history
+            )
         
         return {
             "transaction_id": data.transaction.id,
@@ -163,6 +304,8 @@ async def detect_fraud(request, data: FraudAnalysisRequest,
             "analyzed_at": pd.Timestamp.now().isoformat()
         }
     
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid transaction: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Fraud detection failed: {str(e)}")
 
@@ -183,48 +326,19 @@ async def get_credit_recommendations(request, financial_data: Dict[str, Any],
         raise HTTPException(status_code=500, detail=f"Recommendation generation failed: {str(e)}")
 
 @router.get("/credit-score/{score}/interpretation")
-async def interpret_credit_score(score: int):
-    """Get credit score interpretation and improvement tips"""
+async def interpret_credit_score(score: int, request: Request):
+    """Get credit score interpretation and improvement tips
+    
+    The answer only depends on the score and the grade table, so it is
+    served with long-lived cache headers and an ETag of the table version.
+    """
     try:
-        grade = CreditScoreCalculator.score_to_grade(score)
-        risk_category = CreditScoreCalculator.get_risk_category(score)
-        
-        # Score interpretation
-        interpretations = {
-            "A+": "Excellent credit - you qualify for the best rates and terms",
-            "A": "Very good credit - access to competitive rates",
-            "B+": "Good credit - decent rates available",
-            "B": "Fair credit - some limitations on rates and terms",
-            "C+": "Poor credit - limited options, higher rates",
-            "C": "Bad credit - very limited options",
-            "D": "Very poor credit - major rebuilding needed"
-        }
-        
-        improvement_tips = {
-            "A+": ["Maintain current habits", "Monitor for identity theft"],
-            "A": ["Keep utilization low", "Maintain payment history"],
-            "B+": ["Pay down balances", "Avoid new credit inquiries"],
-            "B": ["Focus on payment history", "Reduce credit utilization"],
-            "C+": ["Pay all bills on time", "Consider secured credit cards"],
-            "C": ["Debt consolidation", "Credit counseling"],
-            "D": ["Professional credit repair", "Secured credit products"]
-        }
+        etag = f'"{score}-{DEFAULT_SCORE_TABLE.version}"'
+        headers = {"Cache-Control": SCORE_INTERPRETATION_CACHE_CONTROL, "ETag": etag}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
         
-        return {
-            "score": score,
-            "grade": grade,
-            "risk_category": risk_category,
-            "interpretation": interpretations.get(grade, "Unknown"),
-            "improvement_tips": improvement_tips.get(grade, []),
-            "score_ranges": {
-                "Excellent": "750-850",
-                "Very Good": "700-749",
-                "Good": "650-699",
-                "Fair": "600-649",
-                "Poor": "550-599",
-                "Very Poor": "300-549"
-            }
-        }
+        return JSONResponse(DEFAULT_SCORE_TABLE.interpretation(score), headers=headers)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Score interpretation failed: {str(e)}")
@@ -241,5 +355,10 @@ async def credit_analysis_health():
             "fraud_detector": "ready",
             "recommendation_engine": "ready"
         },
+        "prediction_batcher": prediction_batcher.get_metrics(),
+        "score_table": credit_risk_model.score_table.summary(),
+        "document_models": document_analyzer.model_status(),
+        "document_inference": document_analyzer.inference_metrics(),
+        "document_cache": document_result_cache.metrics,
         "version": "1.0.0"
     }
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""Calibrated Score Lookup Tables"""
+import hashlib
+import json
+import numpy as np
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
+from typing import Dict, Any, Union
+
+MIN_SCORE = 300
+MAX_SCORE = 850
+SCORE_SPAN = MAX_SCORE - MIN_SCORE
+
+# Lowest score of each grade / risk category, ascending; below the first floor
+# is the first label
+GRADE_FLOORS = (550, 600, 650, 700, 750, 800)
+GRADES = ("D", "C", "C+", "B", "B+", "A", "A+")
+RISK_CATEGORY_FLOORS = (550, 650, 750)
+RISK_CATEGORIES = ("Very High Risk", "High Risk", "Medium Risk", "Low Risk")
+
+GRADE_INTERPRETATIONS = {
+    "A+": "Excellent credit - you qualify for the best rates and terms",
+    "A": "Very good credit - access to competitive rates",
+    "B+": "Good credit - decent rates available",
+    "B": "Fair credit - some limitations on rates and terms",
+    "C+": "Poor credit - limited options, higher rates",
+    "C": "Bad credit - very limited options",
+    "D": "Very poor credit - major rebuilding needed"
+}
+GRADE_IMPROVEMENT_TIPS = {
+    "A+": ["Maintain current habits", "Monitor for identity theft"],
+    "A": ["Keep utilization low", "Maintain payment history"],
+    "B+": ["Pay down balances", "Avoid new credit inquiries"],
+    "B": ["Focus on payment history", "Reduce credit utilization"],
+    "C+": ["Pay all bills on time", "Consider secured credit cards"],
+    "C": ["Debt consolidation", "Credit counseling"],
+    "D": ["Professional credit repair", "Secured credit products"]
+}
+SCORE_RANGES = {
+    "Excellent": "750-850",
+    "Very Good": "700-749",
+    "Good": "650-699",
+    "Fair": "600-649",
+    "Poor": "550-599",
+    "Very Poor": "300-549"
+}
+
+class ScoreLookupTable:
+    """Probability bins to score, and score to grade, category and interpretation
+
+    ``probability_edges`` are ascending upper bin edges (right-closed);
+    ``bin_scores`` has one more entry, for probabilities above the last
+    edge. Every lookup is an ``np.searchsorted`` over sorted breakpoints,
+    so scalars and whole batches go through the same code.
+    """
+
+    def __init__(self, probability_edges, bin_scores, method: str = "linear"):
+        self.probability_edges = np.asarray(probability_edges, dtype=np.float64)
+        self.bin_scores = np.asarray(bin_scores, dtype=np.int64)
+        if len(self.bin_scores) != len(self.probability_edges) + 1:
+            raise ValueError("bin_scores needs one entry more than probability_edges")
+        self.method = method
+        self._grade_floors = np.asarray(GRADE_FLOORS)
+        self._grade_labels = np.asarray(GRADES, dtype=object)
+        self._category_floors = np.asarray(RISK_CATEGORY_FLOORS)
+        self._category_labels = np.asarray(RISK_CATEGORIES, dtype=object)
+        # Changes with the bins and with any grade text, so it can serve as an ETag
+        fingerprint = {**self.to_dict(), "grades": [GRADE_FLOORS, GRADES, GRADE_INTERPRETATIONS, GRADE_IMPROVEMENT_TIPS]}
+        self.version = hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:16]
+
+        # Response body per grade, built once; interpretation() only adds the score
+        self._interpretations = {
+            grade: {
+                "grade": grade,
+                "risk_category": str(self.risk_categories(floor)),
+                "interpretation": GRADE_INTERPRETATIONS[grade],
+                "improvement_tips": GRADE_IMPROVEMENT_TIPS[grade],
+                "score_ranges": SCORE_RANGES
+            }
+            for grade, floor in zip(GRADES, (MIN_SCORE,) + GRADE_FLOORS)
+        }
+
+    @classmethod
+    def linear(cls) -> "ScoreLookupTable":
+        """Uncalibrated mapping: score = int(850 - 550 * p), clipped to 300-850"""
+        steps = np.arange(SCORE_SPAN)
+        return cls(steps / SCORE_SPAN, MAX_SCORE - np.arange(SCORE_SPAN + 1), method="linear")
+
+    def scores(self, probabilities: Union[float, np.ndarray]) -> Union[int, np.ndarray]:
+        """Credit scores for default probabilities"""
+        scores = self.bin_scores[np.searchsorted(self.probability_edges, probabilities, side="left")]
+        return int(scores) if np.ndim(scores) == 0 else scores
+
+    def grades(self, scores: Union[int, np.ndarray]) -> Union[str, np.ndarray]:
+        """Letter grades for credit scores"""
+        grades = self._grade_labels[np.searchsorted(self._grade_floors, scores, side="right")]
+        return str(grades) if np.ndim(grades) == 0 else grades
+
+    def risk_categories(self, scores: Union[int, np.ndarray]) -> Union[str, np.ndarray]:
+        """Risk categories for credit scores"""
+        categories = self._category_labels[np.searchsorted(self._category_floors, scores, side="right")]
+        return str(categories) if np.ndim(categories) == 0 else categories
+
+    def interpretation(self, score: int) -> Dict[str, Any]:
+        """Grade, category, interpretation text and tips for a score"""
+        return {"score": score, **self._interpretations[self.grades(score)]}
+
+    def summary(self) -> Dict[str, Any]:
+        """Method, version and bin count, for health and model info"""
+        return {"method": self.method, "version": self.version, "bins": len(self.bin_scores)}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "probability_edges": self.probability_edges.tolist(),
+            "bin_scores": self.bin_scores.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScoreLookupTable":
+        return cls(data["probability_edges"], data["bin_scores"], data.get("method", "linear"))
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    p = np.clip(p, 1e-6, 1 - 1e-6)
+    return np.log(p / (1 - p)).reshape(-1, 1)
+
+def _fit_calibrator(y_true: np.ndarray, y_prob: np.ndarray, method: str):
+    """Callable mapping raw model probabilities to observed default rates"""
+    if method == "isotonic":
+        isotonic = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds="clip", increasing=True)
+        isotonic.fit(y_prob, y_true)
+        return isotonic.predict
+    if method == "platt":
+        platt = LogisticRegression().fit(_logit(y_prob), y_true)
+        return lambda p: platt.predict_proba(_logit(p))[:, 1]
+    raise ValueError(f"Unknown calibration method: {method}")
+
+def fit_score_table(y_true, y_prob, method: str = "isotonic", n_bins: int = 200) -> ScoreLookupTable:
+    """Calibrate held-out model probabilities and compile them into a lookup table
+
+    Bin edges are quantiles of the raw probabilities, so bins are dense
+    where the population is; each bin scores its calibrated default rate
+    on the 300-850 scale. Scores never increase with probability.
+    """
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_prob = np.asarray(y_prob, dtype=np.float64)
+    calibrate = _fit_calibrator(y_true, y_prob, method)
+
+    edges = np.unique(np.quantile(y_prob, np.linspace(0, 1, n_bins + 1)[1:-1]))
+    bounds = np.concatenate(([0.0], edges, [1.0]))
+    midpoints = (bounds[:-1] + bounds[1:]) / 2
+    calibrated = calibrate(midpoints)
+
+    scores = np.clip(np.floor(MAX_SCORE - calibrated * SCORE_SPAN), MIN_SCORE, MAX_SCORE).astype(np.int64)
+    return ScoreLookupTable(edges, np.minimum.accumulate(scores), method=method)
+
+# Global uncalibrated table, used until a calibrated model is trained or loaded
+DEFAULT_SCORE_TABLE = ScoreLookupTable.linear()
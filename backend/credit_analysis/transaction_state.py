@@ -0,0 +1,286 @@
+"""Per-user Rolling Transaction State for Streaming Fraud Scoring"""
+from collections import OrderedDict, deque
+from typing import Dict, Any, Callable, Optional, Tuple, TypeVar
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Velocity windows checked on every new transaction: {seconds: min_count}
+DEFAULT_VELOCITY_WINDOWS = {60: 3, 300: 5, 3600: 20}
+STRUCTURING_THRESHOLD = 50000
+# Optimistic (WATCH/MULTI) retries before a Redis update falls back to last-writer-wins
+REDIS_UPDATE_RETRIES = 5
+
+T = TypeVar("T")
+
+class UserTransactionState:
+    """Bounded ring buffer of recent transactions plus incremental aggregates
+
+    Every update is O(1) amortized: window deques only ever pop expired
+    entries from the left, and buffer-wide counters are adjusted as the
+    ring buffer evicts its oldest transaction.
+
+    A transaction older than the latest one seen (delivered out of order)
+    is counted in the aggregates and inserted into the windows in time
+    order, but windows keep ending at the latest timestamp and the last
+    location is left alone; the snapshot marks it ``out_of_order``.
+    """
+
+    def __init__(self, max_transactions: int = 256, windows: Optional[Dict[int, int]] = None):
+        self.max_transactions = max_transactions
+        self.windows = dict(windows or DEFAULT_VELOCITY_WINDOWS)
+        self.recent = deque()  # (id, timestamp, amount, location)
+        self.window_events = {window: deque() for window in self.windows}  # (timestamp, amount)
+        self.window_totals = {window: 0.0 for window in self.windows}
+        self.round_amounts = 0
+        self.near_threshold = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last_location = None
+        self.last_timestamp = None
+
+    @staticmethod
+    def _is_round(amount: float) -> bool:
+        return amount > 0 and amount % 100 == 0
+
+    @staticmethod
+    def _is_near_threshold(amount: float) -> bool:
+        return STRUCTURING_THRESHOLD * 0.9 <= amount < STRUCTURING_THRESHOLD
+
+    def add(self, transaction: Dict[str, Any]) -> Dict[str, Any]:
+        """Record a transaction and return the aggregates seen before and after it"""
+        timestamp = transaction.get('timestamp', 0)
+        amount = transaction.get('amount', 0)
+        location = transaction.get('location')
+        out_of_order = self.last_timestamp is not None and timestamp < self.last_timestamp
+        window_end = self.last_timestamp if out_of_order else timestamp
+        snapshot = {
+            "previous_location": self.last_location,
+            "previous_timestamp": self.last_timestamp,
+            "average_amount": self.mean,
+            "amount_std": self.amount_std,
+            "history_count": self.count
+        }
+
+        # Ring buffer with buffer-wide pattern counters
+        if len(self.recent) >= self.max_transactions:
+            _, _, old_amount, _ = self.recent.popleft()
+            self.round_amounts -= self._is_round(old_amount)
+            self.near_threshold -= self._is_near_threshold(old_amount)
+        self.recent.append((transaction.get('id'), timestamp, amount, location))
+        self.round_amounts += self._is_round(amount)
+        self.near_threshold += self._is_near_threshold(amount)
+
+        # Sliding velocity windows ending at the latest transaction
+        window_stats = {}
+        for window, events in self.window_events.items():
+            if timestamp >= window_end - window:
+                # Late transactions belong near the end; in-order ones are appended
+                index = len(events)
+                while index and events[index - 1][0] > timestamp:
+                    index -= 1
+                events.insert(index, (timestamp, amount))
+                self.window_totals[window] += amount
+            while events and (events[0][0] < window_end - window or len(events) > self.max_transactions):
+                self.window_totals[window] -= events.popleft()[1]
+            window_stats[window] = {"count": len(events), "total_amount": self.window_totals[window]}
+
+        # Welford running mean/variance of amounts
+        self.count += 1
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount - self.mean)
+
+        if not out_of_order:
+            if location:
+                self.last_location = location
+            self.last_timestamp = timestamp
+
+        snapshot["out_of_order"] = out_of_order
+        snapshot["windows"] = window_stats
+        snapshot["buffer_size"] = len(self.recent)
+        return snapshot
+
+    @property
+    def amount_std(self) -> float:
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable form for shared backends"""
+        return {
+            "max_transactions": self.max_transactions,
+            "windows": {str(window): count for window, count in self.windows.items()},
+            "recent": list(self.recent),
+            "window_events": {str(window): list(events) for window, events in self.window_events.items()},
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "last_location": self.last_location,
+            "last_timestamp": self.last_timestamp
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UserTransactionState":
+        windows = {int(window): count for window, count in data["windows"].items()}
+        state = cls(data["max_transactions"], windows)
+        state.recent = deque(tuple(item) for item in data["recent"])
+        for window in state.windows:
+            events = deque(tuple(item) for item in data["window_events"].get(str(window), []))
+            state.window_events[window] = events
+            state.window_totals[window] = float(sum(amount for _, amount in events))
+        state.round_amounts = sum(state._is_round(item[2]) for item in state.recent)
+        state.near_threshold = sum(state._is_near_threshold(item[2]) for item in state.recent)
+        state.count = data["count"]
+        state.mean = data["mean"]
+        state.m2 = data["m2"]
+        state.last_location = data["last_location"]
+        state.last_timestamp = data["last_timestamp"]
+        return state
+
+class InMemoryStateBackend:
+    """Process-local LRU of user states"""
+
+    def __init__(self, max_users: int = 100000):
+        self.max_users = max_users
+        self.states: "OrderedDict[str, UserTransactionState]" = OrderedDict()
+
+    async def load(self, user_id: str) -> Optional[UserTransactionState]:
+        state = self.states.get(user_id)
+        if state is not None:
+            self.states.move_to_end(user_id)
+        return state
+
+    async def save(self, user_id: str, state: UserTransactionState):
+        self.states[user_id] = state
+        self.states.move_to_end(user_id)
+        while len(self.states) > self.max_users:
+            self.states.popitem(last=False)
+
+class RedisStateBackend:
+    """Shared user states in Redis so every worker sees the same history"""
+
+    def __init__(self, client, ttl_seconds: int = 86400, prefix: str = "fraud_state:"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def load(self, user_id: str) -> Optional[UserTransactionState]:
+        value = await self.client.get(f"{self.prefix}{user_id}")
+        if not value:
+            return None
+        return UserTransactionState.from_dict(json.loads(value))
+
+    async def save(self, user_id: str, state: UserTransactionState):
+        await self.client.setex(f"{self.prefix}{user_id}", self.ttl_seconds, json.dumps(state.to_dict()))
+
+    async def update(self, user_id: str, apply: Callable[[UserTransactionState], T],
+                     new_state: Callable[[], UserTransactionState]) -> Tuple[T, UserTransactionState]:
+        """Load, ``apply`` and save a user's state atomically with WATCH/MULTI; returns (result, state)
+
+        A concurrent write from another worker aborts the transaction and
+        ``apply`` is re-run on the fresh state. After REDIS_UPDATE_RETRIES
+        conflicts the last attempt is written unconditionally.
+        """
+        from redis.exceptions import WatchError
+        key = f"{self.prefix}{user_id}"
+        async with self.client.pipeline(transaction=True) as pipe:
+            for _ in range(REDIS_UPDATE_RETRIES):
+                try:
+                    await pipe.watch(key)
+                    value = await pipe.get(key)
+                    state = UserTransactionState.from_dict(json.loads(value)) if value else new_state()
+                    result = apply(state)
+                    pipe.multi()
+                    pipe.setex(key, self.ttl_seconds, json.dumps(state.to_dict()))
+                    await pipe.execute()
+                    return result, state
+                except WatchError:
+                    continue
+        logger.warning(f"Fraud state for {user_id} kept changing, writing without WATCH")
+        state = await self.load(user_id) or new_state()
+        result = apply(state)
+        await self.save(user_id, state)
+        return result, state
+
+class TransactionStateStore:
+    """Per-user transaction state with an optional Redis tier
+
+    Falls back to the in-process LRU whenever Redis is unavailable so
+    fraud scoring never fails because of the state store. Use ``update``
+    for read-modify-write; ``get`` followed by ``save`` is last-writer-wins
+    across workers.
+    """
+
+    def __init__(self, max_transactions: int = 256, max_users: int = 100000,
+                 redis_backend: Optional[RedisStateBackend] = None):
+        self.max_transactions = max_transactions
+        self.local = InMemoryStateBackend(max_users)
+        self.redis = redis_backend
+
+    def _new_state(self) -> UserTransactionState:
+        return UserTransactionState(self.max_transactions)
+
+    async def update(self, user_id: str, apply: Callable[[UserTransactionState], T]) -> T:
+        """Run ``apply`` on a user's state and persist it, atomically per user
+
+        ``apply`` must be synchronous: the local tier is then updated with
+        no await in between, and the Redis tier uses an optimistic
+        transaction, so concurrent requests on any worker never lose each
+        other's transactions. ``apply`` may run more than once on conflicts.
+        """
+        if self.redis is not None:
+            from redis.exceptions import RedisError
+            try:
+                result, state = await self.redis.update(user_id, apply, self._new_state)
+                await self.local.save(user_id, state)
+                return result
+            except (RedisError, OSError) as e:
+                logger.warning(f"Fraud state Redis update failed, using local state: {e}")
+        state = await self.local.load(user_id) or self._new_state()
+        result = apply(state)
+        await self.local.save(user_id, state)
+        return result
+
+    async def get(self, user_id: str) -> UserTransactionState:
+        """Load a user's state, creating an empty one on first sight"""
+        state = None
+        if self.redis is not None:
+            try:
+                state = await self.redis.load(user_id)
+            except Exception as e:
+                logger.warning(f"Fraud state Redis load failed, using local state: {e}")
+        if state is None:
+            state = await self.local.load(user_id)
+        return state or UserTransactionState(self.max_transactions)
+
+    async def save(self, user_id: str, state: UserTransactionState):
+        """Persist a user's state to every configured tier"""
+        await self.local.save(user_id, state)
+        if self.redis is not None:
+            try:
+                await self.redis.save(user_id, state)
+            except Exception as e:
+                logger.warning(f"Fraud state Redis save failed: {e}")
+
+def _create_state_store() -> TransactionStateStore:
+    """Build the global store; Redis is used when FRAUD_STATE_BACKEND=redis"""
+    redis_backend = None
+    if os.getenv("FRAUD_STATE_BACKEND", "memory").lower() == "redis":
+        try:
+            import redis.asyncio as redis
+            client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True)
+            redis_backend = RedisStateBackend(client, int(os.getenv("FRAUD_STATE_TTL_SECONDS", "86400")))
+        except ImportError:
+            logger.warning("redis not installed, fraud state kept in process memory")
+
+    return TransactionStateStore(
+        max_transactions=int(os.getenv("FRAUD_STATE_MAX_TRANSACTIONS", "256")),
+        max_users=int(os.getenv("FRAUD_STATE_MAX_USERS", "100000")),
+        redis_backend=redis_backend
+    )
+
+# Global transaction state store
+transaction_state_store = _create_state_store()
@@ -21,6 +21,18 @@ max_requests = 1000
 max_requests_jitter = 50
 preload_app = True
 
+# Shared NLP model host: one process holds the transformer pipelines and
+# workers call it over a local socket instead of loading their own copies
+def on_starting(server):
+    if os.getenv("NLP_SHARED_MODEL_HOST", "false").lower() == "true":
+        from credit_analysis.model_host import shared_model_host
+        shared_model_host.start()
+
+def on_exit(server):
+    if os.getenv("NLP_SHARED_MODEL_HOST", "false").lower() == "true":
+        from credit_analysis.model_host import shared_model_host
+        shared_model_host.stop()
+
 # Logging
 accesslog = "-"
 errorlog = "-"
@@ -30,7 +30,13 @@ from monitoring.middleware import MonitoringMiddleware
 from monitoring.health_check import router as health_router
 from neocred_realtime.websocket_routes import router as websocket_router
 from neocred_realtime.sse_routes import router as sse_router
+from neocred_realtime.websocket_manager import manager as websocket_manager
+from neocred_realtime.backplane import create_backplane
+from neocred_realtime.sse_hub import sse_hub
 from credit_analysis.routes import router as credit_router
+from credit_analysis.prediction_batcher import prediction_batcher
+from credit_analysis.document_engine import document_engine
+from credit_analysis.document_jobs import document_job_manager
 try:
     from automl.routes import router as intelligence_router
     AUTOML_AVAILABLE = True
@@ -84,6 +90,9 @@ async def lifespan(app: FastAPI):
         health_status = await db_manager.health_check()
         logger.info(f"Database Health: {health_status}")
         
+        # Cross-worker WebSocket fan-out (WS_BACKPLANE=redis); local-only if Redis is unreachable
+        await websocket_manager.start_backplane(create_backplane())
+        
         logger.info("✅ Enterprise backend startup completed")
         
     except Exception as e:
@@ -95,6 +104,11 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("🛑 NeoCred Enterprise Backend Shutting down...")
     try:
+        await prediction_batcher.close()
+        await document_job_manager.close()
+        await websocket_manager.stop_backplane()
+        await sse_hub.close()
+        document_engine.close()
         await db_manager.disconnect_all()
         logger.info("✅ Graceful shutdown completed")
     except Exception as e:
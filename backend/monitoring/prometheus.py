@@ -17,6 +17,9 @@ if PROMETHEUS_AVAILABLE:
     ACTIVE_USERS = Gauge('neocred_active_users', 'Number of active users')
     CHAT_MESSAGES = Counter('neocred_chat_messages_total', 'Total chat messages')
     CALCULATOR_USAGE = Counter('neocred_calculator_usage_total', 'Calculator usage', ['calculator_type'])
+    MODEL_BATCH_SIZE = Histogram('neocred_model_batch_size', 'Rows per micro-batched model call',
+                                 buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256])
+    MODEL_BATCH_QUEUE_DEPTH = Gauge('neocred_model_batch_queue_depth', 'Predictions waiting for a micro-batch')
     
     # System metrics
     CPU_USAGE = Gauge('neocred_cpu_usage_percent', 'CPU usage percentage')
@@ -24,6 +27,7 @@ if PROMETHEUS_AVAILABLE:
     DISK_USAGE = Gauge('neocred_disk_usage_percent', 'Disk usage percentage')
 else:
     REQUEST_COUNT = ACTIVE_USERS = CHAT_MESSAGES = CALCULATOR_USAGE = None
+    MODEL_BATCH_SIZE = MODEL_BATCH_QUEUE_DEPTH = None
     CPU_USAGE = MEMORY_USAGE = DISK_USAGE = None
 
 def setup_prometheus(app):
@@ -66,4 +70,10 @@ def track_calculator_usage(calculator_type: str):
 def track_active_users(count: int):
     """Update active users count"""
     if PROMETHEUS_AVAILABLE and ACTIVE_USERS:
-        ACTIVE_USERS.set(count)
\ No newline at end of file
+        ACTIVE_USERS.set(count)
+
+def track_model_batch(batch_size: int, queue_depth: int):
+    """Track micro-batched model call size and remaining queue depth"""
+    if PROMETHEUS_AVAILABLE and MODEL_BATCH_SIZE:
+        MODEL_BATCH_SIZE.observe(batch_size)
+        MODEL_BATCH_QUEUE_DEPTH.set(queue_depth)
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""Pub/Sub Backplane for Cross-worker WebSocket Fan-out"""
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[str], None]
+
+class Backplane(ABC):
+    """Channel shared by all workers: publish once, every worker receives
+
+    Also tracks presence (open sockets per user or group) per worker, so
+    any worker can tell whether a user is connected anywhere.
+    """
+
+    @abstractmethod
+    async def start(self, worker_id: str, handler: MessageHandler):
+        """Subscribe; ``handler`` gets every published payload, including this worker's own"""
+
+    @abstractmethod
+    async def publish(self, payload: str):
+        """Send a payload to every worker"""
+
+    @abstractmethod
+    async def presence_add(self, key: str):
+        """Count one more socket for ``key`` on this worker"""
+
+    @abstractmethod
+    async def presence_remove(self, key: str):
+        """Count one socket less for ``key`` on this worker"""
+
+    @abstractmethod
+    async def presence(self, key: str) -> Dict[str, int]:
+        """Open sockets for ``key`` per worker id"""
+
+    @abstractmethod
+    async def close(self):
+        """Unsubscribe and drop this worker's presence"""
+
+class InMemoryHub:
+    """Process-local stand-in for the Redis server, shared by in-memory backplanes"""
+
+    def __init__(self):
+        self.subscribers: List["InMemoryBackplane"] = []
+        self.presence: Dict[str, Counter] = {}
+
+class InMemoryBackplane(Backplane):
+    """Backplane over an InMemoryHub; several managers in one process act as workers (tests, benchmarks)"""
+
+    def __init__(self, hub: Optional[InMemoryHub] = None):
+        self.hub = hub or InMemoryHub()
+        self.worker_id: Optional[str] = None
+        self.handler: Optional[MessageHandler] = None
+
+    async def start(self, worker_id: str, handler: MessageHandler):
+        self.worker_id = worker_id
+        self.handler = handler
+        self.hub.presence.setdefault(worker_id, Counter())
+        self.hub.subscribers.append(self)
+
+    async def publish(self, payload: str):
+        # Delivered on a later loop iteration, like a message coming off a socket
+        loop = asyncio.get_running_loop()
+        for subscriber in self.hub.subscribers:
+            loop.call_soon(subscriber.handler, payload)
+
+    async def presence_add(self, key: str):
+        self.hub.presence[self.worker_id][key] += 1
+
+    async def presence_remove(self, key: str):
+        counts = self.hub.presence[self.worker_id]
+        counts[key] -= 1
+        if counts[key] <= 0:
+            del counts[key]
+
+    async def presence(self, key: str) -> Dict[str, int]:
+        return {worker: counts[key] for worker, counts in self.hub.presence.items() if counts.get(key)}
+
+    async def close(self):
+        if self in self.hub.subscribers:
+            self.hub.subscribers.remove(self)
+        self.hub.presence.pop(self.worker_id, None)
+
+class RedisBackplane(Backplane):
+    """Redis pub/sub channel, with presence in one hash per worker
+
+    Each worker's presence hash expires unless the worker keeps
+    refreshing it, so sockets of a crashed worker drop out of presence
+    after ``presence_ttl`` seconds.
+    """
+
+    def __init__(self, url: str, channel: str = "neocred:ws", presence_ttl: int = 30):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.channel = channel
+        self.presence_ttl = presence_ttl
+        self.workers_key = f"{channel}:workers"
+        self.worker_id: Optional[str] = None
+        self._pubsub = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _presence_key(self, worker_id: str) -> str:
+        return f"{self.channel}:presence:{worker_id}"
+
+    async def start(self, worker_id: str, handler: MessageHandler):
+        self.worker_id = worker_id
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        await self._heartbeat_once()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._listen(handler)), loop.create_task(self._heartbeat())]
+
+    async def _listen(self, handler: MessageHandler):
+        """Hand every channel message to the handler, resubscribing after connection errors"""
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        handler(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"WebSocket backplane subscription lost, resubscribing: {e}")
+                await asyncio.sleep(1)
+                try:
+                    self._pubsub = self.redis.pubsub()
+                    await self._pubsub.subscribe(self.channel)
+                except Exception as e:
+                    logger.warning(f"WebSocket backplane resubscribe failed: {e}")
+
+    async def _heartbeat_once(self):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(self.workers_key, self.worker_id)
+            pipe.expire(self._presence_key(self.worker_id), self.presence_ttl)
+            await pipe.execute()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.presence_ttl / 3)
+            try:
+                await self._heartbeat_once()
+            except Exception as e:
+                logger.warning(f"WebSocket presence heartbeat failed: {e}")
+
+    async def publish(self, payload: str):
+        await self.redis.publish(self.channel, payload)
+
+    async def presence_add(self, key: str):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hincrby(self._presence_key(self.worker_id), key, 1)
+            pipe.expire(self._presence_key(self.worker_id), self.presence_ttl)
+            await pipe.execute()
+
+    async def presence_remove(self, key: str):
+        count = await self.redis.hincrby(self._presence_key(self.worker_id), key, -1)
+        if count <= 0:
+            await self.redis.hdel(self._presence_key(self.worker_id), key)
+
+    async def presence(self, key: str) -> Dict[str, int]:
+        workers = sorted(await self.redis.smembers(self.workers_key))
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for worker in workers:
+                pipe.exists(self._presence_key(worker))
+                pipe.hget(self._presence_key(worker), key)
+            results = await pipe.execute()
+
+        counts = {}
+        for index, worker in enumerate(workers):
+            alive, count = results[2 * index], results[2 * index + 1]
+            if not alive and worker != self.worker_id:
+                # Presence hash expired: the worker is gone
+                await self.redis.srem(self.workers_key, worker)
+            elif count and int(count) > 0:
+                counts[worker] = int(count)
+        return counts
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        try:
+            await self.redis.delete(self._presence_key(self.worker_id))
+            await self.redis.srem(self.workers_key, self.worker_id)
+            if self._pubsub is not None:
+                await self._pubsub.unsubscribe(self.channel)
+                await self._pubsub.close()
+        finally:
+            await self.redis.close()
+
+def create_backplane() -> Optional[Backplane]:
+    """Backplane from WS_BACKPLANE: redis, memory (single process) or none"""
+    kind = os.getenv("WS_BACKPLANE", "none").lower()
+    if kind == "redis":
+        try:
+            return RedisBackplane(os.getenv("REDIS_URL", "redis://localhost:6379"),
+                                  channel=os.getenv("WS_BACKPLANE_CHANNEL", "neocred:ws"))
+        except ImportError:
+            logger.warning("redis not installed, WebSocket messages reach local sockets only")
+            return None
+    if kind == "memory":
+        return InMemoryBackplane()
+    return None
@@ -33,6 +33,8 @@ async def websocket_client_example():
                 # Handle different message types
                 if data.get("type") == "pong":
                     print("💓 Heartbeat received")
+                elif data.get("type") == "batch":
+                    print(f"📦 Batch of {len(data['messages'])} coalesced updates")
                 elif data.get("type") == "credit_analysis":
                     print(f"📊 Credit Analysis: {data.get('data')}")
                 elif data.get("type") == "calculation_progress":
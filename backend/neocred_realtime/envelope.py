@@ -0,0 +1,81 @@
+"""Serialize-once Message Envelopes"""
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Union
+import json
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(message: Any) -> bytes:
+    """Compact UTF-8 JSON; orjson when installed, datetimes as ISO 8601"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+class Envelope:
+    """A message encoded once and shared by every recipient and transport
+
+    ``payload`` is the JSON body as bytes (WebSocket binary frames);
+    ``text`` (WebSocket text frames) and ``sse`` (a complete ``data:``
+    event) are derived from it on first use and cached, so a broadcast does
+    no per-recipient encoding. ``type`` is the coalescing key.
+    """
+
+    __slots__ = ("payload", "type", "_text", "_sse")
+
+    def __init__(self, payload: bytes, type: Optional[str] = None):
+        self.payload = payload
+        self.type = type
+        self._text: Optional[str] = None
+        self._sse: Optional[bytes] = None
+
+    @classmethod
+    def build(cls, type: str, **fields) -> "Envelope":
+        """Message of ``type`` stamped with the current time"""
+        return cls(dumps({"type": type, "timestamp": datetime.now(), **fields}), type)
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> "Envelope":
+        return cls(dumps(message), message.get("type"))
+
+    @classmethod
+    def from_text(cls, text: str, type: Optional[str] = None) -> "Envelope":
+        """Envelope around JSON that is already encoded"""
+        envelope = cls(text.encode(), type)
+        envelope._text = text
+        return envelope
+
+    @classmethod
+    def batch(cls, messages: List["Envelope"]) -> "Envelope":
+        """``{"type": "batch", "messages": [...]}`` spliced from the encoded messages"""
+        # Untyped, so queue coalescing never replaces one batch with another
+        return cls(b'{"type":"batch","messages":[' + b",".join(m.payload for m in messages) + b"]}")
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.payload.decode()
+        return self._text
+
+    @property
+    def sse(self) -> bytes:
+        # Compact JSON has no raw newlines, so the body fits one data line
+        if self._sse is None:
+            self._sse = b"data: " + self.payload + b"\n\n"
+        return self._sse
+
+def as_envelope(message: Union[Envelope, Dict[str, Any], str]) -> Envelope:
+    """Envelope for a message dict, already-encoded JSON text, or an Envelope (returned as is)"""
+    if isinstance(message, Envelope):
+        return message
+    if isinstance(message, str):
+        return Envelope.from_text(message)
+    return Envelope.from_message(message)
@@ -0,0 +1,201 @@
+"""Shared-producer Server-Sent Events Hub"""
+import asyncio
+import logging
+import os
+import secrets
+from collections import deque
+from typing import Dict, Any, AsyncGenerator, AsyncIterator, Callable, Optional, Set, Union
+from .envelope import Envelope, as_envelope
+
+logger = logging.getLogger(__name__)
+
+Producer = Callable[[], AsyncIterator[Union[Dict[str, Any], Envelope]]]
+
+class SSEClient:
+    """Bounded frame queue of one SSE connection; the oldest frame is dropped when full"""
+
+    __slots__ = ("frames", "ready", "dropped", "ended")
+
+    def __init__(self, max_queue: int):
+        self.frames: deque = deque(maxlen=max_queue)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        self.ended = False
+
+    def push(self, frame: bytes):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        self.ready.set()
+
+class SSETopic:
+    """Clients, replay buffer and producer task of one topic"""
+
+    def __init__(self, name: str, replay_size: int):
+        self.name = name
+        self.clients: Set[SSEClient] = set()
+        self.replay: deque = deque(maxlen=replay_size)  # (sequence, frame)
+        self.sequence = 0
+        self.producer: Optional[asyncio.Task] = None
+        self.idle_handle: Optional[asyncio.TimerHandle] = None
+        self.done = False
+
+class SSEHub:
+    """One producer task per topic, fanning preformatted frames out to bounded client queues
+
+    The producer of a topic starts with its first client and computes
+    each update once; ``publish`` encodes it into a single ``id:``/``data:``
+    frame that every client queue shares. Event ids are
+    ``<hub epoch>-<seq>``, so a reconnecting client's ``Last-Event-ID``
+    replays the frames it missed from the last ``replay_size``; new
+    clients, and ids from another process or an earlier run, get the
+    latest frame. A topic without clients keeps running for
+    ``idle_timeout`` seconds, so a single tab can reconnect and resume,
+    and is then stopped. When a producer fails, its clients' streams end
+    (EventSource reconnects with ``Last-Event-ID``) and the next
+    subscriber starts a new producer.
+    """
+
+    def __init__(self, max_queue: int = 64, replay_size: int = 100, idle_timeout: float = 60.0,
+                 disconnect_poll: float = 5.0):
+        self.max_queue = max_queue
+        self.replay_size = replay_size
+        self.idle_timeout = idle_timeout
+        self.disconnect_poll = disconnect_poll
+        self.epoch = secrets.token_hex(4)
+        self.topics: Dict[str, SSETopic] = {}
+        self.frames_published = 0
+        self.producer_failures = 0
+        self._closed_dropped = 0
+
+    def publish(self, topic_name: str, message: Union[Dict[str, Any], Envelope]) -> int:
+        """Frame a message once and queue it for every client of the topic; returns the client count"""
+        topic = self.topics.get(topic_name)
+        if topic is None:
+            return 0
+        topic.sequence += 1
+        frame = b"id: %s-%d\n%s" % (self.epoch.encode(), topic.sequence, as_envelope(message).sse)
+        topic.replay.append((topic.sequence, frame))
+        self.frames_published += 1
+        for client in topic.clients:
+            client.push(frame)
+        return len(topic.clients)
+
+    def _catch_up(self, topic: SSETopic, last_event_id: Optional[str]) -> list:
+        """Frames after ``last_event_id``; without a usable id, the latest frame (current state)"""
+        epoch, _, sequence = (last_event_id or "").partition("-")
+        if epoch == self.epoch and sequence.isdigit():
+            return [frame for seq, frame in topic.replay if seq > int(sequence)]
+        return [topic.replay[-1][1]] if topic.replay else []
+
+    def subscribe(self, topic_name: str, producer: Producer, last_event_id: Optional[str] = None) -> SSEClient:
+        """Join a topic, starting its producer if needed; missed or latest frames are queued first"""
+        topic = self.topics.get(topic_name)
+        if topic is None:
+            topic = self.topics[topic_name] = SSETopic(topic_name, self.replay_size)
+        if topic.idle_handle is not None:
+            topic.idle_handle.cancel()
+            topic.idle_handle = None
+        if topic.producer is None and not topic.done:
+            topic.producer = asyncio.get_running_loop().create_task(self._run(topic, producer))
+
+        client = SSEClient(self.max_queue)
+        for frame in self._catch_up(topic, last_event_id):
+            client.push(frame)
+        topic.clients.add(client)
+        return client
+
+    def unsubscribe(self, topic_name: str, client: SSEClient):
+        topic = self.topics.get(topic_name)
+        if topic is None or client not in topic.clients:
+            return
+        topic.clients.discard(client)
+        self._closed_dropped += client.dropped
+        if not topic.clients and topic.idle_handle is None:
+            topic.idle_handle = asyncio.get_running_loop().call_later(self.idle_timeout, self._close_if_idle, topic)
+
+    def _close_if_idle(self, topic: SSETopic):
+        topic.idle_handle = None
+        if topic.clients or self.topics.get(topic.name) is not topic:
+            return
+        del self.topics[topic.name]
+        if topic.producer is not None:
+            topic.producer.cancel()
+
+    async def _run(self, topic: SSETopic, producer: Producer):
+        failed = False
+        try:
+            async for message in producer():
+                self.publish(topic.name, message)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"SSE producer for {topic.name} failed: {e}")
+            self.producer_failures += 1
+            failed = True
+        finally:
+            if failed:
+                # Clients reconnect and resume; the next subscribe restarts the producer
+                topic.producer = None
+                for client in topic.clients:
+                    client.ended = True
+            else:
+                # Finite producers end their streams once clients have drained
+                topic.done = True
+            for client in topic.clients:
+                client.ready.set()
+
+    async def stream(self, request, topic_name: str, producer: Producer,
+                     last_event_id: Optional[str] = None) -> AsyncGenerator[bytes, None]:
+        """Frames of a topic for one request, until the client disconnects or the producer ends"""
+        client = self.subscribe(topic_name, producer, last_event_id)
+        topic = self.topics[topic_name]
+        try:
+            while True:
+                while client.frames:
+                    yield client.frames.popleft()
+                if topic.done or client.ended:
+                    break
+                client.ready.clear()
+                try:
+                    async with asyncio.timeout(self.disconnect_poll):
+                        await client.ready.wait()
+                except TimeoutError:
+                    pass
+                if await request.is_disconnected():
+                    break
+        finally:
+            self.unsubscribe(topic_name, client)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Topic and client counts, frames published and frames dropped from full client queues"""
+        clients = [client for topic in self.topics.values() for client in topic.clients]
+        return {
+            "topics": len(self.topics),
+            "producers_running": sum(topic.producer is not None and not topic.done for topic in self.topics.values()),
+            "clients": len(clients),
+            "frames_published": self.frames_published,
+            "producer_failures": self.producer_failures,
+            "frames_dropped": self._closed_dropped + sum(client.dropped for client in clients),
+            "queue_depth_max": max((len(client.frames) for client in clients), default=0),
+            "max_queue": self.max_queue,
+            "replay_size": self.replay_size
+        }
+
+    async def close(self):
+        """Stop every producer"""
+        tasks = [topic.producer for topic in self.topics.values() if topic.producer is not None]
+        for topic in self.topics.values():
+            if topic.idle_handle is not None:
+                topic.idle_handle.cancel()
+        self.topics.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# Global SSE hub
+sse_hub = SSEHub(
+    max_queue=int(os.getenv("SSE_QUEUE_SIZE", "64")),
+    replay_size=int(os.getenv("SSE_REPLAY_SIZE", "100")),
+    idle_timeout=float(os.getenv("SSE_IDLE_TIMEOUT_SECONDS", "60"))
+)
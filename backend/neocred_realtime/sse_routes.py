@@ -1,85 +1,110 @@
 """Server-Sent Events Routes (Optional)"""
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Header, Request
 from sse_starlette.sse import EventSourceResponse
 import asyncio
-import json
 from datetime import datetime
-from typing import AsyncGenerator
+from functools import partial
+from typing import AsyncGenerator, Optional
+from .envelope import Envelope
+from .sse_hub import sse_hub
 
 router = APIRouter()
 
 class SSEStreamer:
-    """Server-Sent Events streamer"""
+    """Server-Sent Events streamer
+    
+    Periodic updates are producers for the SSE hub: one instance per
+    topic yields Envelopes for all of its clients. Per-request streams
+    yield complete ``data:`` frames as bytes (``Envelope.sse``), which
+    EventSourceResponse writes out unchanged.
+    """
     
     @staticmethod
-    async def credit_score_stream(user_id: str) -> AsyncGenerator[str, None]:
-        """Stream credit score updates"""
+    async def credit_score_updates(user_id: str) -> AsyncGenerator[Envelope, None]:
+        """Produce credit score updates"""
         while True:
             # Simulate credit score data
             credit_data = {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": datetime.now(),
                 "credit_score": 750,
                 "change": "+5",
                 "factors": ["On-time payments", "Low utilization"]
             }
             
-            yield f"data: {json.dumps(credit_data)}\n\n"
+            yield Envelope.from_message(credit_data)
             await asyncio.sleep(30)  # Update every 30 seconds
     
     @staticmethod
-    async def market_updates_stream() -> AsyncGenerator[str, None]:
-        """Stream market updates"""
+    async def market_updates() -> AsyncGenerator[Envelope, None]:
+        """Produce market updates"""
         while True:
             # Simulate market data
             market_data = {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": datetime.now(),
                 "nifty": 19500,
                 "sensex": 65000,
                 "change": "+0.5%",
                 "status": "market_open"
             }
             
-            yield f"data: {json.dumps(market_data)}\n\n"
+            yield Envelope.from_message(market_data)
             await asyncio.sleep(60)  # Update every minute
     
     @staticmethod
-    async def calculation_progress_stream(calculation_id: str) -> AsyncGenerator[str, None]:
+    async def calculation_progress_stream(calculation_id: str) -> AsyncGenerator[bytes, None]:
         """Stream calculation progress"""
         for progress in range(0, 101, 10):
             progress_data = {
                 "calculation_id": calculation_id,
                 "progress": progress,
                 "status": "completed" if progress == 100 else "processing",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now()
             }
             
-            yield f"data: {json.dumps(progress_data)}\n\n"
+            yield Envelope.from_message(progress_data).sse
             
             if progress == 100:
                 break
             
             await asyncio.sleep(0.5)  # Simulate processing time
+    
+    @staticmethod
+    async def document_job_stream(job_id: str) -> AsyncGenerator[bytes, None]:
+        """Stream progress of a background document-analysis job"""
+        from credit_analysis.document_jobs import document_job_manager
+        async for progress_data in document_job_manager.stream_progress(job_id):
+            yield Envelope.from_message(progress_data).sse
 
 @router.get("/sse/credit-score/{user_id}")
-async def credit_score_sse(request: Request, user_id: str):
-    """SSE endpoint for credit score updates"""
+async def credit_score_sse(request: Request, user_id: str, last_event_id: Optional[str] = Header(None)):
+    """SSE endpoint for credit score updates (resumes after Last-Event-ID)"""
     return EventSourceResponse(
-        SSEStreamer.credit_score_stream(user_id),
+        sse_hub.stream(request, f"credit_score.{user_id}", partial(SSEStreamer.credit_score_updates, user_id),
+                       last_event_id),
         headers={"Cache-Control": "no-cache"}
     )
 
 @router.get("/sse/market-updates")
-async def market_updates_sse(request: Request):
-    """SSE endpoint for market updates"""
+async def market_updates_sse(request: Request, last_event_id: Optional[str] = Header(None)):
+    """SSE endpoint for market updates (resumes after Last-Event-ID)"""
     return EventSourceResponse(
-        SSEStreamer.market_updates_stream(),
+        sse_hub.stream(request, "market", SSEStreamer.market_updates, last_event_id),
         headers={"Cache-Control": "no-cache"}
     )
 
+@router.get("/sse/metrics")
+async def sse_metrics():
+    """Topics, clients, and published and dropped frame counters of the SSE hub"""
+    return sse_hub.get_metrics()
+
 @router.get("/sse/calculation/{calculation_id}")
 async def calculation_progress_sse(request: Request, calculation_id: str):
-    """SSE endpoint for calculation progress"""
-    return EventSourceResponse(
-        SSEStreamer.calculation_progress_stream(calculation_id),
-        headers={"Cache-Control": "no-cache"}
-    )
\ No newline at end of file
+    """SSE endpoint for calculation progress (document-analysis jobs report real per-page progress)"""
+    # Imported here: the realtime package must not pull in the OCR/NLP stack at import time
+    from credit_analysis.document_jobs import document_job_manager
+    if document_job_manager.get(calculation_id) is not None:
+        stream = SSEStreamer.document_job_stream(calculation_id)
+    else:
+        stream = SSEStreamer.calculation_progress_stream(calculation_id)
+    
+    return EventSourceResponse(stream, headers={"Cache-Control": "no-cache"})
\ No newline at end of file
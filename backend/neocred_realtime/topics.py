@@ -0,0 +1,101 @@
+"""Topic Subscriptions for WebSocket Fan-out"""
+import re
+from typing import Any, Dict, Set, Hashable, Optional
+
+# Dot-separated segments (no whitespace or "*"); a subscription may end in
+# ".*" (or be "*") to match every topic below that prefix
+TOPIC_RE = re.compile(r"[^.*\s]+(\.[^.*\s]+)*")
+WILDCARD_RE = re.compile(r"\*|([^.*\s]+\.)+\*")
+
+MARKET_ALERT_TOPIC = "market.alert"
+RISK_USER_PREFIX = "risk.user."
+
+def is_valid_topic(topic: str, wildcard: bool = True) -> bool:
+    """Whether ``topic`` is a concrete topic, or with ``wildcard`` also a ``prefix.*`` pattern"""
+    if not isinstance(topic, str):
+        return False
+    return bool(TOPIC_RE.fullmatch(topic) or (wildcard and WILDCARD_RE.fullmatch(topic)))
+
+def risk_topic(user_id: str) -> str:
+    """Topic of a user's risk score updates; the user's own sockets subscribe to it on connect"""
+    return f"{RISK_USER_PREFIX}{user_id}"
+
+def subscription_error(subscription: Any, user_id: Optional[str]) -> Optional[str]:
+    """Why a client may not subscribe to ``subscription``, or None if it may"""
+    if not is_valid_topic(subscription):
+        return "invalid_topic"
+    # Risk updates are per user: only the user's own topic, never a wildcard over users
+    over_users = subscription.endswith("*") and RISK_USER_PREFIX.startswith(subscription[:-1])
+    if subscription.startswith(RISK_USER_PREFIX) or over_users:
+        if not user_id or subscription != risk_topic(user_id):
+            return "forbidden"
+    return None
+
+class TopicIndex:
+    """Topic to subscribers, with ``prefix.*`` wildcards
+
+    Exact subscriptions and wildcards live in separate dicts, wildcards
+    keyed by their prefix (``"market."`` for ``market.*``, ``""`` for
+    ``*``). Matching a published topic looks up the topic itself and each
+    of its dot prefixes, so it costs the number of segments plus the
+    number of subscribers found, however many connections exist.
+    """
+
+    def __init__(self):
+        self.exact: Dict[str, Set[Hashable]] = {}
+        self.prefixes: Dict[str, Set[Hashable]] = {}
+        self.by_subscriber: Dict[Hashable, Set[str]] = {}
+
+    def _bucket(self, pattern: str):
+        if pattern.endswith("*"):
+            return self.prefixes, pattern[:-1]
+        return self.exact, pattern
+
+    def subscribe(self, subscriber: Hashable, pattern: str) -> bool:
+        """Add a subscription; False if it already existed"""
+        if not is_valid_topic(pattern):
+            raise ValueError(f"Invalid topic: {pattern!r}")
+        patterns = self.by_subscriber.setdefault(subscriber, set())
+        if pattern in patterns:
+            return False
+        patterns.add(pattern)
+        index, key = self._bucket(pattern)
+        index.setdefault(key, set()).add(subscriber)
+        return True
+
+    def unsubscribe(self, subscriber: Hashable, pattern: str) -> bool:
+        """Remove a subscription; False if there was none"""
+        patterns = self.by_subscriber.get(subscriber)
+        if not patterns or pattern not in patterns:
+            return False
+        patterns.discard(pattern)
+        if not patterns:
+            del self.by_subscriber[subscriber]
+        index, key = self._bucket(pattern)
+        index[key].discard(subscriber)
+        if not index[key]:
+            del index[key]
+        return True
+
+    def remove(self, subscriber: Hashable):
+        """Drop every subscription of a subscriber"""
+        for pattern in list(self.by_subscriber.get(subscriber, ())):
+            self.unsubscribe(subscriber, pattern)
+
+    def match(self, topic: str) -> Set[Hashable]:
+        """Subscribers of a concrete topic, each once however many of its patterns match"""
+        subscribers = set(self.exact.get(topic, ()))
+        if self.prefixes:
+            subscribers.update(self.prefixes.get("", ()))
+            index = topic.find(".")
+            while index != -1:
+                subscribers.update(self.prefixes.get(topic[:index + 1], ()))
+                index = topic.find(".", index + 1)
+        return subscribers
+
+    def subscriptions(self, subscriber: Hashable) -> Set[str]:
+        return set(self.by_subscriber.get(subscriber, ()))
+
+    def __len__(self) -> int:
+        """Number of distinct topics and patterns with subscribers"""
+        return len(self.exact) + len(self.prefixes)
@@ -1,21 +1,257 @@
 """WebSocket Manager for Real-time Updates"""
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Callable, Iterable, Optional, Union
+from collections import deque
 import json
 import asyncio
-from datetime import datetime
+import logging
+import os
+import secrets
+import socket
+from .backplane import Backplane
+from .envelope import Envelope, as_envelope
+from .topics import TopicIndex, is_valid_topic, risk_topic, MARKET_ALERT_TOPIC
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+# "Try again later": the client fell too far behind and may reconnect
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# Unexpected send failure: closed so the client notices and reconnects
+SEND_ERROR_CLOSE_CODE = 1011
+# High-frequency updates where only the latest value per type matters
+COALESCED_MESSAGE_TYPES = frozenset({"portfolio_update", "risk_score_update"})
+
+class ClientConnection:
+    """One WebSocket with a bounded send queue drained by its own writer task
+    
+    ``enqueue`` never awaits, so broadcasting is a loop of deque appends
+    of one shared Envelope; only the writer task talks to the socket, with
+    text frames or, for ``binary`` clients, binary frames. When the queue
+    is full the slow-consumer policy applies: ``drop_oldest`` discards the
+    oldest pending message, ``coalesce`` replaces a pending message with
+    the same key (message type) and otherwise drops the oldest, and
+    ``disconnect`` closes the socket.
+    
+    Types in COALESCED_MESSAGE_TYPES skip the queue while a flush is due:
+    only the latest message per type is kept, and at most once per
+    ``coalesce_interval`` the kept messages are queued, several at once as
+    one ``batch`` frame. An update after a quiet interval goes out at once.
+    """
+    
+    def __init__(self, websocket: WebSocket, client_id: str, user_id: Optional[str] = None,
+                 max_queue: int = 256, policy: str = "drop_oldest", send_timeout: float = 10.0,
+                 on_closed: Optional[Callable[["ClientConnection"], None]] = None, binary: bool = False,
+                 coalesce_interval: float = 0.25):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow-consumer policy: {policy}")
+        self.websocket = websocket
+        self.client_id = client_id
+        self.user_id = user_id
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.on_closed = on_closed
+        self.binary = binary
+        self.coalesce_interval = coalesce_interval
+        self.pending: deque = deque()  # Envelopes
+        self.latest: Dict[str, Envelope] = {}  # coalesced type -> newest message awaiting flush
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._last_flush = float("-inf")
+        self.closed = False
+        self._close_code: Optional[int] = None
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self.metrics = {"enqueued": 0, "sent": 0, "dropped": 0, "coalesced": 0, "batches": 0, "max_depth": 0}
+    
+    def start(self):
+        """Start the writer task on the running loop"""
+        self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+    
+    def enqueue(self, message: Envelope) -> bool:
+        """Queue a message without waiting; False if the connection is (being) closed"""
+        if self.closed:
+            return False
+        if self.coalesce_interval > 0 and message.type in COALESCED_MESSAGE_TYPES:
+            return self._coalesce(message)
+        return self._push(message)
+    
+    def set_max_rate(self, max_rate: float, floor_interval: float = 0.0) -> float:
+        """Cap coalesced updates at ``max_rate`` per second (never faster than ``floor_interval``); returns the rate"""
+        self.coalesce_interval = max(1.0 / max_rate, floor_interval)
+        return 1.0 / self.coalesce_interval
+    
+    def _coalesce(self, message: Envelope) -> bool:
+        if message.type in self.latest:
+            self.metrics["coalesced"] += 1
+        self.latest[message.type] = message
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            delay = self._last_flush + self.coalesce_interval - loop.time()
+            if delay <= 0:
+                self._flush()
+            else:
+                self._flush_handle = loop.call_later(delay, self._flush)
+        return True
+    
+    def _flush(self):
+        """Queue the latest message of each coalesced type, as one frame"""
+        self._flush_handle = None
+        if self.closed or not self.latest:
+            return
+        self._last_flush = asyncio.get_running_loop().time()
+        messages = list(self.latest.values())
+        self.latest.clear()
+        if len(messages) > 1:
+            self.metrics["batches"] += 1
+            self._push(Envelope.batch(messages))
+        else:
+            self._push(messages[0])
+    
+    def _push(self, message: Envelope) -> bool:
+        if len(self.pending) >= self.max_queue:
+            if self.policy == "disconnect":
+                self.metrics["dropped"] += 1
+                self.close(SLOW_CONSUMER_CLOSE_CODE)
+                return False
+            if self.policy == "coalesce" and message.type is not None and self._replace(message):
+                self.metrics["coalesced"] += 1
+                return True
+            self.pending.popleft()
+            self.metrics["dropped"] += 1
+        
+        self.pending.append(message)
+        self.metrics["enqueued"] += 1
+        if len(self.pending) > self.metrics["max_depth"]:
+            self.metrics["max_depth"] = len(self.pending)
+        self._ready.set()
+        return True
+    
+    def _replace(self, message: Envelope) -> bool:
+        """Overwrite the newest pending message of the same type; only runs on a full queue"""
+        for index in range(len(self.pending) - 1, -1, -1):
+            if self.pending[index].type == message.type:
+                self.pending[index] = message
+                return True
+        return False
+    
+    async def _write_loop(self):
+        """Drain the queue to the socket until closed, or until a send fails or stalls"""
+        try:
+            while not self.closed:
+                if not self.pending:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                message = self.pending.popleft()
+                async with asyncio.timeout(self.send_timeout):
+                    if self.binary:
+                        await self.websocket.send_bytes(message.payload)
+                    else:
+                        await self.websocket.send_text(message.text)
+                self.metrics["sent"] += 1
+        except asyncio.CancelledError:
+            pass
+        except TimeoutError:
+            logger.debug(f"WebSocket send to {self.client_id} stalled, closing")
+            self._close_code = SLOW_CONSUMER_CLOSE_CODE
+        except Exception as e:
+            logger.debug(f"WebSocket writer for {self.client_id} stopped: {e}")
+            self._close_code = SEND_ERROR_CLOSE_CODE
+        finally:
+            self.closed = True
+            self.pending.clear()
+            self._cancel_flush()
+            if self._close_code is not None:
+                try:
+                    # A stalled socket may not take the close frame either
+                    async with asyncio.timeout(self.send_timeout):
+                        await self.websocket.close(code=self._close_code)
+                except Exception:
+                    pass
+            if self.on_closed is not None:
+                self.on_closed(self)
+    
+    def close(self, code: Optional[int] = None):
+        """Stop the writer; with ``code`` the socket is closed with it first"""
+        if self.closed:
+            return
+        self.closed = True
+        self._close_code = code
+        self._cancel_flush()
+        if code is not None:
+            self._ready.set()  # let the writer close the socket itself
+        elif self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+    
+    def _cancel_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self.latest.clear()
+    
+    @property
+    def depth(self) -> int:
+        return len(self.pending)
 
 class ConnectionManager:
-    """Manage WebSocket connections"""
+    """Manage WebSocket connections
+    
+    Every connection gets a ClientConnection with a bounded send queue
+    (``WS_SEND_QUEUE_SIZE``) and a writer task, so a broadcast only
+    enqueues and one slow client never delays the others. Full queues are
+    handled by ``WS_SLOW_CONSUMER_POLICY`` (drop_oldest, coalesce or
+    disconnect); sends stalled longer than ``WS_SEND_TIMEOUT_SECONDS``
+    drop the connection. High-frequency update types are coalesced per
+    connection every ``WS_COALESCE_INTERVAL_MS``; clients may ask for a
+    lower rate (``set_max_rate``).
+    
+    Sockets are local to one worker process. With a backplane attached
+    (``start_backplane``), user, group and broadcast messages go to this
+    worker's sockets directly and are published once; every other worker
+    fans them out to its own sockets. User and group presence is counted
+    per worker on the backplane.
+    
+    ``publish`` delivers to the sockets subscribed to a topic (``topics``,
+    a TopicIndex with ``prefix.*`` wildcards) rather than to everyone.
+    """
     
-    def __init__(self):
+    def __init__(self, max_queue: int = 256, policy: str = "drop_oldest", send_timeout: float = 10.0,
+                 worker_id: Optional[str] = None, coalesce_interval: float = 0.25):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow-consumer policy: {policy}")
+        # Default id is assigned in start_backplane: the global manager is created
+        # in the gunicorn master (preload_app) and inherited by every forked worker
+        self._fixed_worker_id = worker_id
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.backplane: Optional[Backplane] = None
+        self._presence_tasks: set = set()
+        self.backplane_metrics = {"published": 0, "received": 0, "errors": 0}
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.coalesce_interval = coalesce_interval
         self.active_connections: Dict[str, List[WebSocket]] = {}
         self.user_connections: Dict[str, WebSocket] = {}
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.topics = TopicIndex()
+        # Counters of connections that are gone, so totals survive disconnects
+        self._closed_totals = {"enqueued": 0, "sent": 0, "dropped": 0, "coalesced": 0, "batches": 0}
+        self.slow_consumer_disconnects = 0
     
-    async def connect(self, websocket: WebSocket, client_id: str, user_id: str = None):
-        """Accept WebSocket connection"""
+    async def connect(self, websocket: WebSocket, client_id: str, user_id: str = None, binary: bool = False,
+                      topics: Iterable[str] = ()):
+        """Accept WebSocket connection; ``binary`` clients get binary frames, ``topics`` are subscribed"""
         await websocket.accept()
         
+        connection = ClientConnection(
+            websocket, client_id, user_id, max_queue=self.max_queue, policy=self.policy,
+            send_timeout=self.send_timeout, on_closed=self._forget, binary=binary,
+            coalesce_interval=self.coalesce_interval
+        )
+        self.connections[websocket] = connection
+        connection.start()
+        
         # Add to active connections by client_id
         if client_id not in self.active_connections:
             self.active_connections[client_id] = []
@@ -24,9 +260,75 @@ class ConnectionManager:
         # Map user to connection if user_id provided
         if user_id:
             self.user_connections[user_id] = websocket
+        for topic in topics:
+            self.topics.subscribe(connection, topic)
+        self._update_presence(connection, add=True)
     
-    def disconnect(self, websocket: WebSocket, client_id: str, user_id: str = None):
-        """Remove WebSocket connection"""
+    async def start_backplane(self, backplane: Optional[Backplane]) -> bool:
+        """Attach a backplane and fan out what other workers publish on it
+        
+        Returns False, leaving delivery local to this worker, when there is
+        no backplane or it cannot be reached.
+        """
+        if backplane is None:
+            return False
+        if self._fixed_worker_id is None:
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        try:
+            await backplane.start(self.worker_id, self._on_backplane_message)
+        except Exception as e:
+            self.backplane_metrics["errors"] += 1
+            logger.error(f"WebSocket backplane unavailable, delivering to this worker's sockets only: {e}")
+            try:
+                await backplane.close()
+            except Exception:
+                pass
+            return False
+        self.backplane = backplane
+        for connection in self.connections.values():
+            self._update_presence(connection, add=True)
+        return True
+    
+    async def stop_backplane(self):
+        backplane, self.backplane = self.backplane, None
+        if backplane is not None:
+            await asyncio.gather(*self._presence_tasks, return_exceptions=True)
+            await backplane.close()
+    
+    def _update_presence(self, connection: ClientConnection, add: bool):
+        """Count the connection's group and user on the backplane, in the background"""
+        if self.backplane is None:
+            return
+        update = self.backplane.presence_add if add else self.backplane.presence_remove
+        keys = [f"group:{connection.client_id}"]
+        if connection.user_id:
+            keys.append(f"user:{connection.user_id}")
+        loop = asyncio.get_running_loop()
+        for key in keys:
+            task = loop.create_task(update(key))
+            self._presence_tasks.add(task)
+            task.add_done_callback(self._presence_done)
+    
+    def _presence_done(self, task: asyncio.Task):
+        self._presence_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.backplane_metrics["errors"] += 1
+            logger.warning(f"WebSocket presence update failed: {task.exception()}")
+    
+    def _forget(self, connection: ClientConnection):
+        """Drop a connection from every index (idempotent)"""
+        websocket = connection.websocket
+        if self.connections.get(websocket) is not connection:
+            return
+        del self.connections[websocket]
+        self.topics.remove(connection)
+        self._update_presence(connection, add=False)
+        for name in self._closed_totals:
+            self._closed_totals[name] += connection.metrics[name]
+        if connection._close_code == SLOW_CONSUMER_CLOSE_CODE:
+            self.slow_consumer_disconnects += 1
+        
+        client_id, user_id = connection.client_id, connection.user_id
         if client_id in self.active_connections:
             if websocket in self.active_connections[client_id]:
                 self.active_connections[client_id].remove(websocket)
@@ -35,39 +337,153 @@ class ConnectionManager:
             if not self.active_connections[client_id]:
                 del self.active_connections[client_id]
         
-        # Remove user mapping
-        if user_id and user_id in self.user_connections:
+        # Remove user mapping, unless the user has reconnected on another socket
+        if user_id and self.user_connections.get(user_id) is websocket:
             del self.user_connections[user_id]
     
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        """Send message to specific WebSocket"""
+    def disconnect(self, websocket: WebSocket, client_id: str, user_id: str = None):
+        """Remove WebSocket connection"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.close()
+            self._forget(connection)
+    
+    def _enqueue(self, websocket: WebSocket, message: Envelope) -> bool:
+        connection = self.connections.get(websocket)
+        return connection is not None and connection.enqueue(message)
+    
+    async def send_personal_message(self, message: Union[str, Envelope], websocket: WebSocket):
+        """Send message to specific WebSocket (queued; returns immediately)"""
+        self._enqueue(websocket, as_envelope(message))
+    
+    def subscribe(self, websocket: WebSocket, topic: str) -> bool:
+        """Subscribe a socket to a topic or ``prefix.*`` pattern; ValueError if the topic is invalid"""
+        connection = self.connections.get(websocket)
+        return connection is not None and self.topics.subscribe(connection, topic)
+    
+    def unsubscribe(self, websocket: WebSocket, topic: str) -> bool:
+        connection = self.connections.get(websocket)
+        return connection is not None and self.topics.unsubscribe(connection, topic)
+    
+    def set_max_rate(self, websocket: WebSocket, max_rate: float) -> Optional[float]:
+        """Cap a socket's coalesced updates per second, no faster than the server interval; returns the rate"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return None
+        return connection.set_max_rate(max_rate, self.coalesce_interval)
+    
+    def _deliver_local(self, target: str, name: Optional[str], message: Envelope) -> int:
+        """Queue a message on this worker's sockets for a topic, a user, a group or everyone"""
+        if target == "topic":
+            return sum(connection.enqueue(message) for connection in self.topics.match(name))
+        if target == "user":
+            websocket = self.user_connections.get(name)
+            return int(websocket is not None and self._enqueue(websocket, message))
+        if target == "group":
+            return sum(self._enqueue(connection, message)
+                       for connection in list(self.active_connections.get(name, ())))
+        return sum(connection.enqueue(message) for connection in list(self.connections.values()))
+    
+    async def _publish(self, target: str, name: Optional[str], message: Envelope):
+        """Hand a message to the other workers; local delivery has already happened"""
+        if self.backplane is None:
+            return
+        # Routing header line, then the encoded message as is
+        header = json.dumps({"origin": self.worker_id, "target": target, "name": name, "key": message.type})
         try:
-            await websocket.send_text(message)
-        except:
-            pass  # Connection closed
-    
-    async def send_to_user(self, message: Dict[str, Any], user_id: str):
-        """Send message to specific user"""
-        if user_id in self.user_connections:
-            websocket = self.user_connections[user_id]
-            await self.send_personal_message(json.dumps(message), websocket)
-    
-    async def broadcast_to_group(self, message: Dict[str, Any], client_id: str):
-        """Broadcast message to all connections in a group"""
-        if client_id in self.active_connections:
-            message_str = json.dumps(message)
-            for connection in self.active_connections[client_id]:
-                await self.send_personal_message(message_str, connection)
-    
-    async def broadcast_all(self, message: Dict[str, Any]):
-        """Broadcast message to all active connections"""
-        message_str = json.dumps(message)
-        for client_connections in self.active_connections.values():
-            for connection in client_connections:
-                await self.send_personal_message(message_str, connection)
+            await self.backplane.publish(f"{header}\n{message.text}")
+            self.backplane_metrics["published"] += 1
+        except Exception as e:
+            self.backplane_metrics["errors"] += 1
+            logger.warning(f"WebSocket backplane publish failed, delivered on this worker only: {e}")
+    
+    def _on_backplane_message(self, payload: str):
+        """Fan a message published by another worker out to this worker's sockets"""
+        header_line, _, text = payload.partition("\n")
+        try:
+            header = json.loads(header_line)
+        except ValueError:
+            self.backplane_metrics["errors"] += 1
+            return
+        if header.get("origin") == self.worker_id:
+            return
+        self.backplane_metrics["received"] += 1
+        self._deliver_local(header["target"], header.get("name"), Envelope.from_text(text, header.get("key")))
+    
+    async def send_to_user(self, message: Union[Dict[str, Any], Envelope], user_id: str) -> int:
+        """Send message to specific user, on any worker; returns how many local sockets queued it"""
+        message = as_envelope(message)
+        queued = self._deliver_local("user", user_id, message)
+        await self._publish("user", user_id, message)
+        return queued
+    
+    async def broadcast_to_group(self, message: Union[Dict[str, Any], Envelope], client_id: str) -> int:
+        """Broadcast message to all connections in a group; returns how many local sockets queued it"""
+        message = as_envelope(message)
+        queued = self._deliver_local("group", client_id, message)
+        await self._publish("group", client_id, message)
+        return queued
+    
+    async def publish(self, topic: str, message: Union[Dict[str, Any], Envelope]) -> int:
+        """Send message to the subscribers of a topic, on any worker; returns how many local sockets queued it"""
+        if not is_valid_topic(topic, wildcard=False):
+            raise ValueError(f"Invalid topic: {topic!r}")
+        message = as_envelope(message)
+        queued = self._deliver_local("topic", topic, message)
+        await self._publish("topic", topic, message)
+        return queued
+    
+    async def broadcast_all(self, message: Union[Dict[str, Any], Envelope]) -> int:
+        """Broadcast message to all active connections; returns how many local sockets queued it"""
+        message = as_envelope(message)
+        queued = self._deliver_local("all", None, message)
+        await self._publish("all", None, message)
+        return queued
+    
+    async def presence(self, kind: str, name: str) -> Dict[str, int]:
+        """Open sockets per worker id for a user or group (``kind``: "user" or "group")"""
+        if self.backplane is not None:
+            return await self.backplane.presence(f"{kind}:{name}")
+        attribute = "user_id" if kind == "user" else "client_id"
+        count = sum(getattr(connection, attribute) == name for connection in self.connections.values())
+        return {self.worker_id: count} if count else {}
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Connection count, queue depths and delivery counters"""
+        totals = dict(self._closed_totals)
+        depths = []
+        for connection in self.connections.values():
+            depths.append(connection.depth)
+            for name in totals:
+                totals[name] += connection.metrics[name]
+        return {
+            "connections": len(self.connections),
+            "topics": len(self.topics),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "messages_enqueued": totals["enqueued"],
+            "messages_sent": totals["sent"],
+            "messages_dropped": totals["dropped"],
+            "messages_coalesced": totals["coalesced"],
+            "message_batches": totals["batches"],
+            "coalesce_interval_ms": self.coalesce_interval * 1000,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "max_queue": self.max_queue,
+            "policy": self.policy,
+            "worker_id": self.worker_id,
+            "backplane": type(self.backplane).__name__ if self.backplane is not None else None,
+            "backplane_published": self.backplane_metrics["published"],
+            "backplane_received": self.backplane_metrics["received"],
+            "backplane_errors": self.backplane_metrics["errors"]
+        }
 
 # Global connection manager
-manager = ConnectionManager()
+manager = ConnectionManager(
+    max_queue=int(os.getenv("WS_SEND_QUEUE_SIZE", "256")),
+    policy=os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest"),
+    send_timeout=float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10")),
+    coalesce_interval=float(os.getenv("WS_COALESCE_INTERVAL_MS", "250")) / 1000
+)
 
 class CreditFeedbackStreamer:
     """Stream real-time credit feedback"""
@@ -75,36 +491,29 @@ class CreditFeedbackStreamer:
     @staticmethod
     async def stream_credit_analysis(user_id: str, analysis_data: Dict[str, Any]):
         """Stream credit analysis results"""
-        message = {
-            "type": "credit_analysis",
-            "timestamp": datetime.now().isoformat(),
-            "user_id": user_id,
-            "data": analysis_data
-        }
+        message = Envelope.build("credit_analysis", user_id=user_id, data=analysis_data)
         await manager.send_to_user(message, user_id)
     
     @staticmethod
     async def stream_risk_score_update(user_id: str, risk_score: float, factors: List[str]):
         """Stream risk score updates"""
-        message = {
-            "type": "risk_score_update",
-            "timestamp": datetime.now().isoformat(),
-            "risk_score": risk_score,
-            "factors": factors,
-            "severity": "high" if risk_score > 0.7 else "medium" if risk_score > 0.4 else "low"
-        }
-        await manager.send_to_user(message, user_id)
+        message = Envelope.build(
+            "risk_score_update",
+            risk_score=risk_score,
+            factors=factors,
+            severity="high" if risk_score > 0.7 else "medium" if risk_score > 0.4 else "low"
+        )
+        await manager.publish(risk_topic(user_id), message)
     
     @staticmethod
     async def stream_calculation_progress(user_id: str, calculator_type: str, progress: int):
         """Stream calculation progress"""
-        message = {
-            "type": "calculation_progress",
-            "timestamp": datetime.now().isoformat(),
-            "calculator_type": calculator_type,
-            "progress": progress,
-            "status": "completed" if progress >= 100 else "processing"
-        }
+        message = Envelope.build(
+            "calculation_progress",
+            calculator_type=calculator_type,
+            progress=progress,
+            status="completed" if progress >= 100 else "processing"
+        )
         await manager.send_to_user(message, user_id)
 
 class DashboardStreamer:
@@ -113,19 +522,11 @@ class DashboardStreamer:
     @staticmethod
     async def stream_portfolio_update(user_id: str, portfolio_data: Dict[str, Any]):
         """Stream portfolio value updates"""
-        message = {
-            "type": "portfolio_update",
-            "timestamp": datetime.now().isoformat(),
-            "portfolio": portfolio_data
-        }
+        message = Envelope.build("portfolio_update", portfolio=portfolio_data)
         await manager.send_to_user(message, user_id)
     
     @staticmethod
     async def stream_market_alert(alert_data: Dict[str, Any]):
-        """Broadcast market alerts to all users"""
-        message = {
-            "type": "market_alert",
-            "timestamp": datetime.now().isoformat(),
-            "alert": alert_data
-        }
-        await manager.broadcast_all(message)
\ No newline at end of file
+        """Publish market alerts to sockets subscribed to market.alert (or market.*)"""
+        message = Envelope.build("market_alert", alert=alert_data)
+        return await manager.publish(MARKET_ALERT_TOPIC, message)
@@ -1,16 +1,23 @@
 """WebSocket Routes for Real-time Communication"""
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
 from .websocket_manager import manager, CreditFeedbackStreamer, DashboardStreamer
+from .topics import risk_topic, subscription_error, MARKET_ALERT_TOPIC
+from .envelope import Envelope
 from auth.dependencies import get_current_user
 import json
 import asyncio
+from typing import Literal
 
 router = APIRouter()
 
+PONG = Envelope.from_message({"type": "pong"})
+
 @router.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str, user_id: str = Query(None)):
-    """Main WebSocket endpoint"""
-    await manager.connect(websocket, client_id, user_id)
+async def websocket_endpoint(websocket: WebSocket, client_id: str, user_id: str = Query(None),
+                             binary: bool = Query(False)):
+    """Main WebSocket endpoint (``?binary=true``: messages arrive as binary frames of UTF-8 JSON)"""
+    await manager.connect(websocket, client_id, user_id, binary=binary,
+                          topics=[risk_topic(user_id)] if user_id else ())
     
     try:
         # Send welcome message
@@ -20,7 +27,7 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str, user_id: str
             "client_id": client_id,
             "user_id": user_id
         }
-        await manager.send_personal_message(json.dumps(welcome_msg), websocket)
+        await manager.send_personal_message(Envelope.from_message(welcome_msg), websocket)
         
         while True:
             # Listen for client messages
@@ -33,23 +40,50 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str, user_id: str
     except WebSocketDisconnect:
         manager.disconnect(websocket, client_id, user_id)
 
+def is_valid_rate(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and 0 < value < float("inf")
+
 async def handle_websocket_message(message: dict, websocket: WebSocket, client_id: str, user_id: str):
     """Handle incoming WebSocket messages"""
     message_type = message.get("type")
     
     if message_type == "ping":
         # Heartbeat
-        await manager.send_personal_message(json.dumps({"type": "pong"}), websocket)
+        await manager.send_personal_message(PONG, websocket)
     
     elif message_type == "subscribe":
-        # Subscribe to specific updates
+        # Subscribe to a topic, or to every topic under a prefix with "market.*";
+        # "max_rate" (updates per second) caps coalesced updates on this socket
+        subscription = message.get("subscription")
+        max_rate = message.get("max_rate")
+        reason = None
+        if subscription is not None or max_rate is None:
+            reason = subscription_error(subscription, user_id)
+        if reason is None and max_rate is not None and not is_valid_rate(max_rate):
+            reason = "invalid_max_rate"
+        if reason is None:
+            if subscription is not None:
+                manager.subscribe(websocket, subscription)
+            response = {
+                "type": "subscription_confirmed",
+                "subscription": subscription,
+                "status": "active"
+            }
+            if max_rate is not None:
+                response["max_rate"] = manager.set_max_rate(websocket, float(max_rate))
+        else:
+            response = {"type": "subscription_rejected", "subscription": subscription, "reason": reason}
+        await manager.send_personal_message(Envelope.from_message(response), websocket)
+    
+    elif message_type == "unsubscribe":
         subscription = message.get("subscription")
+        removed = isinstance(subscription, str) and manager.unsubscribe(websocket, subscription)
         response = {
-            "type": "subscription_confirmed",
+            "type": "subscription_cancelled",
             "subscription": subscription,
-            "status": "active"
+            "status": "cancelled" if removed else "not_subscribed"
         }
-        await manager.send_personal_message(json.dumps(response), websocket)
+        await manager.send_personal_message(Envelope.from_message(response), websocket)
     
     elif message_type == "request_credit_analysis":
         # Trigger credit analysis
@@ -64,7 +98,7 @@ async def handle_websocket_message(message: dict, websocket: WebSocket, client_i
 @router.websocket("/ws/dashboard/{user_id}")
 async def dashboard_websocket(websocket: WebSocket, user_id: str):
     """Dedicated dashboard WebSocket"""
-    await manager.connect(websocket, f"dashboard_{user_id}", user_id)
+    await manager.connect(websocket, f"dashboard_{user_id}", user_id, topics=["market.*", risk_topic(user_id)])
     
     try:
         # Send initial dashboard data
@@ -73,7 +107,7 @@ async def dashboard_websocket(websocket: WebSocket, user_id: str):
             "message": "Dashboard connected",
             "features": ["portfolio_updates", "market_alerts", "risk_monitoring"]
         }
-        await manager.send_personal_message(json.dumps(initial_data), websocket)
+        await manager.send_personal_message(Envelope.from_message(initial_data), websocket)
         
         while True:
             data = await websocket.receive_text()
@@ -92,10 +126,28 @@ async def dashboard_websocket(websocket: WebSocket, user_id: str):
                     ]
                 }
                 await DashboardStreamer.stream_portfolio_update(user_id, portfolio_data)
+            
+            elif message.get("type") in ("subscribe", "unsubscribe"):
+                await handle_websocket_message(message, websocket, f"dashboard_{user_id}", user_id)
     
     except WebSocketDisconnect:
         manager.disconnect(websocket, f"dashboard_{user_id}", user_id)
 
+@router.get("/ws/metrics")
+async def websocket_metrics():
+    """Connection count, send-queue depth and dropped/coalesced message counters"""
+    return manager.get_metrics()
+
+@router.get("/ws/presence/{kind}/{name}")
+async def websocket_presence(kind: Literal["user", "group"], name: str, current_user=Depends(get_current_user)):
+    """Whether the caller's own user or dashboard group has open sockets, and how many per worker"""
+    identities = {identity for identity in (current_user.email, current_user.user_id) if identity}
+    owned = identities if kind == "user" else {f"dashboard_{identity}" for identity in identities}
+    if name not in owned:
+        raise HTTPException(status_code=403, detail="Presence is only visible for your own connections")
+    workers = await manager.presence(kind, name)
+    return {kind: name, "online": bool(workers), "connections": sum(workers.values()), "workers": workers}
+
 # REST endpoints for triggering WebSocket messages
 @router.post("/trigger/credit-analysis/{user_id}")
 async def trigger_credit_analysis(user_id: str, analysis_data: dict):
@@ -116,4 +168,4 @@ async def trigger_risk_score_update(user_id: str, risk_data: dict):
 async def trigger_market_alert(alert_data: dict):
     """Broadcast market alert to all users"""
     await DashboardStreamer.stream_market_alert(alert_data)
-    return {"status": "market_alert_sent", "recipients": "all_users"}
\ No newline at end of file
+    return {"status": "market_alert_sent", "topic": MARKET_ALERT_TOPIC, "recipients": "subscribers"}
\ No newline at end of file
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Document NLP Startup Benchmark
+
+Boots simulated workers in fresh interpreters and reports boot time,
+first-document latency and RSS for three setups:
+
+- eager:  every worker loads the transformer pipelines at import (old behaviour)
+- lazy:   pipelines load in the worker on the first document
+- shared: one model host process holds the pipelines, workers call it over IPC
+
+Usage: python scripts/benchmark_nlp_startup.py [--workers 4]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+WORKER_SNIPPET = """
+import json, resource, sys, time
+started = time.perf_counter()
+from credit_analysis.document_nlp import document_analyzer
+if sys.argv[1] == "eager":
+    document_analyzer.classifier, document_analyzer.ner
+boot = time.perf_counter() - started
+
+started = time.perf_counter()
+document_analyzer.extract_financial_entities("Paid Rs. 5,000 to HDFC Bank on 12/03/2024 for Rahul Sharma")
+first_document = time.perf_counter() - started
+
+print(json.dumps({
+    "boot_s": boot,
+    "first_document_s": first_document,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "models": document_analyzer.model_status()
+}))
+"""
+
+def process_rss_mb(pid: int) -> float:
+    """Current RSS of a process from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+def run_workers(mode: str, workers: int) -> list:
+    """Start workers concurrently, like gunicorn does, and collect their reports"""
+    processes = [
+        subprocess.Popen([sys.executable, "-c", WORKER_SNIPPET, mode], cwd=BACKEND_DIR,
+                         stdout=subprocess.PIPE, text=True, env=os.environ.copy())
+        for _ in range(workers)
+    ]
+    return [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in processes]
+
+def report(mode: str, results: list, extra_rss_mb: float = 0.0):
+    """Print per-setup averages"""
+    count = len(results)
+    boot = sum(r["boot_s"] for r in results) / count
+    first = sum(r["first_document_s"] for r in results) / count
+    total_rss = sum(r["rss_mb"] for r in results) + extra_rss_mb
+    print(f"{mode:>7} | boot {boot:7.2f}s | first document {first:7.2f}s | "
+          f"total RSS {total_rss:8.1f} MB | models {results[0]['models']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document NLP worker startup")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ.pop("MODEL_HOST_ADDRESS", None)
+    print(f"📊 Simulating {args.workers} workers per setup...")
+
+    for mode in ("eager", "lazy"):
+        report(mode, run_workers(mode, args.workers))
+
+    from credit_analysis.model_host import SharedModelHost
+    host = SharedModelHost()
+    started = time.perf_counter()
+    host.start()
+    try:
+        results = run_workers("shared", args.workers)
+        host_rss = process_rss_mb(host.process.pid)
+        report("shared", results, extra_rss_mb=host_rss)
+        print(f"        model host: started in {time.perf_counter() - started:.2f}s, RSS {host_rss:.1f} MB")
+    finally:
+        host.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""WebSocket Fan-out Benchmark
+
+Spreads N in-memory sockets over several ConnectionManagers ("workers")
+joined by a backplane, publishes market alerts from the first worker and
+reports end-to-end latency from publish to each socket's send, plus how
+many deliveries arrived.
+
+All workers share this process's event loop, so fan-out work that real
+gunicorn workers do in parallel runs serially here: the numbers are an
+upper bound. ``--backplane redis`` goes through a real Redis server
+(REDIS_URL) instead of the in-memory hub.
+
+Usage: python scripts/benchmark_ws_fanout.py [--sockets 10000] [--workers 4] [--messages 20] [--backplane memory]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from neocred_realtime.backplane import InMemoryHub, InMemoryBackplane, RedisBackplane
+from neocred_realtime.websocket_manager import ConnectionManager
+
+class BenchSocket:
+    """Records (text, receive time) per send; parsing waits until after the run"""
+
+    def __init__(self):
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.received.append((text, time.perf_counter()))
+
+    async def close(self, code: int = 1000):
+        pass
+
+async def run(args) -> dict:
+    hub = InMemoryHub()
+    # Default worker ids, as in production: each manager gets a unique id on start
+    managers = [ConnectionManager(max_queue=args.messages + 1) for _ in range(args.workers)]
+    for manager in managers:
+        backplane = (RedisBackplane(os.getenv("REDIS_URL", "redis://localhost:6379"), channel="neocred:ws:bench")
+                     if args.backplane == "redis" else InMemoryBackplane(hub))
+        await manager.start_backplane(backplane)
+
+    sockets = [BenchSocket() for _ in range(args.sockets)]
+    for index, websocket in enumerate(sockets):
+        await managers[index % args.workers].connect(websocket, f"group{index % 100}", user_id=f"user{index}")
+    await asyncio.sleep(0.1)  # presence updates and subscriptions settle
+
+    sent_at = {}
+    for sequence in range(args.messages):
+        sent_at[sequence] = time.perf_counter()
+        await managers[0].broadcast_all({"type": "market_alert", "alert": {"sequence": sequence}})
+        await asyncio.sleep(args.interval)
+
+    expected = args.sockets * args.messages
+    deadline = time.perf_counter() + 30
+    while sum(len(websocket.received) for websocket in sockets) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+    for manager in managers:
+        await manager.stop_backplane()
+
+    latencies = [(received - sent_at[json.loads(text)["alert"]["sequence"]]) * 1000
+                 for websocket in sockets for text, received in websocket.received]
+    return {"latencies": sorted(latencies), "expected": expected}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cross-worker WebSocket fan-out latency")
+    parser.add_argument("--sockets", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between published messages")
+    parser.add_argument("--backplane", choices=["memory", "redis"], default="memory")
+    args = parser.parse_args()
+
+    print(f"📊 {args.sockets} sockets on {args.workers} workers, {args.messages} broadcasts via {args.backplane}")
+    result = asyncio.run(run(args))
+    latencies = result["latencies"]
+    if not latencies:
+        print("⚠️  Nothing was delivered")
+        return
+
+    def percentile(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+    print(f"   delivered {len(latencies)}/{result['expected']}")
+    print(f"   latency p50 {statistics.median(latencies):7.2f} ms | p99 {percentile(0.99):7.2f} ms | "
+          f"max {latencies[-1]:7.2f} ms")
+
+if __name__ == "__main__":
+    main()
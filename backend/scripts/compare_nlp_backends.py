@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Document NLP Backend Comparison
+
+Runs the classifier and NER pipelines on PyTorch and on the ONNX export
+(see scripts/export_onnx_models.py) over a labeled sample and reports
+accuracy, per-document latency and model size for each backend.
+
+The sample is JSON lines with ``text``, ``sentiment`` (POSITIVE/NEGATIVE)
+and ``entities`` ([type, text] pairs, types PER/ORG/LOC/MISC).
+
+Usage: python scripts/compare_nlp_backends.py [--data credit_analysis/data/nlp_eval_sample.jsonl] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from credit_analysis.model_host import load_pipelines, inference_context
+from credit_analysis.onnx_backend import load_onnx_pipeline, read_manifest, onnx_model_dir
+
+DEFAULT_DATA = os.path.join(BACKEND_DIR, "credit_analysis", "data", "nlp_eval_sample.jsonl")
+
+def load_samples(path: str) -> list:
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def group_entities(text: str, tokens: list) -> set:
+    """(type, text) spans from token-level B-/I- predictions"""
+    spans = []
+    for token in tokens:
+        prefix, _, kind = token["entity"].rpartition("-")
+        previous = spans[-1] if spans else None
+        continues = previous and previous[0] == kind and token["start"] <= previous[2] + 1 and (
+            prefix != "B" or token["word"].startswith("##"))
+        if continues:
+            previous[2] = token["end"]
+        else:
+            spans.append([kind, token["start"], token["end"]])
+    return {(kind, text[start:end]) for kind, start, end in spans}
+
+def timed(pipeline, text: str, repeat: int) -> tuple:
+    """Last output and the best-of-``repeat`` latency in ms"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with inference_context():
+            output = pipeline(text)
+        best = min(best, time.perf_counter() - started)
+    return output, best * 1000
+
+def evaluate(pipelines: dict, samples: list, repeat: int) -> dict:
+    """Accuracy and latency of one backend's pipelines"""
+    report = {}
+    if "classifier" in pipelines:
+        latencies, correct, labels = [], 0, []
+        for sample in samples:
+            output, ms = timed(pipelines["classifier"], sample["text"], repeat)
+            latencies.append(ms)
+            labels.append(output[0]["label"])
+            correct += output[0]["label"] == sample["sentiment"]
+        report["classifier"] = {"accuracy": correct / len(samples), "latencies": latencies, "labels": labels}
+
+    if "ner" in pipelines:
+        latencies, true_positives, predicted, expected = [], 0, 0, 0
+        for sample in samples:
+            output, ms = timed(pipelines["ner"], sample["text"], repeat)
+            latencies.append(ms)
+            found = group_entities(sample["text"], output)
+            gold = {tuple(entity) for entity in sample["entities"]}
+            true_positives += len(found & gold)
+            predicted += len(found)
+            expected += len(gold)
+        precision = true_positives / predicted if predicted else 0.0
+        recall = true_positives / expected if expected else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        report["ner"] = {"precision": precision, "recall": recall, "f1": f1, "latencies": latencies}
+    return report
+
+def model_size_mb(name: str, backend: str) -> str:
+    if backend == "onnx":
+        manifest = read_manifest(name)
+        path = os.path.join(onnx_model_dir(name), manifest["file_name"])
+        return f"{os.path.getsize(path) / (1024 * 1024):7.1f} MB"
+    return "      -   "
+
+def print_row(backend: str, name: str, result: dict):
+    latencies = sorted(result["latencies"])
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    quality = (f"accuracy {result['accuracy']:.3f}" if name == "classifier"
+               else f"P {result['precision']:.3f} R {result['recall']:.3f} F1 {result['f1']:.3f}")
+    print(f"{backend:>6} | {name:>10} | {quality:<32} | p50 {statistics.median(latencies):7.1f} ms | "
+          f"p95 {p95:7.1f} ms | {model_size_mb(name, backend)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PyTorch and ONNX document NLP backends")
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per document; the fastest is kept")
+    args = parser.parse_args()
+
+    samples = load_samples(args.data)
+    os.environ["NLP_BACKEND"] = "torch"
+    backends = {"torch": load_pipelines()}
+    backends["onnx"] = {}
+    for name in ("classifier", "ner"):
+        pipeline = load_onnx_pipeline(name)
+        if pipeline is not None:
+            backends["onnx"][name] = pipeline
+    if not backends["onnx"]:
+        print("⚠️  No ONNX export found; run scripts/export_onnx_models.py first")
+
+    print(f"📊 {len(samples)} labeled documents, best of {args.repeat} runs each")
+    results = {}
+    for backend, pipelines in backends.items():
+        # Warm-up: first calls include lazy graph and kernel initialisation
+        for pipeline in pipelines.values():
+            pipeline(samples[0]["text"])
+        results[backend] = evaluate(pipelines, samples, args.repeat)
+        for name, result in results[backend].items():
+            print_row(backend, name, result)
+
+    if "classifier" in results["torch"] and "classifier" in results.get("onnx", {}):
+        agreement = sum(a == b for a, b in zip(results["torch"]["classifier"]["labels"],
+                                               results["onnx"]["classifier"]["labels"])) / len(samples)
+        print(f"   classifier label agreement torch vs onnx: {agreement:.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Export the Document NLP Pipelines to ONNX
+
+Converts the classifier and NER models to ONNX with dynamic int8
+quantization. The document analyzer picks the export up automatically
+(NLP_BACKEND=auto) from NLP_ONNX_DIR, default backend/models/onnx.
+
+Requires: pip install -r requirements-onnx.txt
+
+Usage: python scripts/export_onnx_models.py [--pipelines classifier ner] [--isa avx512_vnni] [--no-quantize]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from credit_analysis.model_host import PIPELINE_SPECS
+from credit_analysis.onnx_backend import export_pipeline, onnx_model_dir
+
+def main():
+    parser = argparse.ArgumentParser(description="Export document NLP models to ONNX")
+    parser.add_argument("--pipelines", nargs="+", choices=sorted(PIPELINE_SPECS), default=sorted(PIPELINE_SPECS))
+    parser.add_argument("--output-dir", default=None, help="Defaults to NLP_ONNX_DIR or backend/models/onnx")
+    parser.add_argument("--isa", default="avx512_vnni", choices=["avx2", "avx512", "avx512_vnni", "arm64"],
+                        help="Instruction set of the serving CPUs")
+    parser.add_argument("--no-quantize", action="store_true", help="Keep fp32 weights")
+    args = parser.parse_args()
+
+    for name in args.pipelines:
+        print(f"📦 Exporting {name} ({PIPELINE_SPECS[name][1]})...")
+        manifest = export_pipeline(name, args.output_dir, quantize=not args.no_quantize, isa=args.isa)
+        path = os.path.join(onnx_model_dir(name, args.output_dir), manifest["file_name"])
+        print(f"   ✅ {path} ({os.path.getsize(path) / (1024 * 1024):.1f} MB)")
+
+if __name__ == "__main__":
+    main()
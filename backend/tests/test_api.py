@@ -58,4 +58,116 @@ class TestAPI:
             "data_json": {"amount": 5000}
         }
         response = client.post("/api/financial-data", json=financial_data)
-        assert response.status_code == 422  # Validation error
\ No newline at end of file
+        assert response.status_code == 422  # Validation error
+
+
+class TestCreditAnalysisAPI:
+    """Test credit analysis endpoints"""
+    
+    def test_batch_risk_assessment_scores_off_event_loop(self, client: TestClient, monkeypatch):
+        """Test batch scoring streams NDJSON and runs in a worker thread"""
+        import asyncio
+        import json
+        from main import app
+        from auth.dependencies import get_current_active_user
+        from credit_analysis import routes
+        
+        scoring_threads_with_loop = []
+        calculate = routes.financial_ratios_engine.calculate_all_ratios_batch
+        
+        def recording_calculate(df):
+            try:
+                asyncio.get_running_loop()
+                scoring_threads_with_loop.append(True)
+            except RuntimeError:
+                scoring_threads_with_loop.append(False)
+            return calculate(df)
+        
+        monkeypatch.setattr(routes.financial_ratios_engine, "calculate_all_ratios_batch", recording_calculate)
+        app.dependency_overrides[get_current_active_user] = lambda: {"email": "batch@example.com"}
+        applicant = {
+            "monthly_income": 50000, "monthly_expenses": 30000, "total_debt": 200000,
+            "credit_used": 15000, "credit_limit": 50000, "age": 30, "employment_months": 24
+        }
+        
+        response = client.post("/credit-analysis/risk-assessment/batch", json={"applicants": [applicant] * 3})
+        
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["index"] for line in lines] == [0, 1, 2]
+        assert scoring_threads_with_loop == [False]
+    
+    def test_batch_risk_assessment_writes_non_finite_as_null(self, client: TestClient, monkeypatch):
+        """Test NaN/Infinity ratios are streamed as null so every line is valid JSON"""
+        import json
+        import numpy as np
+        from main import app
+        from auth.dependencies import get_current_active_user
+        from credit_analysis import routes
+        
+        calculate = routes.financial_ratios_engine.calculate_all_ratios_batch
+        
+        def non_finite_calculate(df):
+            ratios = calculate(df)
+            ratios["liquidity"] = {
+                "current_ratio": np.full(len(df), np.nan), "cash_ratio": np.full(len(df), np.inf)
+            }
+            return ratios
+        
+        monkeypatch.setattr(routes.financial_ratios_engine, "calculate_all_ratios_batch", non_finite_calculate)
+        app.dependency_overrides[get_current_active_user] = lambda: {"email": "batch@example.com"}
+        applicant = {
+            "monthly_income": 50000, "monthly_expenses": 30000, "total_debt": 200000,
+            "credit_used": 15000, "credit_limit": 50000, "age": 30, "employment_months": 24
+        }
+        try:
+            response = client.post("/credit-analysis/risk-assessment/batch", json={"applicants": [applicant] * 2})
+        finally:
+            app.dependency_overrides.pop(get_current_active_user, None)
+        
+        assert response.status_code == 200
+        
+        def reject_constant(name):
+            raise ValueError(f"{name} is not valid JSON")
+        
+        lines = [json.loads(line, parse_constant=reject_constant) for line in response.text.splitlines()]
+        assert [line["financial_ratios"]["liquidity"] for line in lines] == [
+            {"current_ratio": None, "cash_ratio": None}
+        ] * 2
+    
+    def test_risk_assessment_explains_off_event_loop(self, client: TestClient, monkeypatch):
+        """Test per-applicant risk factors are computed in a worker thread"""
+        import asyncio
+        from main import app
+        from auth.dependencies import get_current_active_user
+        from credit_analysis import routes
+        
+        explained_with_loop = []
+        
+        def recording_explain(record):
+            try:
+                asyncio.get_running_loop()
+                explained_with_loop.append(True)
+            except RuntimeError:
+                explained_with_loop.append(False)
+            return [{"feature": "debt_to_income", "impact": 0.2}]
+        
+        async def fixed_probability(record):
+            return 0.1
+        
+        monkeypatch.setattr(routes.credit_risk_model, "is_trained", True)
+        monkeypatch.setattr(routes.credit_risk_model, "explain_one", recording_explain)
+        monkeypatch.setattr(routes.prediction_batcher, "predict", fixed_probability)
+        app.dependency_overrides[get_current_active_user] = lambda: {"email": "single@example.com"}
+        applicant = {
+            "monthly_income": 50000, "monthly_expenses": 30000, "total_debt": 200000,
+            "credit_used": 15000, "credit_limit": 50000, "age": 30, "employment_months": 24
+        }
+        try:
+            response = client.post("/credit-analysis/risk-assessment", json=applicant)
+        finally:
+            app.dependency_overrides.pop(get_current_active_user, None)
+        
+        assert response.status_code == 200
+        assert response.json()["risk_factors"] == [{"feature": "debt_to_income", "impact": 0.2}]
+        assert explained_with_loop == [False]
@@ -0,0 +1,1100 @@
+"""Credit Analysis Tests"""
+import numpy as np
+import pandas as pd
+import pytest
+from credit_analysis.financial_ratios import FinancialRatiosEngine, RATIO_CATEGORIES
+from credit_analysis.risk_models import CreditRiskModel, RiskExplainer, CreditScoreCalculator
+from credit_analysis.score_calibration import ScoreLookupTable, DEFAULT_SCORE_TABLE, fit_score_table
+from credit_analysis.prediction_batcher import PredictionBatcher
+from credit_analysis.entity_scanner import scan_entities
+from credit_analysis.nlp_inference import BatchedPipeline, TokenWindowChunker
+from credit_analysis.model_host import PipelineServer, ModelHostClient, PIPELINE_SPECS
+from credit_analysis.onnx_backend import MANIFEST_FILE, read_manifest, load_onnx_pipeline, nlp_backend
+from credit_analysis.recommendation_engine import CreditRecommendationEngine, compile_condition
+from credit_analysis.fraud_detection import PatternDetector, FraudDetectionEngine, AnomalyDetector
+from credit_analysis.geo_index import detect_impossible_travel, haversine_km, Gazetteer
+from credit_analysis.transaction_state import UserTransactionState, TransactionStateStore
+import asyncio
+import os
+import stat
+import threading
+import time
+from multiprocessing.connection import Listener
+
+SAMPLE_PROFILES = [
+    {
+        "monthly_income": 50000, "monthly_expenses": 30000, "total_debt": 200000,
+        "credit_used": 15000, "credit_limit": 50000, "employment_months": 24,
+        "monthly_debt_payments": 8000, "current_assets": 90000,
+        "current_liabilities": 40000, "credit_accounts": 3, "credit_types": 3
+    },
+    {
+        "monthly_income": 0, "monthly_expenses": 12000, "total_debt": 50000,
+        "credit_used": 45000, "credit_limit": 50000, "employment_months": 6,
+        "monthly_debt_payments": 4000, "current_assets": 10000,
+        "current_liabilities": 30000, "credit_accounts": 1, "credit_types": 1
+    },
+    {
+        "monthly_income": 120000, "monthly_expenses": 40000, "total_debt": 0,
+        "credit_used": 0, "credit_limit": 200000, "employment_months": 60,
+        "monthly_debt_payments": 0, "current_assets": 500000,
+        "current_liabilities": 20000, "credit_accounts": 6, "credit_types": 5
+    },
+]
+
+class TestFinancialRatiosEngine:
+    """Test scalar and columnar ratio calculation"""
+    
+    def test_batch_matches_scalar(self):
+        """Test batch ratios match per-record ratios"""
+        engine = FinancialRatiosEngine()
+        batch = engine.calculate_all_ratios_batch(pd.DataFrame(SAMPLE_PROFILES))
+        
+        for row, profile in enumerate(SAMPLE_PROFILES):
+            scalar = engine.calculate_all_ratios(profile)
+            assert scalar.keys() == batch.keys()
+            for category, ratios in scalar.items():
+                assert ratios.keys() == batch[category].keys()
+                for name, value in ratios.items():
+                    assert batch[category][name][row] == pytest.approx(value)
+    
+    def test_batch_accepts_array_dict(self):
+        """Test batch ratios from a dict of NumPy arrays"""
+        engine = FinancialRatiosEngine()
+        columns = {
+            "monthly_income": np.array([50000.0, 0.0]),
+            "monthly_expenses": np.array([30000.0, 10000.0])
+        }
+        ratios = engine.calculate_all_ratios_batch(columns)
+        assert ratios["income"]["savings_rate"].tolist() == pytest.approx([0.4, 0.0])
+        assert "debt_to_income" not in ratios["debt"]
+    
+    def test_batch_rejects_ragged_columns(self):
+        """Test mismatched column lengths are rejected"""
+        engine = FinancialRatiosEngine()
+        with pytest.raises(ValueError):
+            engine.calculate_all_ratios_batch({
+                "monthly_income": np.array([1.0, 2.0]),
+                "monthly_expenses": np.array([1.0])
+            })
+
+    def test_batch_interpretation_matches_scalar(self):
+        """Test digitized category codes agree with per-value interpretation, bounds included"""
+        engine = FinancialRatiosEngine()
+        values = np.array([-0.1, 0, 0.05, 0.1, 0.19, 0.2, 0.36, 0.5, 3.0, np.inf, np.nan])
+        
+        for name in ("debt_to_income", "credit_utilization", "savings_rate", "current_ratio"):
+            codes = engine.get_ratio_interpretation_batch(name, values)
+            scalar = [engine.get_ratio_interpretation(name, value)["category"] for value in values]
+            assert [RATIO_CATEGORIES[code] for code in codes] == scalar
+        
+        assert engine.get_ratio_interpretation("savings_rate", 0.1) == {
+            "category": "good", "description": "Good savings rate"
+        }
+        assert engine.get_ratio_interpretation("debt_to_income", -1)["description"] == "Value out of range"
+    
+    def test_portfolio_interpretation(self):
+        """Test codes for every interpretable ratio of a batch, and category counts"""
+        engine = FinancialRatiosEngine()
+        batch = engine.calculate_all_ratios_batch(pd.DataFrame(SAMPLE_PROFILES))
+        codes = engine.interpret_ratios_batch(batch)
+        
+        assert set(codes["debt"]) == {"debt_to_income", "credit_utilization"}
+        counts = engine.category_counts(codes["debt"]["credit_utilization"])
+        assert sum(counts.values()) == len(SAMPLE_PROFILES)
+        assert counts["excellent"] == 1  # nothing used on a 200k limit
+
+def make_training_data(n: int = 600):
+    """Synthetic applicant data with a debt-driven default label"""
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame({
+        "monthly_income": rng.uniform(10000, 200000, n),
+        "monthly_expenses": rng.uniform(5000, 100000, n),
+        "total_debt": rng.uniform(0, 1000000, n),
+        "credit_used": rng.uniform(0, 100000, n),
+        "credit_limit": rng.uniform(10000, 200000, n),
+        "age": rng.integers(18, 80, n),
+        "employment_months": rng.integers(0, 240, n),
+        "credit_types": rng.integers(1, 6, n),
+        "missed_payments": rng.integers(0, 5, n)
+    })
+    noise = rng.normal(0, 0.5, n)
+    y = pd.Series((X["total_debt"] / (X["monthly_income"] * 12) + noise > 1.2).astype(int))
+    return X, y
+
+class TestCreditRiskModel:
+    """Test credit risk model inference paths"""
+    
+    @pytest.mark.parametrize("model_type", ["xgboost", "lightgbm", "logistic"])
+    def test_compiled_plan_matches_pandas_path(self, model_type):
+        """Test single-row compiled scoring matches predict_default_probability"""
+        X, y = make_training_data()
+        model = CreditRiskModel(model_type)
+        model.train(X, y)
+        assert model.feature_plan is not None
+        
+        records = X.head(50).to_dict("records")
+        records[0].pop("credit_limit")  # missing inputs are zero-filled like reindex
+        records[1]["age"] = 25  # bin edge
+        
+        for record in records:
+            expected = model.predict_default_probability(pd.DataFrame([record]))[0]
+            assert model.predict_one(record) == pytest.approx(expected, abs=1e-6)
+    
+    def test_plan_survives_save_and_load(self, tmp_path):
+        """Test the feature plan is rebuilt when a saved model is loaded"""
+        X, y = make_training_data()
+        model = CreditRiskModel("xgboost")
+        model.train(X, y)
+        path = tmp_path / "credit_risk_model.pkl"
+        model.save_model(str(path))
+        
+        loaded = CreditRiskModel()
+        loaded.load_model(str(path))
+        record = X.iloc[0].to_dict()
+        assert loaded.feature_plan is not None
+        assert loaded.predict_one(record) == pytest.approx(model.predict_one(record))
+    
+    def test_legacy_model_with_dummies_uses_pandas_path(self):
+        """Test a model saved without input columns and with one-hot features is not compiled"""
+        X, y = make_training_data()
+        X["employment_type"] = np.where(np.arange(len(X)) % 3 == 0, "salaried", "self_employed")
+        model = CreditRiskModel("xgboost")
+        model.train(X, y)
+        model.input_columns = None  # as loaded from an older pickle
+        model._compile_feature_plan()
+        record = X.iloc[0].to_dict()
+        
+        assert model.feature_plan is None
+        assert model.predict_one(record) == pytest.approx(
+            model.predict_default_probability(pd.DataFrame([record]))[0]
+        )
+        
+        model = CreditRiskModel("xgboost")
+        model.train(X.drop(columns="employment_type"), y)
+        model.input_columns = None
+        model._compile_feature_plan()
+        assert model.feature_plan is not None
+
+class TestRiskExplainer:
+    """Test per-applicant risk factor attributions"""
+    
+    @pytest.mark.parametrize("model_type", ["xgboost", "lightgbm", "logistic"])
+    def test_attributions_add_up_to_model_margin(self, model_type):
+        """Test contributions plus base value reproduce the model's log-odds"""
+        X, y = make_training_data()
+        model = CreditRiskModel(model_type)
+        model.train(X, y)
+        assert model.explainer is not None
+        
+        X_scaled = model._transform_frame(X.head(20))
+        values, base = model.explainer.contributions(X_scaled)
+        probabilities = model.predict_default_probability(X.head(20))
+        margin = np.log(probabilities / (1 - probabilities))
+        np.testing.assert_allclose(values.sum(axis=1) + base, margin, atol=1e-3)
+    
+    def test_factors_differ_per_applicant(self):
+        """Test applicants get their own top-k factors, same from single and batch paths"""
+        X, y = make_training_data()
+        model = CreditRiskModel("xgboost")
+        model.train(X, y)
+        
+        batch = model.explain_many(X.head(30), top_k=3)
+        assert all(len(factors) == 3 for factors in batch)
+        assert len({tuple(f["factor"] for f in factors) for factors in batch}) > 1
+        assert model.explain_one(X.iloc[0].to_dict(), top_k=3) == pytest.approx(batch[0])
+        
+        magnitudes = [abs(f["contribution"]) for f in batch[0]]
+        assert magnitudes == sorted(magnitudes, reverse=True)
+        assert [f["factor"] for f in model.explain_one(X.iloc[0].to_dict(), top_k=3, approximate=True)]
+    
+    def test_top_k_matches_full_sort(self):
+        """Test partial selection returns the same columns as a full sort"""
+        values = np.random.default_rng(0).normal(size=(50, 12))
+        expected = np.argsort(-np.abs(values), axis=1)[:, :4]
+        np.testing.assert_array_equal(RiskExplainer.top_k(values, 4), expected)
+
+class TestScoreLookupTable:
+    """Test calibrated score, grade and category lookups"""
+    
+    def test_linear_table_matches_previous_mapping(self):
+        """Test the default table reproduces the linear score and the grade/category bands"""
+        probabilities = np.random.default_rng(1).uniform(-0.1, 1.1, 2000)
+        expected = [max(300, min(850, int(850 - p * 550))) for p in probabilities]
+        assert DEFAULT_SCORE_TABLE.scores(probabilities).tolist() == expected
+        
+        assert [CreditScoreCalculator.score_to_grade(s) for s in (850, 800, 799, 700, 600, 549)] == \
+            ["A+", "A+", "A", "B+", "C+", "D"]
+        assert DEFAULT_SCORE_TABLE.risk_categories(np.array([750, 749, 550, 300])).tolist() == \
+            ["Low Risk", "Medium Risk", "High Risk", "Very High Risk"]
+        assert DEFAULT_SCORE_TABLE.interpretation(720)["grade"] == "B+"
+    
+    @pytest.mark.parametrize("method", ["isotonic", "platt"])
+    def test_calibrated_table_is_monotone_and_saved(self, method, tmp_path):
+        """Test a fitted table never raises the score for a riskier applicant and survives save/load"""
+        rng = np.random.default_rng(3)
+        y_prob = rng.uniform(0, 1, 3000)
+        y_true = (rng.uniform(0, 1, 3000) < y_prob ** 2).astype(int)  # model over-predicts risk
+        table = fit_score_table(y_true, y_prob, method=method)
+        
+        scores = table.scores(np.linspace(0, 1, 500))
+        assert np.all(np.diff(scores) <= 0)
+        # Observed default rate at p=0.5 is ~0.25, so the calibrated score is higher than linear
+        assert table.scores(0.5) > DEFAULT_SCORE_TABLE.scores(0.5)
+        assert ScoreLookupTable.from_dict(table.to_dict()).version == table.version
+        
+        X, y = make_training_data()
+        model = CreditRiskModel("logistic")
+        model.calibration_method = method
+        model.train(X, y)
+        path = tmp_path / "model.pkl"
+        model.save_model(str(path))
+        loaded = CreditRiskModel()
+        loaded.load_model(str(path))
+        assert loaded.score_table.method == method
+        assert loaded.score_table.version == model.score_table.version
+
+class TestPredictionBatcher:
+    """Test micro-batched model predictions"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_predictions_are_batched(self):
+        """Test concurrent requests share model calls and get their own results"""
+        X, y = make_training_data()
+        model = CreditRiskModel("xgboost")
+        model.train(X, y)
+        batcher = PredictionBatcher(model, max_wait_ms=5, max_batch_size=32)
+        
+        records = X.head(100).to_dict("records")
+        records[3]["monthly_income"] = 0  # invalid row must not fail its batch-mates
+        
+        results = await asyncio.gather(
+            *[batcher.predict(record) for record in records], return_exceptions=True
+        )
+        await batcher.close()
+        
+        assert isinstance(results[3], ValueError)
+        for index, record in enumerate(records):
+            if index != 3:
+                assert results[index] == pytest.approx(model.predict_one(record))
+        
+        metrics = batcher.get_metrics()
+        assert metrics["predictions_total"] == 100
+        assert metrics["batches_total"] < 100
+        assert metrics["max_batch_size_seen"] <= 32
+    
+    class ShortModel:
+        """Returns one prediction too few until fixed"""
+        
+        def __init__(self):
+            self.broken = True
+        
+        def predict_many(self, records):
+            return np.full(len(records) - self.broken, 0.25)
+    
+    @pytest.mark.asyncio
+    async def test_bad_batch_fails_callers_and_worker_survives(self):
+        """Test a malformed batch fails its futures and later requests are still served"""
+        model = self.ShortModel()
+        batcher = PredictionBatcher(model, max_wait_ms=5)
+        
+        results = await asyncio.gather(*[batcher.predict({}) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        
+        model.broken = False
+        assert await batcher.predict({}) == 0.25
+        
+        # A collector that died is restarted by the next request
+        batcher._worker.cancel()
+        await asyncio.sleep(0)
+        assert await asyncio.wait_for(batcher.predict({}), timeout=1) == 0.25
+        await batcher.close()
+
+class TestPatternDetector:
+    """Test fraud pattern detection"""
+    
+    def test_velocity_fraud_window_counts(self):
+        """Test each transaction counts the burst that follows it"""
+        transactions = [
+            {"id": f"txn_{i}", "timestamp": 1000 + i * 30, "amount": 100} for i in range(6)
+        ] + [{"id": "txn_late", "timestamp": 10000, "amount": 100}]
+        
+        flagged = PatternDetector().detect_velocity_fraud(list(reversed(transactions)))
+        
+        assert [f["transaction_id"] for f in flagged] == ["txn_0", "txn_1"]
+        assert flagged[0] == {
+            "type": "velocity_fraud",
+            "transaction_id": "txn_0",
+            "count": 6,
+            "total_amount": 600,
+            "time_window": 300,
+            "risk_score": 0.6
+        }
+    
+    def test_velocity_fraud_multiple_windows(self):
+        """Test several window sizes are checked in one call"""
+        transactions = [
+            {"id": f"txn_{i}", "timestamp": i * 120, "amount": 50} for i in range(30)
+        ]
+        
+        flagged = PatternDetector().detect_velocity_fraud(
+            transactions, time_windows={60: 2, 300: 3, 3600: 20}
+        )
+        windows = {f["time_window"] for f in flagged}
+        
+        assert windows == {300, 3600}
+        assert all(f["count"] >= 20 for f in flagged if f["time_window"] == 3600)
+    
+    def test_velocity_total_amount_is_exact(self):
+        """Test window totals match a plain sum, without prefix-sum rounding drift"""
+        amounts = [1e16, 1.0, 0.1, 0.2, 0.3]
+        transactions = [
+            {"id": f"txn_{i}", "timestamp": i * 100, "amount": amount} for i, amount in enumerate(amounts)
+        ]
+        
+        flagged = PatternDetector().detect_velocity_fraud(transactions, time_window=60, min_count=1)
+        
+        assert [f["total_amount"] for f in flagged] == amounts
+
+class TestStreamingFraudScoring:
+    """Test fraud scoring against per-user rolling state"""
+    
+    def test_burst_and_travel_detected_incrementally(self):
+        """Test velocity and location patterns come from the stored state"""
+        engine = FraudDetectionEngine()
+        state = UserTransactionState(max_transactions=16)
+        
+        for i in range(5):
+            result = engine.analyze_streaming_transaction(
+                {"id": f"txn_{i}", "timestamp": 1000 + i * 20, "amount": 250, "location": "Mumbai"},
+                state
+            )
+        assert [p["time_window"] for p in result["suspicious_patterns"]] == [60, 300]
+        
+        result = engine.analyze_streaming_transaction(
+            {"id": "txn_far", "timestamp": 1200, "amount": 250, "location": "Delhi"}, state
+        )
+        travel = [p for p in result["suspicious_patterns"] if p["type"] == "impossible_travel"]
+        assert travel[0]["from_location"] == "Mumbai"
+        assert result["state_summary"]["transactions_seen"] == 6
+    
+    def test_round_amounts_need_a_minimum_sample(self):
+        """Test the round-amount pattern waits for enough buffered transactions"""
+        engine = FraudDetectionEngine()
+        state = UserTransactionState(max_transactions=16)
+        
+        flagged = []
+        for i in range(5):
+            result = engine.analyze_streaming_transaction(
+                {"id": f"txn_{i}", "timestamp": 1000 + i * 3600, "amount": 500}, state
+            )
+            flagged.append(any(p["type"] == "round_amount_pattern" for p in result["suspicious_patterns"]))
+        
+        assert flagged == [False, False, False, False, True]
+    
+    def test_out_of_order_transaction(self):
+        """Test a late transaction is counted in its window but skips the travel check"""
+        engine = FraudDetectionEngine()
+        state = UserTransactionState(max_transactions=16)
+        for txn_id, timestamp, location in (("t1", 1000, "Mumbai"), ("t3", 1100, "Mumbai")):
+            engine.analyze_streaming_transaction(
+                {"id": txn_id, "timestamp": timestamp, "amount": 250, "location": location}, state
+            )
+        
+        late = engine.analyze_streaming_transaction(
+            {"id": "t2", "timestamp": 1050, "amount": 250, "location": "Delhi"}, state
+        )
+        stale = state.add({"id": "t0", "timestamp": 0, "amount": 100})
+        
+        assert late["state_summary"]["out_of_order"]
+        assert not [p for p in late["suspicious_patterns"] if p["type"] == "impossible_travel"]
+        assert [t for t, _ in state.window_events[300]] == [1000, 1050, 1100]
+        assert (state.last_timestamp, state.last_location) == (1100, "Mumbai")
+        assert stale["windows"][300]["count"] == 3 and stale["windows"][300]["total_amount"] == 750
+        assert stale["windows"][3600]["count"] == 4
+        assert state.count == 4
+    
+    def test_ring_buffer_is_bounded(self):
+        """Test old transactions are evicted along with their counters"""
+        state = UserTransactionState(max_transactions=4)
+        for i in range(10):
+            state.add({"id": i, "timestamp": i * 10000, "amount": 45500 if i < 3 else 120})
+        
+        assert len(state.recent) == 4
+        assert state.near_threshold == 0
+        assert state.count == 10
+    
+    @pytest.mark.asyncio
+    async def test_state_store_round_trip(self):
+        """Test states survive the JSON form used by the Redis tier"""
+        store = TransactionStateStore(max_transactions=8)
+        state = await store.get("user@example.com")
+        state.add({"id": "txn_1", "timestamp": 100, "amount": 500, "location": "Pune"})
+        await store.save("user@example.com", state)
+        
+        restored = UserTransactionState.from_dict(state.to_dict())
+        assert (await store.get("user@example.com")).count == 1
+        assert restored.to_dict() == state.to_dict()
+        assert restored.window_totals == state.window_totals
+    
+    @pytest.mark.asyncio
+    async def test_state_store_update(self):
+        """Test update applies to the stored state and returns the result"""
+        store = TransactionStateStore(max_transactions=8)
+        for timestamp in (100, 200):
+            result = await store.update(
+                "user@example.com", lambda state: state.add({"id": timestamp, "timestamp": timestamp, "amount": 10})
+            )
+        
+        assert result["history_count"] == 1
+        assert (await store.get("user@example.com")).count == 2
+
+class TestAnomalyDetector:
+    """Test anomaly scoring with persisted reference statistics"""
+    
+    @staticmethod
+    def make_transactions(n: int = 1000) -> pd.DataFrame:
+        rng = np.random.default_rng(7)
+        return pd.DataFrame({
+            "amount": rng.lognormal(7, 1, n),
+            "timestamp": rng.integers(1_600_000_000, 1_700_000_000, n),
+            "user_id": rng.choice([f"user_{i}" for i in range(20)], n),
+            "location": rng.choice(["Mumbai", "Delhi", "Pune"], n)
+        })
+    
+    def test_score_batch_matches_detect_anomalies(self):
+        """Test dict-based scoring matches the DataFrame path"""
+        data = self.make_transactions()
+        detector = AnomalyDetector()
+        detector.train(data)
+        
+        sample = data.sample(50, random_state=1)
+        sample.iloc[0, sample.columns.get_loc("user_id")] = "unseen_user"
+        
+        expected = detector.detect_anomalies(sample)
+        actual = detector.score_batch(sample.to_dict("records"))
+        
+        assert actual["anomaly_scores"] == pytest.approx(expected["anomaly_scores"])
+        assert actual["is_anomaly"] == expected["is_anomaly"]
+    
+    def test_reference_stats_persisted(self, tmp_path):
+        """Test a reloaded detector scores single events identically"""
+        data = self.make_transactions()
+        detector = AnomalyDetector()
+        detector.train(data)
+        path = tmp_path / "anomaly_detector.pkl"
+        detector.save_model(str(path))
+        
+        loaded = AnomalyDetector()
+        loaded.load_model(str(path))
+        transaction = data.iloc[3].to_dict()
+        
+        assert loaded.reference_stats["amount_mean"] == pytest.approx(data["amount"].mean())
+        assert loaded.score_one(transaction) == detector.score_one(transaction)
+    
+    def test_engine_keeps_batch_shape_and_rejects_bad_input(self):
+        """Test anomaly_detection keeps per-event lists and bad fields raise ValueError"""
+        data = self.make_transactions()
+        engine = FraudDetectionEngine()
+        engine.anomaly_detector.train(data)
+        history = data.head(4).to_dict("records")
+        transaction = dict(data.iloc[4].to_dict(), amount=-250.0)  # a refund
+        
+        result = engine.analyze_transaction(transaction, transaction_history=history)
+        assert len(result["anomaly_detection"]["anomaly_scores"]) == 5
+        assert set(result["anomaly_detection"]) == {
+            "anomaly_scores", "is_anomaly", "anomaly_indices", "total_anomalies", "anomaly_rate"
+        }
+        
+        state = UserTransactionState()
+        for bad in ({"amount": "lots"}, {"timestamp": 10 ** 20}, {"timestamp": "yesterday"}):
+            with pytest.raises(ValueError):
+                engine.analyze_streaming_transaction(dict(transaction, **bad), state)
+        assert state.count == 0
+
+class TestImpossibleTravel:
+    """Test gazetteer-based impossible-travel detection"""
+    
+    def test_haversine_distance(self):
+        """Test Mumbai to Delhi great-circle distance"""
+        distance = haversine_km(19.0760, 72.8777, 28.7041, 77.1025)
+        assert distance == pytest.approx(1150, abs=10)
+    
+    def test_gazetteer_lookup_is_normalized(self, tmp_path):
+        """Test names are matched case- and whitespace-insensitively"""
+        gazetteer = Gazetteer(cache_dir=str(tmp_path))
+        coords = gazetteer.lookup([" bangalore", "Atlantis", None])
+        assert coords[0].tolist() == pytest.approx([12.9716, 77.5946])
+        assert np.isnan(coords[1:]).all()
+    
+    def test_corrupt_gazetteer_cache_is_rebuilt(self, tmp_path):
+        """Test a truncated coordinate cache is replaced instead of failing the lookup"""
+        Gazetteer(cache_dir=str(tmp_path)).coords
+        (cache_file,) = tmp_path.glob("gazetteer_*.npy")
+        cache_file.write_bytes(cache_file.read_bytes()[:100])
+        
+        gazetteer = Gazetteer(cache_dir=str(tmp_path))
+        assert gazetteer.lookup(["Bangalore"])[0].tolist() == pytest.approx([12.9716, 77.5946])
+        assert isinstance(gazetteer.coords, np.memmap)
+        assert [path.name for path in tmp_path.iterdir()] == [cache_file.name]
+    
+    def test_batch_detection_per_user(self):
+        """Test consecutive sorted transactions per user are checked by speed"""
+        transactions = [
+            {"id": "t3", "user_id": "u1", "timestamp": 1800, "location": "Delhi"},
+            {"id": "t1", "user_id": "u1", "timestamp": 0, "location": "Mumbai"},
+            {"id": "t2", "user_id": "u1", "timestamp": 60, "location": "Unknown Town"},
+            {"id": "t4", "user_id": "u2", "timestamp": 0, "location": "Mumbai"},
+            {"id": "t5", "user_id": "u2", "timestamp": 7200, "location": "Pune"},
+        ]
+        flagged = detect_impossible_travel(transactions, max_speed_kmh=900)
+        
+        assert flagged[["from_transaction_id", "to_transaction_id"]].values.tolist() == [["t1", "t3"]]
+        assert flagged["speed_kmh"].iloc[0] > 2000
+    
+    def test_pattern_detector_uses_distance(self):
+        """Test nearby cities are not flagged while distant ones are"""
+        detector = PatternDetector(max_travel_speed_kmh=900)
+        nearby = detector.detect_location_anomalies([
+            {"timestamp": 0, "location": "Mumbai"},
+            {"timestamp": 1800, "location": "Thane"}
+        ])
+        distant = detector.detect_location_anomalies([
+            {"timestamp": 1800, "location": "Kolkata"},
+            {"timestamp": 0, "location": "Mumbai"}
+        ])
+        
+        assert nearby == []
+        assert distant[0]["from_location"] == "Mumbai"
+        assert distant[0]["distance_km"] > 1500
+    
+    def test_same_place_same_time_is_not_travel(self):
+        """Test zero distance in zero time is speed 0, not infinite"""
+        detector = PatternDetector(max_travel_speed_kmh=900)
+        same_place = detector.detect_location_anomalies([
+            {"timestamp": 0, "location": "Mumbai"},
+            {"timestamp": 0, "location": " mumbai"}
+        ])
+        
+        assert same_place == []
+        assert detector.travel_check("Mumbai", "mumbai", 0) is None
+        assert detector.travel_check("Mumbai", "Delhi", 0)["speed_kmh"] == float("inf")
+
+class TestRecommendationEngine:
+    """Test compiled recommendation rules"""
+    
+    def test_compiled_conditions(self):
+        """Test chained comparisons and data fields without eval"""
+        between = compile_condition("0.36 < ratio <= 0.5")
+        assert between(0.4, {}) and not between(0.36, {}) and between(0.5, {})
+        assert compile_condition("missed_payments > 0")(0.0, {"missed_payments": 2})
+        assert not compile_condition("credit_types < 3")(0.0, {"credit_types": 4})
+        assert between(np.array([0.3, 0.4, 0.6]), {}).tolist() == [False, True, False]
+    
+    def test_rejects_invalid_conditions(self):
+        """Test anything other than comparisons fails at compile time"""
+        for condition in ["__import__('os')", "ratio >", "ratio + 1 > 2"]:
+            with pytest.raises(ValueError):
+                compile_condition(condition)
+    
+    def test_many_matches_single(self):
+        """Test batch recommendations match per-profile recommendations"""
+        engine = CreditRecommendationEngine()
+        profiles = SAMPLE_PROFILES + [{"monthly_income": 40000, "monthly_expenses": 39000, "missed_payments": 1}]
+        many = engine.get_personalized_recommendations_many(pd.DataFrame(profiles))
+        
+        for profile, batch_result in zip(profiles, many):
+            single = engine.get_personalized_recommendations(profile)
+            assert batch_result["analysis"] == single["analysis"]
+            assert batch_result["action_plan"] == single["action_plan"]
+
+class TestModelHost:
+    """Test pipeline calls through the shared model host protocol"""
+    
+    def test_client_calls_served_pipelines(self, tmp_path):
+        """Test results, errors and the pipeline list over a local socket"""
+        address = str(tmp_path / "model-host.sock")
+        with Listener(address, authkey=b"secret") as listener:
+            server = PipelineServer(listener, loader=lambda: {"upper": str.upper})
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            server.load()
+            
+            client = ModelHostClient(address, "secret", timeout=5)
+            assert client.available_pipelines() == ["upper"]
+            assert client.call("upper", "hdfc bank") == "HDFC BANK"
+            with pytest.raises(RuntimeError, match="KeyError"):
+                client.call("ner", "text")
+    
+    def test_unreachable_host_raises_connection_error(self, tmp_path):
+        """Test a missing host surfaces as ConnectionError so callers can fall back"""
+        client = ModelHostClient(str(tmp_path / "missing.sock"), "secret", timeout=1)
+        with pytest.raises(ConnectionError):
+            client.available_pipelines()
+    
+    def test_host_never_unlinks_a_non_socket(self, tmp_path):
+        """Test startup refuses an address that is a regular file instead of deleting it"""
+        from credit_analysis.model_host import _run_host
+        
+        planted = tmp_path / "model-host.sock"
+        planted.write_text("not a socket")
+        with pytest.raises(RuntimeError, match="not a socket"):
+            _run_host(str(planted), b"secret", threading.Event())
+        assert planted.read_text() == "not a socket"
+
+class TestDocumentEngine:
+    """Test page-parallel document extraction"""
+    
+    @staticmethod
+    def make_blank_pdf(path, pages: int):
+        PyPDF2 = pytest.importorskip("PyPDF2")
+        writer = PyPDF2.PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(width=612, height=792)
+        with open(path, "wb") as file:
+            writer.write(file)
+    
+    def test_pdf_split_into_ordered_page_groups(self, tmp_path):
+        """Test PDFs are planned as contiguous page groups in page order"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_engine import DocumentEngine
+        from credit_analysis.document_nlp import FinancialDocumentAnalyzer
+        
+        pdf_path = str(tmp_path / "statement.pdf")
+        self.make_blank_pdf(pdf_path, 5)
+        engine = DocumentEngine(FinancialDocumentAnalyzer(), max_workers=2, pdf_pages_per_task=2)
+        
+        assert [pages for _, pages in engine.plan_tasks(pdf_path)] == [[0, 1], [2, 3], [4]]
+    
+    @pytest.mark.asyncio
+    async def test_extraction_runs_in_pool(self, tmp_path):
+        """Test extraction through the pool and an error for unreadable files"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_engine import DocumentEngine, DocumentExtractionError
+        from credit_analysis.document_nlp import FinancialDocumentAnalyzer
+        
+        pdf_path = str(tmp_path / "statement.pdf")
+        self.make_blank_pdf(pdf_path, 3)
+        engine = DocumentEngine(FinancialDocumentAnalyzer(), max_workers=2)
+        try:
+            assert await engine.extract_text(pdf_path) == ""
+            with pytest.raises(DocumentExtractionError, match="PDF Error"):
+                await engine.extract_text(str(tmp_path / "missing.pdf"))
+        finally:
+            engine.close()
+
+    @staticmethod
+    def failing_ocr_engine(monkeypatch):
+        """Engine extracting in a thread of this process, with OCR failing (e.g. no tesseract)"""
+        import pytesseract
+        from concurrent.futures import ThreadPoolExecutor
+        from credit_analysis.document_engine import DocumentEngine
+        from credit_analysis.document_nlp import FinancialDocumentAnalyzer
+        
+        def fail(*args, **kwargs):
+            raise pytesseract.TesseractNotFoundError()
+        
+        monkeypatch.setattr(pytesseract, "image_to_string", fail)
+        engine = DocumentEngine(FinancialDocumentAnalyzer())
+        engine._pool = ThreadPoolExecutor(max_workers=1)
+        return engine
+    
+    @pytest.mark.asyncio
+    async def test_single_image_ocr_failure_raises(self, tmp_path, monkeypatch):
+        """Test a failed OCR of a one-page image raises instead of returning error text"""
+        pytest.importorskip("cv2")
+        from PIL import Image
+        from credit_analysis.document_engine import DocumentExtractionError, _extract_image_frames
+        
+        image_path = str(tmp_path / "payslip.png")
+        Image.new("RGB", (64, 64), "white").save(image_path)
+        engine = self.failing_ocr_engine(monkeypatch)
+        try:
+            assert engine.plan_tasks(image_path) == [(_extract_image_frames, [0])]
+            with pytest.raises(DocumentExtractionError, match="OCR Error"):
+                await engine.extract_text(image_path)
+        finally:
+            engine.close()
+
+class TestDocumentJobs:
+    """Test background document-analysis jobs"""
+    
+    class FakeUpload:
+        """Minimal stand-in for UploadFile.read()"""
+        
+        def __init__(self, content: bytes):
+            self.content = content
+        
+        async def read(self, size: int) -> bytes:
+            chunk, self.content = self.content[:size], self.content[size:]
+            return chunk
+    
+    @pytest.mark.asyncio
+    async def test_job_reports_progress_and_result(self, tmp_path):
+        """Test upload streaming, per-page progress and result lookup by ID"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_engine import DocumentEngine
+        from credit_analysis.document_cache import DocumentResultCache, DiskResultCache
+        from credit_analysis.document_jobs import DocumentJobManager
+        from credit_analysis.document_nlp import FinancialDocumentAnalyzer
+        
+        source = tmp_path / "statement.pdf"
+        TestDocumentEngine.make_blank_pdf(str(source), 4)
+        engine = DocumentEngine(FinancialDocumentAnalyzer(), max_workers=2, pdf_pages_per_task=1)
+        cache = DocumentResultCache(DiskResultCache(str(tmp_path / "cache"), 1024 * 1024, 3600))
+        jobs = DocumentJobManager(engine, cache, str(tmp_path / "jobs"))
+        try:
+            path, digest = await jobs.save_upload(self.FakeUpload(source.read_bytes()), ".pdf")
+            job = await jobs.submit(path, "statement.pdf", "auto", "user@example.com", digest)
+            events = [event async for event in jobs.stream_progress(job["job_id"], poll_interval=0.01)]
+        finally:
+            await jobs.close()
+            engine.close()
+        
+        assert events[-1]["status"] == "completed" and events[-1]["progress"] == 100
+        assert [event["progress"] for event in events] == sorted(event["progress"] for event in events)
+        result = jobs.get(job["job_id"])
+        assert result["pages_total"] == 4
+        assert result["result"]["document_type"] == "unknown"
+        assert not os.path.exists(path)
+    
+    @pytest.mark.asyncio
+    async def test_upload_size_limit(self, tmp_path):
+        """Test oversized uploads are rejected and not left on disk"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_jobs import DocumentJobManager, UploadTooLarge
+        
+        jobs = DocumentJobManager(None, None, str(tmp_path), max_upload_bytes=10)
+        with pytest.raises(UploadTooLarge):
+            await jobs.save_upload(self.FakeUpload(b"x" * 100))
+        assert list(tmp_path.iterdir()) == []
+        assert jobs.get("../etc/passwd") is None
+    
+    class FakeEngine:
+        """Engine whose analysis fails or never finishes"""
+        
+        def __init__(self, error: Exception = None):
+            self.error = error
+        
+        async def process_document(self, file_path, document_type, on_progress=None):
+            if self.error is not None:
+                raise self.error
+            await asyncio.Event().wait()
+    
+    async def run_job(self, jobs):
+        path, digest = await jobs.save_upload(self.FakeUpload(b"scan"), ".png")
+        return await jobs.submit(path, "scan.png", "auto", "user@example.com", digest)
+    
+    @pytest.mark.asyncio
+    async def test_engine_error_and_shutdown_fail_jobs(self, tmp_path):
+        """Test extraction errors and close() leave jobs failed, not processing forever"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_cache import DocumentResultCache, DiskResultCache
+        from credit_analysis.document_engine import DocumentExtractionError
+        from credit_analysis.document_jobs import DocumentJobManager
+        
+        cache = DocumentResultCache(DiskResultCache(str(tmp_path / "cache"), 1024 * 1024, 3600))
+        broken = DocumentJobManager(self.FakeEngine(DocumentExtractionError("OCR Error: bad image")),
+                                    cache, str(tmp_path / "broken"))
+        job = await self.run_job(broken)
+        events = [event async for event in broken.stream_progress(job["job_id"], poll_interval=0.01)]
+        await broken.close()
+        assert events[-1]["status"] == "failed"
+        assert broken.get(job["job_id"])["error"] == "OCR Error: bad image"
+        
+        hanging = DocumentJobManager(self.FakeEngine(), cache, str(tmp_path / "hanging"), concurrency=1)
+        running, queued = await self.run_job(hanging), await self.run_job(hanging)
+        await asyncio.sleep(0.05)
+        assert hanging.get(running["job_id"])["status"] == "processing"
+        await hanging.close()
+        assert [hanging.get(job["job_id"])["status"] for job in (running, queued)] == ["failed", "failed"]
+    
+    @pytest.mark.asyncio
+    async def test_orphaned_job_reported_failed(self, tmp_path):
+        """Test a job whose worker exited or stopped heartbeating is failed on read"""
+        pytest.importorskip("cv2")
+        import subprocess
+        import sys
+        from credit_analysis.document_cache import DocumentResultCache, DiskResultCache
+        from credit_analysis.document_jobs import DocumentJobManager
+        
+        cache = DocumentResultCache(DiskResultCache(str(tmp_path / "cache"), 1024 * 1024, 3600))
+        owner = DocumentJobManager(self.FakeEngine(), cache, str(tmp_path / "jobs"), heartbeat_interval=0.01)
+        job = await self.run_job(owner)
+        await asyncio.sleep(0.05)
+        reader = DocumentJobManager(None, None, str(tmp_path / "jobs"), stale_after=1.0)
+        assert reader.get(job["job_id"])["status"] == "processing"
+        
+        # Owner alive but its heartbeat stopped
+        owner._heartbeat_task.cancel()
+        await asyncio.gather(owner._heartbeat_task, return_exceptions=True)
+        reader.stale_after = 0.0
+        assert reader.get(job["job_id"])["status"] == "failed"
+        
+        # Owner process exited
+        exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                                capture_output=True, text=True)
+        state = reader.get(job["job_id"])
+        state.update(status="processing", worker_pid=int(exited.stdout))
+        reader._write_state(state)
+        reader.stale_after = 60.0
+        assert reader.get(job["job_id"])["status"] == "failed"
+        await owner.close()
+    
+    @pytest.mark.asyncio
+    async def test_dead_worker_restarted_without_dropping_jobs(self, tmp_path):
+        """Test a worker that died is replaced on the same queue and job files stay private"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_cache import DocumentResultCache, DiskResultCache
+        from credit_analysis.document_jobs import DocumentJobManager
+        
+        cache = DocumentResultCache(DiskResultCache(str(tmp_path / "cache"), 1024 * 1024, 3600))
+        jobs = DocumentJobManager(self.FakeEngine(ValueError("unreadable")), cache, str(tmp_path / "jobs"),
+                                  concurrency=1)
+        first = await self.run_job(jobs)
+        [event async for event in jobs.stream_progress(first["job_id"], poll_interval=0.01)]
+        queue = jobs._queue
+        
+        # Kill the only worker, then queue a job before the next submit restarts it
+        jobs._workers[0].cancel()
+        await asyncio.gather(*jobs._workers, return_exceptions=True)
+        path, digest = await jobs.save_upload(self.FakeUpload(b"scan"), ".png")
+        await queue.put(({**first, "job_id": "queued", "status": "queued"}, path))
+        second = await self.run_job(jobs)
+        
+        async def collect():
+            return [event async for event in jobs.stream_progress(second["job_id"], poll_interval=0.01)]
+        
+        events = await asyncio.wait_for(collect(), timeout=5)
+        await asyncio.sleep(0.05)
+        await jobs.close()
+        
+        assert jobs._queue is queue
+        assert events[-1]["status"] == "failed"
+        assert jobs.get("queued")["status"] == "failed"
+        assert stat.S_IMODE(os.stat(tmp_path / "jobs").st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(tmp_path / "jobs" / f"{first['job_id']}.json").st_mode) == 0o600
+
+class TestDocumentResultCache:
+    """Test the content-addressed document result cache"""
+    
+    @pytest.mark.asyncio
+    async def test_repeat_upload_is_cached(self, tmp_path):
+        """Test identical content and type hit, a different type misses"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_cache import DocumentResultCache, DiskResultCache
+        
+        cache = DocumentResultCache(DiskResultCache(str(tmp_path), 1024 * 1024, 3600))
+        calls = []
+        
+        async def compute():
+            calls.append(1)
+            return {"document_type": "bank_statement", "summary": {"total_amount": 5000.0}}
+        
+        first, first_cached = await cache.get_or_compute("abc", "auto", compute)
+        second, second_cached = await cache.get_or_compute("abc", "auto", compute)
+        await cache.get_or_compute("abc", "kyc", compute)
+        
+        assert (first_cached, second_cached) == (False, True)
+        assert second == first
+        assert len(calls) == 2
+    
+    @pytest.mark.asyncio
+    async def test_failed_extraction_is_not_cached(self, tmp_path):
+        """Test extraction errors propagate and leave only private cache files behind"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_cache import DocumentResultCache, DiskResultCache
+        from credit_analysis.document_engine import DocumentExtractionError
+        
+        cache = DocumentResultCache(DiskResultCache(str(tmp_path / "cache"), 1024 * 1024, 3600))
+        
+        async def failing():
+            raise DocumentExtractionError("OCR Error: worker crashed")
+        
+        async def compute():
+            return {"document_type": "kyc", "raw_text": "PAN ABCDE1234F"}
+        
+        with pytest.raises(DocumentExtractionError):
+            await cache.get_or_compute("abc", "auto", failing)
+        result, cached = await cache.get_or_compute("abc", "auto", compute)
+        
+        assert result["document_type"] == "kyc" and not cached
+        assert os.stat(tmp_path / "cache").st_mode & 0o777 == 0o700
+        assert all(path.stat().st_mode & 0o777 == 0o600 for path in (tmp_path / "cache").iterdir())
+    
+    @pytest.mark.asyncio
+    async def test_failed_image_ocr_is_not_cached(self, tmp_path, monkeypatch):
+        """Test an image whose OCR fails leaves no cache entry and is retried next time"""
+        pytest.importorskip("cv2")
+        from PIL import Image
+        from credit_analysis.document_cache import DocumentResultCache, DiskResultCache
+        from credit_analysis.document_engine import DocumentExtractionError
+        
+        image_path = str(tmp_path / "payslip.png")
+        Image.new("RGB", (64, 64), "white").save(image_path)
+        cache_dir = tmp_path / "cache"
+        cache = DocumentResultCache(DiskResultCache(str(cache_dir), 1024 * 1024, 3600))
+        engine = TestDocumentEngine.failing_ocr_engine(monkeypatch)
+        try:
+            for _ in range(2):
+                with pytest.raises(DocumentExtractionError):
+                    await cache.get_or_compute("abc", "auto", lambda: engine.process_document(image_path))
+        finally:
+            engine.close()
+        
+        assert list(cache_dir.iterdir()) == []
+        assert cache.metrics["misses"] == 2
+    
+    def test_disk_tier_evicts_least_recently_used(self, tmp_path):
+        """Test the size limit evicts the oldest unused entries and TTL expires entries"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_cache import DiskResultCache
+        
+        disk = DiskResultCache(str(tmp_path), max_bytes=3800, ttl_seconds=3600)
+        now = time.time()
+        for index, key in enumerate(["a", "b", "c"]):
+            disk.set(key, {"raw_text": "x" * 1000})
+            os.utime(tmp_path / f"{key}.json", (now - 60 + index, now - 60 + index))
+        
+        assert disk.get("a") is not None  # refreshes "a"
+        disk.set("d", {"raw_text": "x" * 1000})
+        
+        assert disk.get("b") is None
+        assert all(disk.get(key) is not None for key in ["a", "c", "d"])
+        assert DiskResultCache(str(tmp_path), 10 ** 6, ttl_seconds=-1).get("a") is None
+
+class TestEntityScanner:
+    """Test single-pass financial entity extraction"""
+    
+    def test_entities_in_one_pass(self):
+        """Test every entity type is found with normalized amounts"""
+        text = ("Paid Rs. 1,25,000.50 and ₹500, INR 2,000 to HDFC Bank (IFSC HDFC0001234) "
+                "on 12/03/2024, 5 MAR 2024 and Mar 6, 2024. PAN ABCDE1234F, "
+                "card 4111 1111 1111 1111, account 123456789012, from State Bank of India.")
+        entities = scan_entities(text)
+        
+        assert entities["amounts"] == ["Rs. 1,25,000.50", "₹500", "INR 2,000"]
+        assert entities["amount_values"] == [125000.5, 500.0, 2000.0]
+        assert entities["dates"] == ["12/03/2024", "5 MAR 2024", "Mar 6, 2024"]
+        assert entities["account_numbers"] == ["4111 1111 1111 1111", "123456789012"]
+        assert entities["pan_numbers"] == ["ABCDE1234F"]
+        assert entities["ifsc_codes"] == ["HDFC0001234"]
+        assert entities["organizations"] == ["HDFC Bank", "State Bank of India"]
+    
+    def test_organizations_from_regex_and_ner_reported_once(self):
+        """Test an organization matched by both the regex pass and NER appears once"""
+        pytest.importorskip("cv2")
+        from credit_analysis.document_nlp import FinancialDocumentAnalyzer
+        
+        analyzer = FinancialDocumentAnalyzer()
+        analyzer._batched["ner"] = lambda text: [
+            {"entity": "B-ORG", "word": "HDFC  bank"},
+            {"entity": "B-ORG", "word": "Acme Pvt Ltd"},
+            {"entity": "B-PER", "word": "Asha"}
+        ]
+        entities = analyzer.extract_financial_entities("Asha paid HDFC Bank and Acme Pvt. Ltd. via HDFC Bank")
+        
+        assert entities["organizations"] == ["HDFC Bank", "Acme Pvt. Ltd."]
+        assert entities["names"] == ["Asha"]
+    
+    def test_entities_must_start_a_token(self):
+        """Test digits and codes embedded in longer tokens are ignored"""
+        entities = scan_entities("REF1234567890123 XABCDE1234F order99/12/2024")
+        assert entities["account_numbers"] == []
+        assert entities["pan_numbers"] == []
+        assert entities["dates"] == []
+
+class TestBatchedPipeline:
+    """Test micro-batched transformer inference"""
+    
+    @staticmethod
+    def fake_ner(texts, batch_size):
+        """Token-classification stand-in: tags every capitalized word as an organization"""
+        return [
+            [{"entity": "B-ORG", "word": word, "start": text.index(word), "end": text.index(word) + len(word)}
+             for word in text.split() if word[0].isupper()]
+            for text in texts
+        ]
+    
+    def test_long_text_chunked_and_merged(self):
+        """Test overlapping windows map entities back to full-text offsets once"""
+        text = " ".join(f"Org{i}" if i % 7 == 0 else f"word{i}" for i in range(60))
+        chunker = TokenWindowChunker(None, max_tokens=20, stride=4)
+        assert len(chunker.chunk(text)) > 1
+        
+        ner = BatchedPipeline(self.fake_ner, chunker, merge_entities=True)
+        entities = ner(text)
+        
+        assert [entity["word"] for entity in entities] == [f"Org{i}" for i in range(0, 60, 7)]
+        assert all(text[entity["start"]:entity["end"]] == entity["word"] for entity in entities)
+    
+    def test_concurrent_callers_share_batches(self):
+        """Test chunks from concurrent documents are grouped into one call"""
+        calls = []
+        
+        def pipeline(texts, batch_size):
+            calls.append(len(texts))
+            return [{"label": "POSITIVE", "score": 0.9} for _ in texts]
+        
+        classifier = BatchedPipeline(pipeline, TokenWindowChunker(None), max_batch_size=8, max_wait_ms=50)
+        barrier = threading.Barrier(4)
+        results = []
+        
+        def classify():
+            barrier.wait()
+            results.append(classifier("Salary credited by Acme"))
+        
+        threads = [threading.Thread(target=classify) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(results) == 4 and sum(calls) == 4
+        assert max(calls) > 1
+        assert classifier.get_metrics()["chunks_per_sec"] > 0
+    
+    def test_bad_batches_settle_every_caller(self):
+        """Test malformed output fails the callers and a stuck pipeline times out"""
+        short = BatchedPipeline(lambda texts, batch_size: [], TokenWindowChunker(None))
+        with pytest.raises(RuntimeError, match="0 outputs"):
+            short("Salary credited by Acme")
+        
+        release = threading.Event()
+        
+        def stuck(texts, batch_size):
+            release.wait()
+            return [{"label": "POSITIVE"} for _ in texts]
+        
+        slow = BatchedPipeline(stuck, TokenWindowChunker(None), result_timeout=0.05)
+        with pytest.raises(TimeoutError):
+            slow("Salary credited by Acme")
+        release.set()
+        assert slow("Salary credited by Acme") == [{"label": "POSITIVE"}]
+        assert short.get_metrics()["errors_total"] == 1
+        assert slow.get_metrics()["timeouts_total"] == 1
+
+class TestOnnxBackend:
+    """Test ONNX export discovery and backend selection"""
+    
+    @staticmethod
+    def write_manifest(base_dir, name, model):
+        export_dir = base_dir / name
+        export_dir.mkdir()
+        task = PIPELINE_SPECS[name][0]
+        (export_dir / MANIFEST_FILE).write_text(
+            f'{{"task": "{task}", "model": "{model}", "file_name": "model_quantized.onnx", "quantized": true}}'
+        )
+    
+    def test_manifest_must_match_configured_model(self, tmp_path):
+        """Test only an export of the current model is picked up"""
+        self.write_manifest(tmp_path, "ner", PIPELINE_SPECS["ner"][1])
+        self.write_manifest(tmp_path, "classifier", "some-older-model")
+        
+        assert read_manifest("ner", str(tmp_path))["quantized"] is True
+        assert read_manifest("classifier", str(tmp_path)) is None
+    
+    def test_missing_export_falls_back(self, tmp_path, monkeypatch):
+        """Test no export means no ONNX pipeline, and unknown backends mean auto"""
+        assert load_onnx_pipeline("ner", str(tmp_path)) is None
+        monkeypatch.setenv("NLP_BACKEND", "tensorrt")
+        assert nlp_backend() == "auto"
@@ -0,0 +1,481 @@
+"""Real-time Streaming Tests"""
+import asyncio
+import json
+import pytest
+from neocred_realtime.websocket_manager import ConnectionManager
+from datetime import datetime
+from neocred_realtime import envelope as envelope_module
+from neocred_realtime.backplane import InMemoryHub, InMemoryBackplane
+from neocred_realtime.envelope import Envelope
+from neocred_realtime.topics import TopicIndex, subscription_error
+from neocred_realtime.sse_hub import SSEHub
+
+class FakeWebSocket:
+    """In-memory WebSocket; ``delay`` makes every send that slow"""
+    
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+        self.frames = []
+        self.closed_with = None
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.frames.append(text)
+        self.sent.append(json.loads(text))
+    
+    async def send_bytes(self, data: bytes):
+        self.frames.append(data)
+        self.sent.append(json.loads(data))
+    
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+async def eventually(predicate, timeout: float = 2.0):
+    """Poll until ``predicate()`` holds or the timeout passes"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+    assert predicate()
+
+class TestConnectionManager:
+    """Test queued WebSocket fan-out"""
+    
+    @pytest.mark.asyncio
+    async def test_slow_client_does_not_delay_others(self):
+        """Test broadcast only enqueues and fast sockets are served first"""
+        manager = ConnectionManager(max_queue=16)
+        slow = FakeWebSocket(delay=0.2)
+        fast = [FakeWebSocket() for _ in range(50)]
+        await manager.connect(slow, "group")
+        for index, websocket in enumerate(fast):
+            await manager.connect(websocket, "group", user_id=f"user{index}")
+        
+        queued = await manager.broadcast_all({"type": "market_alert", "alert": {"index": 1}})
+        assert queued == 51
+        await asyncio.sleep(0.05)
+        
+        assert all(len(websocket.sent) == 1 for websocket in fast)
+        assert slow.sent == []
+        await manager.send_to_user({"type": "risk_score_update", "risk_score": 0.4}, "user3")
+        await eventually(lambda: len(slow.sent) == 1)
+        assert fast[3].sent[-1]["type"] == "risk_score_update"
+    
+    @pytest.mark.asyncio
+    async def test_drop_oldest_and_coalesce_policies(self):
+        """Test full queues drop the oldest message, or replace one of the same type"""
+        for policy, expected_prices in (("drop_oldest", [7, 8, 9]), ("coalesce", [9])):
+            manager = ConnectionManager(max_queue=3, policy=policy)
+            websocket = FakeWebSocket(delay=0.05)
+            await manager.connect(websocket, "group")
+            
+            await manager.broadcast_all({"type": "status", "value": "open"})
+            await asyncio.sleep(0.01)  # writer picks up the first message
+            await manager.broadcast_all({"type": "status", "value": "busy"})
+            for price in range(10):
+                await manager.broadcast_all({"type": "quote", "price": price})
+            await eventually(lambda: websocket.sent and websocket.sent[-1].get("price") == 9)
+            
+            prices = [message["price"] for message in websocket.sent if message["type"] == "quote"]
+            metrics = manager.get_metrics()
+            if policy == "drop_oldest":
+                assert prices == expected_prices
+                assert metrics["messages_dropped"] == 8
+            else:
+                # status survives; quotes collapse to the latest value in their slot
+                assert [m.get("value") for m in websocket.sent if m["type"] == "status"] == ["open", "busy"]
+                assert prices[-1] == 9 and metrics["messages_coalesced"] > 0
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_policy_closes_slow_consumer(self):
+        """Test a consumer that overflows its queue is closed and forgotten"""
+        manager = ConnectionManager(max_queue=2, policy="disconnect")
+        slow, fast = FakeWebSocket(delay=0.05), FakeWebSocket()
+        await manager.connect(slow, "group")
+        await manager.connect(fast, "group")
+        
+        for index in range(5):
+            await manager.broadcast_to_group({"type": "tick", "index": index}, "group")
+            await asyncio.sleep(0.01)
+        await eventually(lambda: slow.closed_with is not None)
+        
+        assert slow.closed_with == 1013
+        assert len(fast.sent) == 5
+        metrics = manager.get_metrics()
+        assert metrics["connections"] == 1
+        assert metrics["slow_consumer_disconnects"] == 1
+        manager.disconnect(fast, "group")
+        assert manager.active_connections == {}
+    
+    @pytest.mark.asyncio
+    async def test_stalled_send_closes_socket(self):
+        """Test a send that times out closes the socket so the client reconnects"""
+        manager = ConnectionManager(send_timeout=0.05)
+        stalled, broken = FakeWebSocket(delay=10), FakeWebSocket()
+    
+        async def fail(data: bytes):
+            raise RuntimeError("connection reset")
+    
+        broken.send_bytes = fail
+        await manager.connect(stalled, "group")
+        await manager.connect(broken, "group", binary=True)
+    
+        await manager.broadcast_to_group({"type": "tick"}, "group")
+        await eventually(lambda: stalled.closed_with is not None and broken.closed_with is not None)
+    
+        assert stalled.closed_with == 1013
+        assert broken.closed_with == 1011
+        assert manager.get_metrics()["connections"] == 0
+
+
+class TestBackplane:
+    """Test cross-worker fan-out over the in-memory backplane"""
+    
+    async def workers(self, count: int):
+        hub = InMemoryHub()
+        managers = [ConnectionManager(worker_id=f"worker{index}") for index in range(count)]
+        for manager in managers:
+            await manager.start_backplane(InMemoryBackplane(hub))
+        return managers
+    
+    @pytest.mark.asyncio
+    async def test_messages_reach_sockets_on_every_worker(self):
+        """Test broadcast, group and user messages published on one worker reach the others once"""
+        first, second = await self.workers(2)
+        local, remote = FakeWebSocket(), FakeWebSocket()
+        await first.connect(local, "dashboard_a", user_id="a")
+        await second.connect(remote, "dashboard_b", user_id="b")
+        
+        assert await first.broadcast_all({"type": "market_alert", "alert": {"index": 1}}) == 1
+        assert await first.send_to_user({"type": "risk_score_update", "risk_score": 0.2}, "b") == 0
+        await first.broadcast_to_group({"type": "portfolio_update"}, "dashboard_a")
+        await eventually(lambda: len(remote.sent) == 2 and len(local.sent) == 2)
+        await asyncio.sleep(0.02)
+        
+        assert [m["type"] for m in remote.sent] == ["market_alert", "risk_score_update"]
+        assert [m["type"] for m in local.sent] == ["market_alert", "portfolio_update"]
+        assert first.get_metrics()["backplane_published"] == 3
+        assert second.get_metrics()["backplane_received"] == 3
+        for manager in (first, second):
+            await manager.stop_backplane()
+    
+    @pytest.mark.asyncio
+    async def test_default_worker_ids_are_unique_per_start(self):
+        """Test managers with the default id (as forked from a preloaded app) get distinct ids on start"""
+        hub = InMemoryHub()
+        first, second = ConnectionManager(), ConnectionManager()
+        assert first.worker_id == second.worker_id  # same host and pid, like forked workers
+        for manager in (first, second):
+            assert await manager.start_backplane(InMemoryBackplane(hub))
+        assert first.worker_id != second.worker_id
+        
+        remote = FakeWebSocket()
+        await second.connect(remote, "main")
+        await first.broadcast_all({"type": "market_alert"})
+        await eventually(lambda: len(remote.sent) == 1)
+        for manager in (first, second):
+            await manager.stop_backplane()
+    
+    @pytest.mark.asyncio
+    async def test_unreachable_backplane_falls_back_to_local(self):
+        """Test a backplane that fails to start leaves delivery local instead of raising"""
+        class DownBackplane(InMemoryBackplane):
+            async def start(self, worker_id, handler):
+                raise ConnectionError("redis down")
+        
+        manager = ConnectionManager()
+        assert not await manager.start_backplane(DownBackplane())
+        assert manager.backplane is None
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "main")
+        assert await manager.broadcast_all({"type": "market_alert"}) == 1
+        assert manager.get_metrics()["backplane_errors"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_presence_across_workers(self):
+        """Test user and group presence counts sockets per worker and drops them on disconnect"""
+        first, second = await self.workers(2)
+        sockets = [FakeWebSocket() for _ in range(3)]
+        await first.connect(sockets[0], "dashboard_a", user_id="a")
+        await second.connect(sockets[1], "dashboard_a", user_id="a")
+        await second.connect(sockets[2], "dashboard_a")
+        await asyncio.sleep(0)
+        
+        assert await first.presence("user", "a") == {"worker0": 1, "worker1": 1}
+        assert await second.presence("group", "dashboard_a") == {"worker0": 1, "worker1": 2}
+        second.disconnect(sockets[1], "dashboard_a", "a")
+        await asyncio.sleep(0)
+        assert await first.presence("user", "a") == {"worker0": 1}
+        assert await first.presence("user", "nobody") == {}
+        
+        await second.stop_backplane()
+        assert await first.presence("group", "dashboard_a") == {"worker0": 1}
+        await first.stop_backplane()
+
+
+class TestEnvelope:
+    """Test serialize-once message envelopes"""
+    
+    def test_encodings(self):
+        """Test the payload, text and SSE frame share one compact encoding"""
+        stamp = datetime(2024, 5, 1, 9, 30, 15, 250000)
+        message = Envelope.build("market_alert", alert={"index": "NIFTY", "change": -1.5})
+        assert message.type == "market_alert"
+        assert json.loads(message.text)["alert"] == {"index": "NIFTY", "change": -1.5}
+        assert message.text is message.text
+        
+        message = Envelope.from_message({"type": "tick", "timestamp": stamp, "note": "a\nb ₹"})
+        assert message.sse == b"data: " + message.payload + b"\n\n"
+        assert message.sse.count(b"\n") == 2
+        assert json.loads(message.payload)["timestamp"] == stamp.isoformat()
+        
+        orjson_available = envelope_module.ORJSON_AVAILABLE
+        try:
+            envelope_module.ORJSON_AVAILABLE = False
+            assert Envelope.from_message({"type": "tick", "timestamp": stamp, "note": "a\nb ₹"}).payload == message.payload
+        finally:
+            envelope_module.ORJSON_AVAILABLE = orjson_available
+    
+    @pytest.mark.asyncio
+    async def test_broadcast_shares_one_encoding(self):
+        """Test every recipient gets the same encoded object, as text or binary frames"""
+        manager = ConnectionManager()
+        text_sockets = [FakeWebSocket() for _ in range(3)]
+        binary_socket = FakeWebSocket()
+        for websocket in text_sockets:
+            await manager.connect(websocket, "group")
+        await manager.connect(binary_socket, "group", binary=True)
+        
+        message = Envelope.build("market_alert", alert={"index": 1})
+        assert await manager.broadcast_all(message) == 4
+        await eventually(lambda: all(websocket.frames for websocket in text_sockets + [binary_socket]))
+        
+        assert all(websocket.frames[0] is message.text for websocket in text_sockets)
+        assert binary_socket.frames[0] is message.payload
+        assert binary_socket.sent == text_sockets[0].sent
+
+
+class TestTopics:
+    """Test topic subscriptions"""
+    
+    def test_index_matches_exact_and_prefix_patterns(self):
+        """Test wildcards match every topic below their prefix, and subscribers are found once"""
+        index = TopicIndex()
+        index.subscribe("a", "market.*")
+        index.subscribe("a", "market.alert")
+        index.subscribe("b", "market.alert")
+        index.subscribe("c", "risk.user.42")
+        index.subscribe("d", "*")
+        
+        assert index.match("market.alert") == {"a", "b", "d"}
+        assert index.match("market.nifty.open") == {"a", "d"}
+        assert index.match("market") == {"d"}
+        assert index.match("risk.user.42") == {"c", "d"}
+        assert not index.subscribe("a", "market.*")
+        with pytest.raises(ValueError):
+            index.subscribe("a", "market.*.open")
+        
+        index.remove("a")
+        index.unsubscribe("d", "*")
+        assert index.match("market.alert") == {"b"}
+        assert index.prefixes == {} and "a" not in index.by_subscriber
+        assert len(index) == 2
+    
+    def test_subscription_rules(self):
+        """Test clients may only follow their own risk topic"""
+        assert subscription_error("market.*", "42") is None
+        assert subscription_error("risk.user.42", "42") is None
+        assert subscription_error("risk.user.7", "42") == "forbidden"
+        assert subscription_error("risk.*", "42") == "forbidden"
+        assert subscription_error("*", "42") == "forbidden"
+        assert subscription_error("risk.user.42", None) == "forbidden"
+        assert subscription_error("market alert", "42") == "invalid_topic"
+        assert subscription_error(None, "42") == "invalid_topic"
+    
+    @pytest.mark.asyncio
+    async def test_publish_reaches_only_subscribers_on_every_worker(self):
+        """Test a topic message skips unsubscribed sockets and crosses the backplane"""
+        hub = InMemoryHub()
+        first, second = ConnectionManager(worker_id="worker0"), ConnectionManager(worker_id="worker1")
+        for manager in (first, second):
+            await manager.start_backplane(InMemoryBackplane(hub))
+        dashboard, idle, remote = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await first.connect(dashboard, "dashboard_a", "a", topics=["market.*"])
+        await first.connect(idle, "main")
+        await second.connect(remote, "main")
+        assert second.subscribe(remote, "market.alert")
+        
+        assert await first.publish("market.alert", {"type": "market_alert", "alert": {"index": 1}}) == 1
+        await eventually(lambda: dashboard.sent and remote.sent)
+        await asyncio.sleep(0.02)
+        assert idle.sent == []
+        
+        first.disconnect(dashboard, "dashboard_a", "a")
+        assert len(first.topics) == 0
+        with pytest.raises(ValueError):
+            await first.publish("market.*", {"type": "market_alert"})
+        for manager in (first, second):
+            await manager.stop_backplane()
+
+
+class TestCoalescing:
+    """Test rate-capped delivery of high-frequency updates"""
+    
+    @pytest.mark.asyncio
+    async def test_bursts_collapse_to_latest_value_per_type(self):
+        """Test a burst sends the first update, then one batch with the latest value of each type"""
+        manager = ConnectionManager(coalesce_interval=0.05)
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "dashboard_a", user_id="a")
+        
+        for value in range(20):
+            await manager.send_to_user({"type": "portfolio_update", "value": value}, "a")
+            await manager.send_to_user({"type": "risk_score_update", "risk_score": value / 20}, "a")
+            await manager.send_to_user({"type": "market_alert", "index": value}, "a")
+        await eventually(lambda: any(m["type"] == "batch" for m in websocket.sent))
+        
+        updates = [m for m in websocket.sent if m["type"] in ("portfolio_update", "batch")]
+        assert updates[0] == {"type": "portfolio_update", "value": 0}
+        # First arrival order within the interval: the risk update came in before portfolio 1
+        assert updates[1]["messages"] == [{"type": "risk_score_update", "risk_score": 0.95},
+                                          {"type": "portfolio_update", "value": 19}]
+        assert len([m for m in websocket.sent if m["type"] == "market_alert"]) == 20
+        metrics = manager.get_metrics()
+        assert metrics["message_batches"] == 1 and metrics["messages_coalesced"] == 37
+    
+    @pytest.mark.asyncio
+    async def test_client_max_rate_slows_flushes(self):
+        """Test a declared max rate spaces flushes out, but never beyond the server rate"""
+        manager = ConnectionManager(coalesce_interval=0.01)
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "dashboard_a", user_id="a")
+        assert manager.set_max_rate(websocket, 1000) == pytest.approx(100)
+        assert manager.set_max_rate(websocket, 5) == pytest.approx(5)
+        
+        started = asyncio.get_running_loop().time()
+        for value in range(3):
+            await manager.send_to_user({"type": "portfolio_update", "value": value}, "a")
+            await asyncio.sleep(0.02)
+        await eventually(lambda: len(websocket.sent) == 2)
+        
+        assert [m["value"] for m in websocket.sent] == [0, 2]
+        assert asyncio.get_running_loop().time() - started >= 0.19
+
+
+class FakeRequest:
+    """Request whose client disconnects when ``disconnected`` is set"""
+    
+    def __init__(self):
+        self.disconnected = False
+    
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+class TestSSEHub:
+    """Test the shared-producer SSE hub"""
+    
+    def producer(self, calls: list, interval: float = 0.01):
+        async def produce():
+            calls.append(1)
+            value = 0
+            while True:
+                value += 1
+                yield {"value": value}
+                await asyncio.sleep(interval)
+        return produce
+    
+    async def collect(self, stream, frames: list, count: int):
+        async for frame in stream:
+            frames.append(frame)
+            if len(frames) == count:
+                break
+    
+    @staticmethod
+    def values(frames: list) -> list:
+        return [json.loads(frame.split(b"data: ", 1)[1]) for frame in frames]
+    
+    @pytest.mark.asyncio
+    async def test_one_producer_shared_by_clients(self):
+        """Test clients of a topic share one producer and the same frame objects"""
+        hub = SSEHub(idle_timeout=0.05, disconnect_poll=0.05)
+        calls = []
+        first, second = [], []
+        await asyncio.gather(
+            self.collect(hub.stream(FakeRequest(), "market", self.producer(calls)), first, 3),
+            self.collect(hub.stream(FakeRequest(), "market", self.producer(calls)), second, 3)
+        )
+        
+        assert calls == [1]
+        assert first[-1] is second[-1]
+        assert first[0].startswith(b"id: " + hub.epoch.encode() + b"-1\ndata: ")
+        assert first[0].endswith(b"\n\n")
+        assert [v["value"] for v in self.values(first)] == [1, 2, 3]
+        
+        await asyncio.sleep(0.1)
+        assert hub.topics == {}
+        assert hub.get_metrics()["topics"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_last_event_id_resumes_and_new_clients_get_latest(self):
+        """Test a reconnect replays missed frames; a new client starts from the latest frame"""
+        hub = SSEHub(idle_timeout=5, disconnect_poll=0.05)
+        calls, frames = [], []
+        await self.collect(hub.stream(FakeRequest(), "market", self.producer(calls)), frames, 2)
+        last_event_id = frames[-1].split(b"\n", 1)[0][4:].decode()
+        await asyncio.sleep(0.05)  # frames published while disconnected
+        
+        resumed, fresh = [], []
+        await self.collect(hub.stream(FakeRequest(), "market", self.producer(calls), last_event_id), resumed, 1)
+        await self.collect(hub.stream(FakeRequest(), "market", self.producer(calls), "stale-3"), fresh, 1)
+        assert self.values(resumed)[0]["value"] == 3
+        assert self.values(fresh)[0]["value"] > 3
+        assert calls == [1]
+        await hub.close()
+    
+    @pytest.mark.asyncio
+    async def test_failed_producer_restarts_for_next_subscriber(self):
+        """Test a raising producer ends its streams and the next subscriber starts a new one"""
+        hub = SSEHub(idle_timeout=5, disconnect_poll=0.05)
+        calls = []
+        
+        async def flaky():
+            calls.append(1)
+            yield {"value": len(calls)}
+            if len(calls) == 1:
+                raise RuntimeError("upstream unavailable")
+            await asyncio.Event().wait()
+        
+        first = [frame async for frame in hub.stream(FakeRequest(), "market", flaky)]
+        last_event_id = first[-1].split(b"\n", 1)[0][4:].decode()
+        resumed = []
+        await self.collect(hub.stream(FakeRequest(), "market", flaky, last_event_id), resumed, 1)
+        
+        assert self.values(first) == [{"value": 1}]
+        assert self.values(resumed) == [{"value": 2}]
+        assert calls == [1, 1]
+        assert hub.get_metrics()["producer_failures"] == 1
+        await hub.close()
+    
+    @pytest.mark.asyncio
+    async def test_bounded_queue_and_disconnect(self):
+        """Test a stalled client keeps only the newest frames and leaves on disconnect"""
+        hub = SSEHub(max_queue=3, idle_timeout=0.05, disconnect_poll=0.02)
+        request = FakeRequest()
+        stream = hub.stream(request, "market", self.producer([], interval=0.001))
+        await stream.__anext__()
+        await asyncio.sleep(0.05)
+        
+        assert hub.get_metrics()["frames_dropped"] > 0
+        backlog = [await stream.__anext__() for _ in range(3)]
+        values = [v["value"] for v in self.values(backlog)]
+        assert values == sorted(values) and values[0] > 4
+        
+        request.disconnected = True
+        remaining = [frame async for frame in stream]
+        assert len(remaining) <= 3
+        assert hub.get_metrics()["clients"] == 0
+        await hub.close()